@@ -5,20 +5,64 @@ from streamlit_option_menu import option_menu
 from etl.kpi import *  # Import KPI functions
 from etl.aggregation import *  # Import Aggregation functions
 from etl.datamarts import *  # Import Data Mart functions
+from etl.engine import USE_NUMPY_ENGINE
+from etl.filters import QueryFilters, get_filter_options
+from etl.async_api import as_results  # Runs a page's queries concurrently on a thread pool
+from etl.metrics import get_query_stats, get_slow_queries, histogram_summary, render_metrics, start_metrics_server
+
+if USE_NUMPY_ENGINE:
+    from etl.engine import *  # Same getters answered from in-memory NumPy arrays (query_engine=numpy)
 
 # --- Streamlit Page Configuration ---
 st.set_page_config(page_title="Healthcare Analytics Dashboard", layout="wide")
+start_metrics_server()  # /metrics for Prometheus when metrics_port is set
+
+# The diagnostics page is not in the menu unless the URL carries ?diagnostics=1
+pages = ["Overview", "Schema", "KPIs", "Aggregations", "Visualizations", "Data Marts"]
+icons = ["house", "diagram-3", "bar-chart", "calculator", "pie-chart", "database"]
+if st.query_params.get("diagnostics") == "1":
+    pages.append("Diagnostics")
+    icons.append("speedometer")
 
 # --- Sidebar Navigation Menu ---
 with st.sidebar:
     selected = option_menu(
         menu_title="Navigation",
-        options=["Overview", "Schema", "KPIs", "Aggregations", "Visualizations", "Data Marts"],
-        icons=["house", "diagram-3", "bar-chart", "calculator", "pie-chart", "database"],
+        options=pages,
+        icons=icons,
         menu_icon="cast",
         default_index=0
     )
 
+# --- Sidebar Filters (applied to every query on the data pages) ---
+filters = QueryFilters()
+if selected in ["KPIs", "Aggregations", "Visualizations", "Data Marts"]:
+    options = get_filter_options()
+    with st.sidebar:
+        st.header("Filters")
+        first_date, last_date = options["date_range"].iloc[0]
+        start_date = end_date = None
+        if pd.notna(first_date) and pd.notna(last_date):
+            first_date, last_date = pd.Timestamp(first_date).date(), pd.Timestamp(last_date).date()
+            dates = st.date_input("Visit dates", value=(first_date, last_date),
+                                  min_value=first_date, max_value=last_date)
+            if len(dates) == 2:  # Only the start is set while a range is being picked
+                # The full range is no filter, so the unfiltered marts and sketches still apply
+                start_date = dates[0] if dates[0] > first_date else None
+                end_date = dates[1] if dates[1] < last_date else None
+
+        hospitals = options["hospitals"]
+        hospital_names = dict(zip(hospitals["hospital_id"], hospitals["hospital_name"]))
+        hospital_ids = st.multiselect("Hospitals", list(hospital_names), format_func=hospital_names.get)
+        doctors = options["doctors"]
+        doctor_names = dict(zip(doctors["doctor_id"], doctors["doctor_name"]))
+        doctor_ids = st.multiselect("Doctors", list(doctor_names), format_func=doctor_names.get)
+        categories = st.multiselect("Disease categories", options["disease_categories"]["category"].tolist())
+        insurance_types = st.multiselect("Insurance types", options["insurance_types"]["insurance_type"].tolist())
+
+    filters = QueryFilters(start_date, end_date, tuple(hospital_ids), tuple(doctor_ids),
+                           tuple(categories), tuple(insurance_types))
+
 # --- Overview Section ---
 if selected == "Overview":
     st.title("Project Overview")
@@ -37,38 +81,78 @@ elif selected == "Schema":
 elif selected == "KPIs":
     st.title("Key Performance Indicators")
 
-    col1, col2, col3 = st.columns(3)
-    col1.metric("Total Revenue ($)", f"${get_total_revenue():,.2f}")
-    col2.metric("Total Visits", f"{get_total_visits():,}")
-    col3.metric("Avg Revenue per Visit ($)", f"${get_avg_revenue_per_visit():,.2f}")
+    # Lay the page out first, then fill every placeholder as its query returns
+    header = st.empty()
+
+    st.subheader("Claims and Insurance")
+    col1, col2 = st.columns(2)
+    claims_chart, insurance_chart = col1.empty(), col2.empty()
 
     st.subheader("Revenue Breakdown")
     revenue_options = ["By Disease", "By Doctor", "By Hospital", "By Patient"]
     selected_revenue = st.selectbox("Select Revenue Type", revenue_options)
+    revenue_chart = st.empty()
 
     revenue_data_funcs = {
-        "By Disease": get_revenue_by_disease,
-        "By Doctor": get_revenue_by_doctor,
-        "By Hospital": get_revenue_by_hospital,
-        "By Patient": get_revenue_per_patient,
+        "By Disease": lambda: get_revenue_by_disease(filters=filters),
+        "By Doctor": lambda: get_revenue_by_doctor(filters=filters),
+        "By Hospital": lambda: get_revenue_by_hospital(filters=filters),
+        "By Patient": lambda: get_revenue_per_patient(filters=filters),
     }
 
-    df = revenue_data_funcs[selected_revenue]()
-    fig = px.bar(df, x=df.columns[0], y=df.columns[1], title=f"Revenue {selected_revenue}")
-    st.plotly_chart(fig)
-
     st.subheader("Visits Analysis")
     visits_options = ["By Gender", "By Age Group"]
     selected_visits = st.selectbox("Select Visit Analysis", visits_options)
+    visits_chart = st.empty()
 
     visits_data_funcs = {
-        "By Gender": get_visits_by_gender,
-        "By Age Group": get_visits_by_age_group,
+        "By Gender": lambda: get_visits_by_gender(filters=filters),
+        "By Age Group": lambda: get_visits_by_age_group(filters=filters),
     }
 
-    df = visits_data_funcs[selected_visits]()
-    fig = px.pie(df, names=df.columns[0], values=df.columns[1], title=f"Visits {selected_visits}")
-    st.plotly_chart(fig)
+    st.subheader("Top Rankings")
+    col1, col2, col3, col4 = st.columns(4)
+    top_dimension = col1.selectbox("Rank", list(TOP_K_DIMENSIONS), format_func=str.title)
+    top_metric = col2.selectbox("By", list(TOP_K_METRICS), format_func=lambda metric: metric.replace("_", " ").title())
+    top_descending = col3.radio("Order", ["Top", "Bottom"], horizontal=True) == "Top"
+    top_k = col4.number_input("Rows", min_value=1, max_value=100, value=TOP_K)
+    top_chart = st.empty()
+
+    # All four queries run concurrently; the page waits only for the slowest one
+    queries = {
+        "snapshot": lambda: get_kpi_snapshot(filters=filters),  # One fact-table scan for every header metric
+        "revenue": revenue_data_funcs[selected_revenue],
+        "visits": visits_data_funcs[selected_visits],
+        "top_k": lambda: get_top_k(top_dimension, top_metric, int(top_k), top_descending, filters=filters),
+    }
+    for key, result in as_results(queries):
+        if key == "snapshot":
+            with header.container():
+                col1, col2, col3 = st.columns(3)
+                col1.metric("Total Revenue ($)", f"${result.total_revenue:,.2f}")
+                col2.metric("Total Visits", f"{result.total_visits:,}")
+                col3.metric("Avg Revenue per Visit ($)", f"${result.avg_revenue_per_visit:,.2f}")
+
+            df = result.claim_status_breakdown
+            claims_chart.plotly_chart(px.pie(df, names="claim_status", values="total_claims", title="Claims by Status"))
+            df = result.revenue_by_insurance_type
+            insurance_chart.plotly_chart(px.bar(df, x="insurance_type", y="total_revenue", title="Revenue by Insurance Type"))
+
+        elif key == "revenue":
+            fig = px.bar(result, x=result.columns[0], y=result.columns[1], title=f"Revenue {selected_revenue}")
+            revenue_chart.plotly_chart(fig)
+
+        elif key == "visits":
+            fig = px.pie(result, names=result.columns[0], values=result.columns[1], title=f"Visits {selected_visits}")
+            visits_chart.plotly_chart(fig)
+
+        elif key == "top_k":
+            # One bar per member, so namesakes stay apart; the hover shows the name
+            key_column, label = result.columns[:2]
+            title = f"{'Top' if top_descending else 'Bottom'} {int(top_k)} {top_dimension.title()}s by {top_metric}"
+            fig = px.bar(result, x=result[key_column].astype(str), y=top_metric, hover_name=label, title=title)
+            fig.update_xaxes(title=key_column, type="category")
+            top_chart.plotly_chart(fig)
 
 # --- Aggregations Section ---
 elif selected == "Aggregations":
@@ -88,7 +172,7 @@ elif selected == "Aggregations":
         "Disease Category Counts": get_disease_category_counts,
     }
 
-    df = agg_data_funcs[selected_agg]()
+    df = agg_data_funcs[selected_agg](filters=filters)
 
     if df.empty:
         st.warning("No data available for this selection.")
@@ -108,7 +192,7 @@ elif selected == "Visualizations":
         "Disease Category Distribution": get_disease_category_counts,
     }
 
-    df = viz_data_funcs[selected_viz]()
+    df = viz_data_funcs[selected_viz](filters=filters)
 
     if df.empty:
         st.warning("No data available for this visualization.")
@@ -127,85 +211,132 @@ if selected == "Data Marts":
     dm_options = ["Patient Data Mart", "Financial Data Mart", "Doctor Data Mart", "Disease Data Mart"]
     selected_dm = st.selectbox("Select Data Mart", dm_options)
 
-    dm_data_funcs = {
-        "Patient Data Mart": get_patient_data_mart,
-        "Financial Data Mart": get_financial_data_mart,
-        "Doctor Data Mart": get_doctor_data_mart,
-        "Disease Data Mart": get_disease_data_mart,
+    dm_tables = {
+        "Patient Data Mart": "patient_data_mart",
+        "Financial Data Mart": "financial_data_mart",
+        "Doctor Data Mart": "doctor_performance_data_mart",
+        "Disease Data Mart": "disease_analytics_data_mart",
+    }
+    mart = dm_tables[selected_dm]
+
+    # Only the rows on screen are fetched: one keyset page, moved with the buttons below.
+    # `pages` holds the cursor of every page visited, `next` the cursor after the current one.
+    # Cursors belong to one slice, so each (mart, filters) pair pages on its own.
+    pager = st.session_state.setdefault("mart_pages", {}).setdefault((mart, filters), {"pages": [None], "next": None})
+    st.subheader(f"Sample Data from {selected_dm}")
+    sample_slot = st.empty()
+    col1, col2, col3 = st.columns(3)
+    if col1.button("First rows"):
+        pager["pages"] = [None]
+    if col2.button("Previous rows") and len(pager["pages"]) > 1:
+        pager["pages"].pop()
+    if col3.button("Next rows") and pager["next"] is not None:
+        pager["pages"].append(pager["next"])
+    page_after = pager["pages"][-1]
+
+    queries = {
+        "sample": lambda: get_mart_page(mart, after=page_after, limit=3, filters=filters),
+        "rows": lambda: get_mart_row_count(mart, filters=filters),
     }
 
-    df = dm_data_funcs[selected_dm]()
-
-    if df.empty:
-        st.warning("No data available in this Data Mart.")
+    # --- Patient Data Mart (lifestyle distributions aggregated in the database) ---
+    if selected_dm == "Patient Data Mart":
+        st.subheader("Patient Lifestyle Analysis")
+        charts = {
+            "smoker_status": ("Smoking Status", "Count", "Smoking Status Distribution"),
+            "alcohol_consumption": ("Alcohol Consumption", "Count", "Alcohol Consumption Levels"),
+            "exercise_frequency": ("Exercise Frequency", "Count", "Exercise Habits Distribution"),
+        }
+
+    # --- Financial Data Mart (Pie Charts) ---
+    elif selected_dm == "Financial Data Mart":
+        st.subheader("Financial Insights")
+        charts = {
+            "claim_status": ("Claim Status", "Count", "Total Claims by Claim Status"),
+            "avg_bill_by_payment_method": ("Payment Method", "Average Bill", "Average Bill Amount by Payment Method"),
+        }
+
+    # --- Doctor and Disease Data Marts (one row per doctor / disease, so read whole) ---
+    else:
+        st.subheader("Doctor Performance Metrics" if selected_dm == "Doctor Data Mart" else "Disease Analytics")
+        charts = {}
+        get_mart = get_doctor_data_mart if selected_dm == "Doctor Data Mart" else get_disease_data_mart
+        queries["mart"] = lambda: get_mart(filters=filters)
+
+    chart_slots = {aggregate: st.empty() for aggregate in charts}
+    mart_slots = [st.empty(), st.empty()]
+    for aggregate in charts:
+        queries[aggregate] = lambda aggregate=aggregate: get_mart_aggregate(aggregate, filters=filters)
+
+    for key, result in as_results(queries):
+        if key == "sample":
+            df, pager["next"] = result
+            if df.empty:
+                sample_slot.warning("No data available in this Data Mart.")
+            else:
+                sample_slot.write(df)
+
+        elif key == "rows":
+            col1.caption(f"{result:,} rows in {selected_dm}")
+
+        elif key in charts:
+            label, value, title = charts[key]
+            df = result.set_axis([label, value], axis=1)
+            chart_slots[key].plotly_chart(px.pie(df, names=label, values=value, title=title))
+
+        elif key == "mart" and not result.empty:
+            df = result
+            if selected_dm == "Doctor Data Mart":
+                fig = px.bar(df, x="doctor_name", y="total_patients_seen", color="specialization",
+                             title="Total Patients Seen by Each Doctor")
+                mart_slots[0].plotly_chart(fig)
+
+                fig = px.scatter(df,
+                     x="years_of_experience",
+                     y="avg_bill_per_patient",
+                     title="Doctor Experience vs. Average Bill",
+                     labels={"years_of_experience": "Years of Experience",
+                             "avg_bill_per_patient": "Avg Bill per Patient"})
+                mart_slots[1].plotly_chart(fig)
+            else:
+                fig = px.pie(df, names="category", title="Distribution of Diseases by Category")
+                mart_slots[0].plotly_chart(fig)
+
+                fig = px.bar(df, x="disease_name", y="total_cases", title="Number of Cases per Disease")
+                mart_slots[1].plotly_chart(fig)
+
+# --- Diagnostics Section ---
+if selected == "Diagnostics":
+    st.title("Query Diagnostics")
+    st.caption("Counters of this dashboard process since it started.")
+
+    stats = get_query_stats()
+    if stats.empty:
+        st.info("No queries recorded yet.")
     else:
-        st.subheader(f"Sample Data from {selected_dm}")
-        st.write(df.head(3))  # Show only first 3 rows
-
-        # --- Patient Data Mart (Fixed Graphs) ---
-        if selected_dm == "Patient Data Mart":
-            st.subheader("Patient Lifestyle Analysis")
-
-        # Ensure the columns exist before plotting
-        if "smoker_status" in df.columns:
-            smoker_counts = df["smoker_status"].fillna("Unknown").value_counts().reset_index()
-            smoker_counts.columns = ["Smoking Status", "Count"]
-            fig = px.pie(smoker_counts, names="Smoking Status", values="Count", title="Smoking Status Distribution")
-            st.plotly_chart(fig)
-
-        if "alcohol_consumption" in df.columns:
-            alcohol_counts = df["alcohol_consumption"].fillna("Unknown").value_counts().reset_index()
-            alcohol_counts.columns = ["Alcohol Consumption", "Count"]
-            fig = px.pie(alcohol_counts, names="Alcohol Consumption", values="Count", title="Alcohol Consumption Levels")
-            st.plotly_chart(fig)
-
-        if "exercise_frequency" in df.columns:
-            exercise_counts = df["exercise_frequency"].fillna("Unknown").value_counts().reset_index()
-            exercise_counts.columns = ["Exercise Frequency", "Count"]
-            fig = px.pie(exercise_counts, names="Exercise Frequency", values="Count", title="Exercise Habits Distribution")
-            st.plotly_chart(fig)
-
-
-        # --- Financial Data Mart (Pie Charts) ---
-        elif selected_dm == "Financial Data Mart":
-            st.subheader("Financial Insights")
-
-            # Total Claims by Claim Status (Changed to Pie Chart)
-            if "claim_status" in df.columns:
-                claim_counts = df["claim_status"].value_counts().reset_index()
-                claim_counts.columns = ["Claim Status", "Count"]
-                fig = px.pie(claim_counts, names="Claim Status", values="Count", title="Total Claims by Claim Status")
-                st.plotly_chart(fig)
-
-            # Average Bill Amount by Payment Method (Changed to Pie Chart)
-            if "payment_method" in df.columns and "total_bill" in df.columns:
-                avg_bill_per_method = df.groupby("payment_method")["total_bill"].mean().reset_index()
-                avg_bill_per_method.columns = ["Payment Method", "Average Bill"]
-                fig = px.pie(avg_bill_per_method, names="Payment Method", values="Average Bill", title="Average Bill Amount by Payment Method")
-                st.plotly_chart(fig)
-
-        # --- Doctor Data Mart ---
-        elif selected_dm == "Doctor Data Mart":
-            st.subheader("Doctor Performance Metrics")
-
-            fig = px.bar(df, x="doctor_name", y="total_patients_seen", color="specialization",
-                         title="Total Patients Seen by Each Doctor")
-            st.plotly_chart(fig)
-
-            fig = px.scatter(df, 
-                 x="years_of_experience", 
-                 y="avg_bill_per_patient", 
-                 title="Doctor Experience vs. Average Bill",
-                 labels={"years_of_experience": "Years of Experience", 
-                         "avg_bill_per_patient": "Avg Bill per Patient"})
-
-            st.plotly_chart(fig)
-        # --- Disease Data Mart ---
-        elif selected_dm == "Disease Data Mart":
-            st.subheader("Disease Analytics")
-
-            fig = px.pie(df, names="category", title="Distribution of Diseases by Category")
-            st.plotly_chart(fig)
-
-            fig = px.bar(df, x="disease_name", y="total_cases", title="Number of Cases per Disease")
-            st.plotly_chart(fig)
+        st.subheader("Hottest Queries")
+        fig = px.bar(stats.head(15), x="total_seconds", y="query", color="backend", orientation="h",
+                     title="Total Time per Query")
+        fig.update_layout(yaxis={"categoryorder": "total ascending"})
+        st.plotly_chart(fig)
+        st.dataframe(stats)
+
+    acquire = histogram_summary("etl_connection_acquire_seconds")
+    if not acquire.empty:
+        st.subheader("Connection Acquire Latency")
+        st.dataframe(acquire)
+
+    st.subheader("Slow Queries")
+    slow = get_slow_queries()
+    if not slow:
+        st.write("No query exceeded the slow-query threshold.")
+    for sample in slow:
+        with st.expander(f"{sample['query']}: {sample['seconds']:.3f}s, {sample['rows']:,} rows ({sample['logged_at']:%H:%M:%S})"):
+            st.code(sample["sql"], language="sql")
+            if sample["params"]:
+                st.write("Parameters:", sample["params"])
+            if sample["plan"] is not None:
+                st.dataframe(pd.DataFrame(sample["plan"]))
+
+    with st.expander("Prometheus metrics"):
+        st.code(render_metrics(), language="text")
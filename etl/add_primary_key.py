@@ -2,6 +2,9 @@ import pymysql
 from dotenv import load_dotenv
 import os
 
+from etl.metrics import timed_stage
+from etl.surrogate_keys import DIM_KEYS, natural_key_column
+
 load_dotenv()
 
 Host=os.getenv('host')
@@ -17,16 +20,41 @@ DB_CONFIG = {
 }
 
 # Tables and their respective ID columns
-TABLES = {
-    "patient_dim": "patient_id",
-    "disease_dim": "disease_id",
-    "doctor_dim": "doctor_id",
-    "hospital_dim": "hospital_id",
-    "billing_dim": "billing_id"
-}
+TABLES = DIM_KEYS
+
+def _column_is_int_key(cursor, table, column):
+    cursor.execute(
+        "SELECT data_type, is_nullable FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return cursor.fetchone() == ("int", "NO")
+
+
+def _column_type(cursor, table, column):
+    cursor.execute(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row[0].lower() if row else None
+
+
+def _indexes_on(cursor, table, column):
+    """Names of the indexes (PRIMARY for the primary key) that cover `column`."""
+    cursor.execute(
+        "SELECT index_name FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    return {row[0] for row in cursor.fetchall()}
+
 
 # Connect to MySQL and execute queries
+# Re-runs are no-ops: every step is skipped when its key is already in place
 def modify_and_set_primary_keys():
+    conn = cursor = None
     try:
         conn = pymysql.connect(**DB_CONFIG)
         cursor = conn.cursor()
@@ -34,32 +62,51 @@ def modify_and_set_primary_keys():
         for table, column in TABLES.items():
             print(f"Processing table: {table}...")
 
-            # Step 1: Modify column type
-            modify_query = f"ALTER TABLE {table} MODIFY {column} VARCHAR(255) NOT NULL;"
-            cursor.execute(modify_query)
-            print(f" Modified {column} in {table} to VARCHAR(255).")
+            # Step 1: Modify column type (integer surrogate key, see surrogate_keys.py)
+            if _column_is_int_key(cursor, table, column):
+                print(f" {column} in {table} is already INT NOT NULL.")
+            elif _column_type(cursor, table, column) != "int":
+                # UUIDs do not convert to INT; they need the key migration in create_dim.py
+                raise ValueError(
+                    f"{table}.{column} still holds UUID keys from before integer surrogates; "
+                    "run `python -m etl.create_dim --migrate-keys` to convert it"
+                )
+            else:
+                modify_query = f"ALTER TABLE {table} MODIFY {column} INT NOT NULL;"
+                cursor.execute(modify_query)
+                print(f" Modified {column} in {table} to INT.")
 
             # Step 2: Add Primary Key
-            try:
+            if "PRIMARY" in _indexes_on(cursor, table, column):
+                print(f" PRIMARY KEY on {column} in {table} already exists.")
+            else:
                 primary_key_query = f"ALTER TABLE {table} ADD PRIMARY KEY ({column});"
                 cursor.execute(primary_key_query)
                 print(f" Added PRIMARY KEY on {column} in {table}.")
-            except pymysql.err.OperationalError as e:
-                print(f"Error adding PRIMARY KEY to {table}: {e}")
+
+            # Step 3: Index the natural UUID kept alongside the surrogate
+            natural_column = natural_key_column(column)
+            if f"ux_{natural_column}" in _indexes_on(cursor, table, natural_column):
+                print(f" UNIQUE INDEX on {natural_column} in {table} already exists.")
+            else:
+                unique_query = f"ALTER TABLE {table} ADD UNIQUE INDEX ux_{natural_column} ({natural_column});"
+                cursor.execute(unique_query)
+                print(f" Added UNIQUE INDEX on {natural_column} in {table}.")
 
         conn.commit()
         print(" All tables processed successfully!")
     
-    except pymysql.MySQLError as e:
-        print(f" Database Error: {e}")
-    
     finally:
-        cursor.close()
-        conn.close()
+        if cursor is not None:
+            cursor.close()
+        if conn is not None:
+            conn.close()
 
 # Run the function
 if __name__ == "__main__":
-    modify_and_set_primary_keys()
+    # Failures are recorded once, by the stage (as in the pipeline)
+    with timed_stage("primary_keys"):
+        modify_and_set_primary_keys()
 
 
 
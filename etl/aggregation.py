@@ -1,34 +1,27 @@
-import pymysql
-import pandas as pd
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
-
-# --- Database Connection ---
-def connect_db():
-    """Establishes a connection to the MySQL database."""
-    return pymysql.connect(
-        host=Host,       
-        user=User,            
-        password=Password,     
-        database=Database,
-        cursorclass=pymysql.cursors.DictCursor  # Returns results as dictionaries
-    )
+from etl.cache import cached_query
+from etl.dimensions import get_dimension, group_by_attribute
+from etl.filters import run_filtered
+from etl.hll import approx_distinct, approx_distinct_by_group, has_sketches, use_approximate
 
 # --- SQL Aggregation Queries ---
+# `{fact}` is the fact table, or the slice of it a dashboard filter selects (see filters.py).
+# Breakdowns by a small dimension group the fact by key; the names come from dimensions.py.
 QUERIES = {
     "patient_statistics": """
         SELECT 
             COUNT(DISTINCT patient_id) AS total_patients,
             AVG(age) AS average_age,
             COUNT(visit_id) AS total_visits
-        FROM hospital_visits_fact 
+        FROM {fact} f
+        JOIN patient_dim USING (patient_id);
+    """,
+
+    # patient_statistics without its COUNT(DISTINCT), for the approximate mode
+    "patient_visit_totals": """
+        SELECT 
+            AVG(age) AS average_age,
+            COUNT(visit_id) AS total_visits
+        FROM {fact} f
         JOIN patient_dim USING (patient_id);
     """,
 
@@ -36,64 +29,64 @@ QUERIES = {
         SELECT 
             AVG(total_bill) AS average_bill_per_visit,
             SUM(total_bill) AS total_revenue
-        FROM hospital_visits_fact;
+        FROM {fact} f;
     """,
 
     "hospital_revenue": """
         SELECT 
-            h.hospital_name, 
+            f.hospital_id, 
             SUM(f.total_bill) AS revenue
-        FROM hospital_visits_fact f
-        JOIN hospital_dim h USING (hospital_id)
-        GROUP BY h.hospital_name;
+        FROM {fact} f
+        GROUP BY f.hospital_id;
     """,
 
     "patients_per_doctor": """
         SELECT 
             d.doctor_name, 
             COUNT(DISTINCT f.patient_id) AS patient_count
-        FROM hospital_visits_fact f
+        FROM {fact} f
         JOIN doctor_dim d USING (doctor_id)
         GROUP BY d.doctor_name;
     """,
 
     "disease_category_counts": """
         SELECT 
-            d.category, 
+            f.disease_id, 
             COUNT(f.disease_id) AS disease_count
-        FROM hospital_visits_fact f
-        JOIN disease_dim d USING (disease_id)
-        GROUP BY d.category;
+        FROM {fact} f
+        GROUP BY f.disease_id;
     """
 }
 
-# --- Function to Execute SQL Queries ---
-def run_query(query):
-    """Executes a given SQL query and returns the result as a Pandas DataFrame."""
-    conn = connect_db()
-    try:
-        with conn.cursor() as cursor:
-            cursor.execute(query)
-            result = cursor.fetchall()
-            df = pd.DataFrame(result)
-            if df.empty:
-                return pd.DataFrame(columns=[col[0] for col in cursor.description])  # Return empty DataFrame with correct column names
-            return df
-    finally:
-        conn.close()
-
 # --- Fetch Aggregated Data ---
-def get_patient_statistics():
-    return run_query(QUERIES["patient_statistics"])
+# Sketches cover the whole history, so filtered views are always counted exactly
+@cached_query
+def get_patient_statistics(approximate=None, filters=None):
+    if use_approximate(approximate) and not filters and has_sketches("total_patients"):
+        df = run_filtered(QUERIES["patient_visit_totals"], name="patient_visit_totals")
+        df.insert(0, "total_patients", approx_distinct("total_patients"))
+        return df
+    return run_filtered(QUERIES["patient_statistics"], filters, name="patient_statistics")
 
-def get_financial_metrics():
-    return run_query(QUERIES["financial_metrics"])
+@cached_query
+def get_financial_metrics(filters=None):
+    return run_filtered(QUERIES["financial_metrics"], filters, name="financial_metrics")
 
-def get_hospital_revenue():
-    return run_query(QUERIES["hospital_revenue"])
+@cached_query
+def get_hospital_revenue(filters=None):
+    df = run_filtered(QUERIES["hospital_revenue"], filters, name="hospital_revenue")
+    return group_by_attribute(df, "hospital_dim", "hospital_name")
 
-def get_patients_per_doctor():
-    return run_query(QUERIES["patients_per_doctor"])
+@cached_query
+def get_patients_per_doctor(approximate=None, filters=None):
+    if use_approximate(approximate) and not filters and has_sketches("patients_per_doctor"):
+        doctors = get_dimension("doctor_dim")
+        labels = dict(zip(doctors.keys.astype(str), doctors.attributes["doctor_name"]))
+        # Doctors sharing a name are merged as a sketch union, like GROUP BY doctor_name
+        return approx_distinct_by_group("patients_per_doctor", "doctor_name", "patient_count", labels)
+    return run_filtered(QUERIES["patients_per_doctor"], filters, name="patients_per_doctor")
 
-def get_disease_category_counts():
-    return run_query(QUERIES["disease_category_counts"])
+@cached_query
+def get_disease_category_counts(filters=None):
+    df = run_filtered(QUERIES["disease_category_counts"], filters, name="disease_category_counts")
+    return group_by_attribute(df, "disease_dim", "category")
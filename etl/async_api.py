@@ -0,0 +1,105 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from dotenv import load_dotenv
+
+from etl import aggregation, datamarts, kpi
+from etl.db import POOL_SIZE
+from etl.engine import USE_NUMPY_ENGINE
+
+load_dotenv()
+
+# Queries in flight at once; more threads than pooled connections would only queue
+# on the pool (pymysql is blocking, so each query holds a thread and a connection)
+ASYNC_WORKERS = int(os.getenv('async_workers', POOL_SIZE))
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="query")
+
+
+# --- Futures API ---
+def submit(getter, *args, **kwargs):
+    """Starts a getter on the query thread pool and returns its Future."""
+    return _executor.submit(getter, *args, **kwargs)
+
+
+def as_results(calls):
+    """Starts every {key: getter} call at once and yields (key, result) as each one finishes.
+
+    The caller's thread does the rendering, so Streamlit widgets can be filled in as
+    results arrive while the remaining queries are still running.
+    """
+    futures = {submit(getter): key for key, getter in calls.items()}
+    for future in as_completed(futures):
+        yield futures[future], future.result()
+
+
+# --- asyncio API ---
+async def run_async(getter, *args, **kwargs):
+    """Awaits a getter without blocking the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(getter, *args, **kwargs))
+
+
+async def gather(calls):
+    """Runs every {key: getter} call concurrently and returns {key: result}."""
+    results = await asyncio.gather(*(run_async(getter) for getter in calls.values()))
+    return dict(zip(calls, results))
+
+
+def _async_getter(name):
+    if USE_NUMPY_ENGINE:
+        from etl import engine
+
+        getter = getattr(engine, name)
+    else:
+        getter = next(getattr(module, name) for module in (kpi, aggregation, datamarts) if hasattr(module, name))
+
+    @functools.wraps(getter)
+    async def wrapper(*args, **kwargs):
+        return await run_async(getter, *args, **kwargs)
+    return wrapper
+
+
+# Coroutine versions of every dashboard getter, under the same names:
+# `from etl.async_api import get_total_revenue; await get_total_revenue()`
+# kpi.py
+get_total_revenue = _async_getter("get_total_revenue")
+get_revenue_by_disease = _async_getter("get_revenue_by_disease")
+get_revenue_by_doctor = _async_getter("get_revenue_by_doctor")
+get_revenue_by_hospital = _async_getter("get_revenue_by_hospital")
+get_total_visits = _async_getter("get_total_visits")
+get_avg_revenue_per_visit = _async_getter("get_avg_revenue_per_visit")
+get_revenue_per_patient = _async_getter("get_revenue_per_patient")
+get_visits_by_gender = _async_getter("get_visits_by_gender")
+get_visits_by_age_group = _async_getter("get_visits_by_age_group")
+get_claim_status_breakdown = _async_getter("get_claim_status_breakdown")
+get_revenue_by_insurance_type = _async_getter("get_revenue_by_insurance_type")
+get_hospital_visits_trend = _async_getter("get_hospital_visits_trend")
+get_kpi_snapshot = _async_getter("get_kpi_snapshot")
+get_top_k = _async_getter("get_top_k")
+
+# aggregation.py
+get_patient_statistics = _async_getter("get_patient_statistics")
+get_financial_metrics = _async_getter("get_financial_metrics")
+get_hospital_revenue = _async_getter("get_hospital_revenue")
+get_patients_per_doctor = _async_getter("get_patients_per_doctor")
+get_disease_category_counts = _async_getter("get_disease_category_counts")
+
+# datamarts.py
+get_patient_data_mart = _async_getter("get_patient_data_mart")
+get_financial_data_mart = _async_getter("get_financial_data_mart")
+get_doctor_data_mart = _async_getter("get_doctor_data_mart")
+get_disease_data_mart = _async_getter("get_disease_data_mart")
+
+__all__ = [
+    "submit", "as_results", "run_async", "gather",
+    "get_total_revenue", "get_revenue_by_disease", "get_revenue_by_doctor", "get_revenue_by_hospital",
+    "get_total_visits", "get_avg_revenue_per_visit", "get_revenue_per_patient", "get_visits_by_gender",
+    "get_visits_by_age_group", "get_claim_status_breakdown", "get_revenue_by_insurance_type",
+    "get_hospital_visits_trend", "get_kpi_snapshot", "get_top_k",
+    "get_patient_statistics", "get_financial_metrics", "get_hospital_revenue", "get_patients_per_doctor",
+    "get_disease_category_counts",
+    "get_patient_data_mart", "get_financial_data_mart", "get_doctor_data_mart", "get_disease_data_mart",
+]
@@ -0,0 +1,349 @@
+import argparse
+import datetime
+import inspect
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.staging import DATA_DIR
+
+load_dotenv()
+
+# --- Benchmark Settings ---
+BENCHMARK_DIR = os.path.join(DATA_DIR, "benchmarks")  # synthetic data sets and reports
+BENCHMARK_BACKENDS = ("duckdb", "numpy", "mysql")
+BENCHMARK_REPEATS = 3
+GENERATE_CHUNK_SIZE = 100_000
+
+# Shape of the shipped data set (10k visits), scaled up from there
+PATIENTS_PER_VISIT = 0.47
+BASE_VISITS, BASE_DOCTORS, BASE_HOSPITALS = 10_000, 50, 20
+
+# Skew: a few doctors, hospitals and diseases take most visits (Zipf exponents), and
+# patient popularity follows u ** PATIENT_SKEW, so some patients visit far more often
+DOCTOR_ZIPF, HOSPITAL_ZIPF, DISEASE_ZIPF = 1.1, 1.2, 0.8
+PATIENT_SKEW = 2.0
+MISSING_RATE = 0.05  # alcohol_consumption / exercise_frequency left empty for clean.py to fill
+
+DISEASES = [
+    ("Cancer", "Severe", "Severe"), ("Flu", "Infectious", "Mild"), ("Asthma", "Chronic", "Moderate"),
+    ("Diabetes", "Chronic", "Moderate"), ("Heart Disease", "Severe", "Severe"), ("Hypertension", "Chronic", "Mild"),
+]
+SPECIALIZATIONS = ["Cardiology", "Oncology", "Pediatrics", "Neurology", "General Medicine"]
+BLOOD_TYPES = ["A+", "A-", "B+", "B-", "AB+", "AB-", "O+", "O-"]
+VISIT_DATE_RANGE = ("2020-01-01", "2025-12-31")
+
+# Source columns, in the layout of complete_healthcare_data.csv
+SOURCE_COLUMNS = [
+    "visit_id", "patient_id_x", "disease_id", "billing_id", "visit_date", "hospital_id", "doctor_id",
+    "total_bill_x", "patient_id_y", "name", "age", "gender", "location", "blood_type", "weight", "height",
+    "smoker_status", "alcohol_consumption", "exercise_frequency", "disease_name", "category",
+    "severity_level", "doctor_name", "specialization", "years_of_experience", "hospital_name", "city",
+    "type", "total_bill_y", "insurance_type_y", "claim_status_y", "payment_method",
+]
+
+
+# --- Synthetic Data ---
+def _mix(ids, salt):
+    """splitmix64 of integer ids: stateless pseudo-random bits, so entity attributes never need storing."""
+    with np.errstate(over="ignore"):
+        z = np.asarray(ids, dtype=np.uint64) + np.uint64(salt) * np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+
+def _pick(ids, salt, choices):
+    choices = np.asarray(choices, dtype=object)
+    return choices[(_mix(ids, salt) % np.uint64(len(choices))).astype(np.int64)]
+
+
+def _uniform(ids, salt, low, high):
+    return low + (_mix(ids, salt) >> np.uint64(11)).astype(np.float64) / float(1 << 53) * (high - low)
+
+
+def _uuids(ids, salt):
+    """Deterministic UUID-shaped natural keys."""
+    high, low = _mix(ids, salt), _mix(ids, salt + 1)
+    return [
+        f"{h >> 32:08x}-{(h >> 16) & 0xFFFF:04x}-4{h & 0xFFF:03x}-{(l >> 48) & 0x3FFF | 0x8000:04x}-{l & 0xFFFFFFFFFFFF:012x}"
+        for h, l in zip(high.tolist(), low.tolist())
+    ]
+
+
+def _zipf_cdf(n, exponent):
+    weights = 1.0 / np.arange(1, n + 1) ** exponent
+    return np.cumsum(weights) / weights.sum()
+
+
+def _faker_pools(seed, size=5_000):
+    """Name and place pools drawn once from Faker; rows sample from them."""
+    from faker import Faker
+
+    fake = Faker()
+    Faker.seed(seed)
+    return {
+        "names": [fake.name() for _ in range(size)],
+        "cities": [fake.city() for _ in range(size // 5)],
+        "hospitals": [f"{fake.last_name()} {fake.company_suffix()} Hospital" for _ in range(size // 5)],
+    }
+
+
+def scale_shape(visits):
+    """Entity counts for a data set of `visits` visits."""
+    factor = visits / BASE_VISITS
+    return {
+        "visits": visits,
+        "patients": max(1, int(visits * PATIENTS_PER_VISIT)),
+        "doctors": max(1, int(BASE_DOCTORS * factor ** 0.5)),
+        "hospitals": max(1, int(BASE_HOSPITALS * factor ** 0.25)),
+        "diseases": len(DISEASES),
+    }
+
+
+def generate_source(visits, path, seed=42, chunk_size=GENERATE_CHUNK_SIZE):
+    """Writes a synthetic joined source CSV with `visits` rows, chunk by chunk.
+
+    Memory stays flat at any scale: every entity's attributes are derived from its
+    index with a hash, so only the current chunk is ever materialized.
+    """
+    shape = scale_shape(visits)
+    pools = _faker_pools(seed)
+    doctor_cdf = _zipf_cdf(shape["doctors"], DOCTOR_ZIPF)
+    hospital_cdf = _zipf_cdf(shape["hospitals"], HOSPITAL_ZIPF)
+    disease_cdf = _zipf_cdf(shape["diseases"], DISEASE_ZIPF)
+    first_day = np.datetime64(VISIT_DATE_RANGE[0])
+    n_days = int((np.datetime64(VISIT_DATE_RANGE[1]) - first_day).astype(int)) + 1
+
+    for chunk_no, start in enumerate(range(0, visits, chunk_size)):
+        rng = np.random.default_rng([seed, chunk_no])
+        visit = np.arange(start, min(start + chunk_size, visits), dtype=np.int64)
+        n = len(visit)
+        patient = (rng.random(n) ** PATIENT_SKEW * shape["patients"]).astype(np.int64)
+        doctor = np.searchsorted(doctor_cdf, rng.random(n))
+        hospital = np.searchsorted(hospital_cdf, rng.random(n))
+        disease = np.searchsorted(disease_cdf, rng.random(n))
+        bill = np.round(np.clip(rng.lognormal(9.0, 0.6, n), 500, 20_000), 2)
+
+        patient_ids = _uuids(patient, 100)
+        df = pd.DataFrame({
+            "visit_id": _uuids(visit, 200),
+            "patient_id_x": patient_ids,
+            "disease_id": _uuids(disease, 300),
+            "billing_id": _uuids(visit, 400),  # One billing record per visit
+            "visit_date": (first_day + rng.integers(0, n_days, n).astype("timedelta64[D]")).astype(str),
+            "hospital_id": _uuids(hospital, 500),
+            "doctor_id": _uuids(doctor, 600),
+            "total_bill_x": bill,
+            "patient_id_y": patient_ids,
+            "name": _pick(patient, 1, pools["names"]),
+            "age": (_mix(patient, 2) % np.uint64(100)).astype(np.int64) + 1,
+            "gender": _pick(patient, 3, ["Female", "Male"]),
+            "location": _pick(patient, 4, pools["cities"]),
+            "blood_type": _pick(patient, 5, BLOOD_TYPES),
+            "weight": np.round(_uniform(patient, 6, 40, 120), 2),
+            "height": np.round(_uniform(patient, 7, 140, 200), 2),
+            "smoker_status": _pick(patient, 8, ["Smoker", "Non-Smoker"]),
+            "alcohol_consumption": _pick(patient, 9, ["Low", "Low", "Moderate", "High"]),
+            "exercise_frequency": _pick(patient, 10, ["1-2 times/week", "1-2 times/week", "3-5 times/week", "Daily"]),
+            "disease_name": np.array([d[0] for d in DISEASES], dtype=object)[disease],
+            "category": np.array([d[1] for d in DISEASES], dtype=object)[disease],
+            "severity_level": np.array([d[2] for d in DISEASES], dtype=object)[disease],
+            "doctor_name": _pick(doctor, 11, pools["names"]),
+            "specialization": _pick(doctor, 12, SPECIALIZATIONS),
+            "years_of_experience": (_mix(doctor, 13) % np.uint64(40)).astype(np.int64) + 1,
+            "hospital_name": _pick(hospital, 14, pools["hospitals"]),
+            "city": _pick(hospital, 15, pools["cities"]),
+            "type": _pick(hospital, 16, ["Government", "Private"]),
+            "total_bill_y": bill,
+            "insurance_type_y": _pick(visit, 17, ["Uninsured", "Medicare", "Private"]),
+            "claim_status_y": _pick(visit, 18, ["Pending", "Approved", "Denied"]),
+            "payment_method": _pick(visit, 19, ["Card", "Insurance", "Cash"]),
+        }, columns=SOURCE_COLUMNS)
+        for col, salt in [("alcohol_consumption", 20), ("exercise_frequency", 21)]:
+            df.loc[_uniform(patient, salt, 0, 1) < MISSING_RATE, col] = None
+
+        df.to_csv(path, mode="w" if chunk_no == 0 else "a", header=chunk_no == 0, index=False)
+    return shape
+
+
+# --- Timing ---
+def _best_of(func, repeats=BENCHMARK_REPEATS):
+    times, result = [], None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - started)
+    return min(times), float(np.mean(times)), result
+
+
+def registered_getters(backend):
+    """{name: getter} for every dashboard getter that takes no required arguments, uncached."""
+    from etl import aggregation, datamarts, kpi
+
+    getters = {}
+    for module in (kpi, aggregation, datamarts):
+        for name, func in vars(module).items():
+            if not (name.startswith("get_") and hasattr(func, "uncached")):
+                continue
+            params = inspect.signature(func.uncached).parameters.values()
+            if any(p.default is inspect.Parameter.empty for p in params):
+                continue
+            getters[name] = func.uncached  # Time the query, not the result cache
+
+    if backend == "numpy":
+        from etl import engine
+
+        getters = {name: getattr(engine, name) for name in getters if hasattr(engine, name)}
+    return getters
+
+
+def _rows(result):
+    return len(result) if isinstance(result, pd.DataFrame) else 1
+
+
+def run_etl_stages(source, backend):
+    """Times each ETL stage on the synthetic source; returns {stage: seconds}."""
+    from etl.clean import run_clean
+
+    stages = {}
+    started = time.perf_counter()
+    run_clean(source, incremental=False)
+    stages["clean"] = time.perf_counter() - started
+
+    if backend == "mysql":
+        from etl.create_dim import DIM_TABLES, load_dimension
+        from etl.create_fact import load_fact
+        from etl.datamarts import rebuild_data_marts
+
+        for table in DIM_TABLES:
+            started = time.perf_counter()
+            load_dimension(table)
+            stages[f"load_{table}"] = time.perf_counter() - started
+        for stage, func in [("load_fact", load_fact), ("rebuild_data_marts", rebuild_data_marts)]:
+            started = time.perf_counter()
+            func()
+            stages[stage] = time.perf_counter() - started
+    elif backend == "duckdb":
+        from etl.embedded import get_embedded_connection
+
+        started = time.perf_counter()
+        get_embedded_connection()
+        stages["load_embedded"] = time.perf_counter() - started
+    else:
+        from etl.engine import get_star_schema
+
+        started = time.perf_counter()
+        get_star_schema()
+        stages["load_star_schema"] = time.perf_counter() - started
+    return stages
+
+
+def run_scale(visits, backend, repeats=BENCHMARK_REPEATS, seed=42):
+    """Generates, loads and queries one data set; must run with data_dir pointing at a scratch directory."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    source = os.path.join(DATA_DIR, "synthetic_source.csv")
+
+    started = time.perf_counter()
+    shape = generate_source(visits, source, seed)
+    stages = {"generate": time.perf_counter() - started}
+    stages.update(run_etl_stages(source, backend))
+
+    getters = {}
+    for name, getter in registered_getters(backend).items():
+        best, mean, result = _best_of(getter, repeats)
+        getters[name] = {"best_ms": best * 1000, "mean_ms": mean * 1000, "rows": _rows(result)}
+        print(f"  {name}: {best * 1000:,.1f} ms")
+    return {"visits": visits, "shape": shape, "backend": backend, "stages": stages, "getters": getters}
+
+
+# --- Harness ---
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(scales, backend, repeats=BENCHMARK_REPEATS, output_dir=BENCHMARK_DIR):
+    """Runs every scale in its own process (fresh caches, its own data_dir) and writes a JSON report.
+
+    The mysql backend loads the synthetic data into the `benchmark_database` schema,
+    never into the configured warehouse database.
+    """
+    if backend not in BENCHMARK_BACKENDS:
+        raise ValueError(f"Unknown benchmark backend {backend!r}; expected one of {BENCHMARK_BACKENDS}")
+    env = dict(os.environ)
+    env.update(db_backend="duckdb" if backend == "numpy" else backend,
+               query_engine="numpy" if backend == "numpy" else "sql")
+    if backend == "mysql":
+        if not os.getenv('benchmark_database'):
+            raise ValueError("Set benchmark_database to a scratch MySQL schema to benchmark the mysql backend")
+        env["database"] = os.environ["benchmark_database"]
+
+    started_at = datetime.datetime.now(datetime.timezone.utc)
+    results = []
+    for visits in scales:
+        data_dir = os.path.abspath(os.path.join(output_dir, f"{backend}_{visits}"))
+        result_path = os.path.join(data_dir, "result.json")
+        os.makedirs(data_dir, exist_ok=True)
+        print(f"Benchmarking {visits:,} visits on {backend} ...")
+        subprocess.run(
+            [sys.executable, "-m", "etl.benchmark", "--worker", "--visits", str(visits),
+             "--backend", backend, "--repeats", str(repeats), "--result", result_path],
+            env={**env, "data_dir": data_dir}, check=True,
+        )
+        with open(result_path) as f:
+            results.append(json.load(f))
+
+    report = {
+        "started_at": started_at.isoformat(),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "machine": {"platform": platform.platform(), "cpus": os.cpu_count()},
+        "backend": backend,
+        "repeats": repeats,
+        "results": results,
+    }
+    report_path = os.path.join(output_dir, f"benchmark_{backend}_{started_at:%Y%m%dT%H%M%SZ}.json")
+    with open(report_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Report written to {report_path}")
+    return report
+
+
+def summarize(report):
+    """Stage seconds and getter milliseconds per scale as one table."""
+    columns = {}
+    for result in report["results"]:
+        column = {f"stage {name} (s)": seconds for name, seconds in result["stages"].items()}
+        column.update({f"{name} (ms)": stats["best_ms"] for name, stats in result["getters"].items()})
+        columns[f"{result['visits']:,}"] = column
+    return pd.DataFrame(columns)
+
+
+# Run from the project root, e.g. python -m etl.benchmark --visits 10000 100000 1000000 --backend duckdb
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the ETL and dashboard queries on synthetic data.")
+    parser.add_argument("--visits", type=int, nargs="+", default=[10_000, 100_000], help="data set sizes")
+    parser.add_argument("--backend", choices=BENCHMARK_BACKENDS, default="duckdb")
+    parser.add_argument("--repeats", type=int, default=BENCHMARK_REPEATS, help="timed runs per getter")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_scale(args.visits[0], args.backend, args.repeats)
+        with open(args.result, "w") as f:
+            json.dump(result, f, indent=2)
+    else:
+        report = run_benchmarks(args.visits, args.backend, args.repeats)
+        with pd.option_context("display.width", 200, "display.max_rows", 200):
+            print(summarize(report))
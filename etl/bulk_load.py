@@ -0,0 +1,143 @@
+import os
+import tempfile
+import time
+
+import pymysql
+from dotenv import load_dotenv
+
+from etl.db import DB_CONFIG, get_connection
+from etl.metrics import increment, observe
+
+load_dotenv()
+
+# --- Bulk Load Settings ---
+BULK_BATCH_SIZE = int(os.getenv('bulk_batch_size', 10_000))  # rows per transaction
+BULK_LOAD_METHOD = os.getenv('bulk_load_method', 'insert')   # insert | infile
+BULK_LOAD_METHODS = ("insert", "infile")
+
+
+def _rows(df):
+    """Converts a DataFrame to tuples of plain Python values with NULLs for missing data."""
+    return list(df.astype(object).where(df.notna(), None).itertuples(index=False, name=None))
+
+
+def _insert_statement(table, columns):
+    return f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})"
+
+
+# --- Upserts ---
+# Upserts stage each batch in a temporary table and merge it with INSERT ... SELECT ...
+# ON DUPLICATE KEY UPDATE. Existing rows are updated in place, never deleted (as LOAD
+# DATA ... REPLACE would, breaking rows that reference them), and the new values are
+# read through the derived-table alias instead of the deprecated VALUES(col). Staging
+# also keeps executemany() on the plain INSERT that pymysql sends as multi-row statements.
+def _staging_table(table):
+    return f"{table}_upsert"
+
+
+def _create_staging_table(cursor, table, columns):
+    """An empty temporary table with the target's column types (no keys or partitions)."""
+    staged = _staging_table(table)
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {staged}")
+    cursor.execute(f"CREATE TEMPORARY TABLE {staged} SELECT {', '.join(columns)} FROM {table} LIMIT 0")
+    return staged
+
+
+def _drop_staging_table(cursor, table):
+    cursor.execute(f"DROP TEMPORARY TABLE IF EXISTS {_staging_table(table)}")
+
+
+def _merge_staged(cursor, table, columns):
+    """Upserts the staged batch into `table`, then empties the staging table."""
+    staged = _staging_table(table)
+    column_list = ", ".join(columns)
+    updates = ", ".join(f"{col} = new.{col}" for col in columns)
+    cursor.execute(
+        f"INSERT INTO {table} ({column_list}) SELECT * FROM (SELECT {column_list} FROM {staged}) AS new "
+        f"ON DUPLICATE KEY UPDATE {updates}"
+    )
+    cursor.execute(f"DELETE FROM {staged}")
+
+
+def _load_batches_insert(conn, df, table, batch_size, upsert):
+    # pymysql rewrites executemany() on INSERT ... VALUES into multi-row statements
+    columns = list(df.columns)
+    with conn.cursor() as cursor:
+        target = _create_staging_table(cursor, table, columns) if upsert else table
+    query = _insert_statement(target, columns)
+    try:
+        for start in range(0, len(df), batch_size):
+            conn.begin()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.executemany(query, _rows(df.iloc[start:start + batch_size]))
+                    if upsert:
+                        _merge_staged(cursor, table, columns)
+                conn.commit()
+            except pymysql.MySQLError:
+                conn.rollback()
+                raise
+    finally:
+        if upsert:
+            with conn.cursor() as cursor:
+                _drop_staging_table(cursor, table)
+
+
+def _load_batches_infile(df, table, batch_size, upsert):
+    columns = list(df.columns)
+    conn = pymysql.connect(**DB_CONFIG, local_infile=True)
+    try:
+        with conn.cursor() as cursor:
+            target = _create_staging_table(cursor, table, columns) if upsert else table
+        for start in range(0, len(df), batch_size):
+            fd, path = tempfile.mkstemp(suffix=".csv")
+            os.close(fd)
+            try:
+                df.iloc[start:start + batch_size].to_csv(path, index=False, header=False, na_rep="\\N")
+                conn.begin()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(
+                            f"LOAD DATA LOCAL INFILE %s INTO TABLE {target} "
+                            "FIELDS TERMINATED BY ',' OPTIONALLY ENCLOSED BY '\"' "
+                            f"LINES TERMINATED BY '\\n' ({', '.join(columns)})",
+                            (path,)
+                        )
+                        if upsert:
+                            _merge_staged(cursor, table, columns)
+                    conn.commit()
+                except pymysql.MySQLError:
+                    conn.rollback()
+                    raise
+            finally:
+                os.remove(path)
+    finally:
+        conn.close()  # Drops the staging table with the session
+
+
+def bulk_load(df, table, batch_size=BULK_BATCH_SIZE, method=BULK_LOAD_METHOD, upsert=False):
+    """Loads a DataFrame into an existing table in batches, one transaction per batch.
+
+    `method="insert"` sends multi-row INSERT statements; `method="infile"` streams each
+    batch through a temporary CSV with LOAD DATA LOCAL INFILE (requires local_infile on
+    the server). With `upsert=True` rows whose key already exists are updated in place.
+    Returns the number of rows loaded.
+    """
+    if method not in BULK_LOAD_METHODS:
+        raise ValueError(f"Unknown bulk load method {method!r}; expected one of {BULK_LOAD_METHODS}")
+    if df.empty:
+        print(f"No rows to load into {table}")
+        return 0
+
+    started = time.perf_counter()
+    if method == "insert":
+        with get_connection() as conn:
+            _load_batches_insert(conn, df, table, batch_size, upsert)
+    else:
+        _load_batches_infile(df, table, batch_size, upsert)
+
+    elapsed = time.perf_counter() - started
+    observe("etl_stage_duration_seconds", elapsed, stage=f"bulk_load.{table}")
+    increment("etl_rows_loaded_total", len(df), table=table)
+    print(f"Loaded {len(df):,} rows into {table} in {elapsed:.2f}s ({len(df) / elapsed:,.0f} rows/s)")
+    return len(df)
@@ -0,0 +1,167 @@
+import dataclasses
+import functools
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+import pymysql
+from dotenv import load_dotenv
+import os
+
+from etl.db import DB_BACKEND, get_connection
+
+load_dotenv()
+
+# --- Cache Settings ---
+CACHE_TTL = float(os.getenv('cache_ttl', 600))                      # seconds a result stays fresh
+CACHE_MAX_BYTES = int(float(os.getenv('cache_max_mb', 256)) * 1024 * 1024)
+VERSION_CHECK_INTERVAL = float(os.getenv('cache_version_check', 5))  # seconds between load-version lookups
+
+# One row per warehouse table, bumped by the loaders after every successful load
+LOAD_VERSION_TABLE = "etl_load_version"
+
+_lock = threading.Lock()
+_entries = OrderedDict()  # key -> (value, size_bytes, stored_at); oldest first
+_state = {"bytes": 0, "hits": 0, "misses": 0, "version": None, "checked_at": 0.0}
+
+
+# --- Load Version Tracking ---
+def ensure_load_version_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {LOAD_VERSION_TABLE} (
+            table_name VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0,
+            loaded_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+        );
+    """)
+
+
+def bump_load_version(*table_names):
+    """Marks tables as reloaded so every dashboard cache drops its results."""
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            ensure_load_version_table(cursor)
+            for table_name in table_names:
+                cursor.execute(
+                    f"INSERT INTO {LOAD_VERSION_TABLE} (table_name, version) VALUES (%s, 1) "
+                    "ON DUPLICATE KEY UPDATE version = version + 1",
+                    (table_name,)
+                )
+        conn.commit()
+
+
+def get_load_version():
+    """Returns a fingerprint of all table load versions (None if never loaded)."""
+    if DB_BACKEND == "duckdb":
+        from etl.embedded import get_load_version as get_staged_version
+
+        return get_staged_version()
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"SELECT table_name, version FROM {LOAD_VERSION_TABLE} ORDER BY table_name")
+                return tuple((row["table_name"], row["version"]) for row in cursor.fetchall())
+    except pymysql.err.ProgrammingError:
+        return None  # Table not created yet: rely on the TTL alone
+
+
+def _check_load_version():
+    """Clears the cache when the loaders have bumped a version since the last check."""
+    now = time.monotonic()
+    if now - _state["checked_at"] < VERSION_CHECK_INTERVAL:
+        return
+    version = get_load_version()
+    with _lock:
+        _state["checked_at"] = now
+        if version != _state["version"]:
+            _clear_locked()
+            _state["version"] = version
+
+
+# --- LRU Store ---
+def _sizeof(value):
+    """Approximates the memory held by a cached result."""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if dataclasses.is_dataclass(value):
+        return sum(_sizeof(getattr(value, f.name)) for f in dataclasses.fields(value))
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(_sizeof(item) for item in value.values())
+    return sys.getsizeof(value)
+
+
+def _clear_locked():
+    _entries.clear()
+    _state["bytes"] = 0
+
+
+def _store(key, value):
+    size = _sizeof(value)
+    if size > CACHE_MAX_BYTES:
+        return  # Never cache a result larger than the whole budget
+    with _lock:
+        if key in _entries:
+            _state["bytes"] -= _entries.pop(key)[1]
+        _entries[key] = (value, size, time.monotonic())
+        _state["bytes"] += size
+        while _state["bytes"] > CACHE_MAX_BYTES:
+            _, (_, evicted_size, _) = _entries.popitem(last=False)
+            _state["bytes"] -= evicted_size
+
+
+def _lookup(key):
+    with _lock:
+        entry = _entries.get(key)
+        if entry is None:
+            _state["misses"] += 1
+            return False, None
+        value, size, stored_at = entry
+        if time.monotonic() - stored_at > CACHE_TTL:
+            del _entries[key]
+            _state["bytes"] -= size
+            _state["misses"] += 1
+            return False, None
+        _entries.move_to_end(key)
+        _state["hits"] += 1
+        return True, value
+
+
+# --- Public API ---
+def cached_query(func):
+    """Caches a getter's result until its TTL expires or the warehouse is reloaded.
+
+    Cached DataFrames are shared between callers and must not be modified in place.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        _check_load_version()
+        key = (func.__module__, func.__qualname__, args, tuple(sorted(kwargs.items())))
+        found, value = _lookup(key)
+        if found:
+            return value
+        value = func(*args, **kwargs)
+        _store(key, value)
+        return value
+
+    wrapper.uncached = func
+    return wrapper
+
+
+def invalidate():
+    """Drops every cached result."""
+    with _lock:
+        _clear_locked()
+
+
+def cache_info():
+    with _lock:
+        return {
+            "entries": len(_entries),
+            "bytes": _state["bytes"],
+            "max_bytes": CACHE_MAX_BYTES,
+            "hits": _state["hits"],
+            "misses": _state["misses"],
+            "ttl_seconds": CACHE_TTL,
+        }
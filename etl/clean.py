@@ -1,70 +1,378 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import numpy as np
 import pandas as pd
 
-# Load data
-df = pd.read_csv("Data/complete_healthcare_data.csv")
-
-# Check for missing values
-print(" Missing values before cleaning:")
-print(df.isna().sum())
-
-# Fill missing values
-df["alcohol_consumption"].fillna(df["alcohol_consumption"].mode()[0], inplace=True)
-df["exercise_frequency"].fillna(df["exercise_frequency"].mode()[0], inplace=True)
-
-# Drop full duplicate rows (if any)
-df.drop_duplicates(inplace=True)
-
-# Print missing values after cleaning
-print("Missing values after cleaning:")
-print(df.isna().sum())
-
-# Create Fact Table (Only Numeric + Foreign Keys)
-hospital_visits_fact = df[[
-    "visit_id", "patient_id_x", "disease_id", "billing_id", "visit_date",
-    "hospital_id", "doctor_id", "total_bill_x"
-]].rename(columns={
-    "patient_id_x": "patient_id",
-    "total_bill_x": "total_bill"
-})
-
-# Create Patient Dimension 
-patient_dim = df[[
-    "patient_id_y", "name", "age", "gender", "location", "blood_type",
-    "weight", "height", "smoker_status", "alcohol_consumption", "exercise_frequency"
-]].drop_duplicates(subset=["patient_id_y"], keep="first").rename(columns={"patient_id_y": "patient_id"})
-
-# Check for duplicate patient IDs before exporting
-duplicate_patients = patient_dim[patient_dim.duplicated(subset=["patient_id"], keep=False)]
-if not duplicate_patients.empty:
-    print(" Duplicate patient_id found! Investigate before proceeding.")
-    print(duplicate_patients)
-else:
-    print("No duplicate patient IDs found.")
-
-# Create Disease Dimension
-disease_dim = df[["disease_id", "disease_name", "category", "severity_level"]].drop_duplicates()
-
-# Create Doctor Dimension
-doctor_dim = df[["doctor_id", "doctor_name", "specialization", "years_of_experience"]].drop_duplicates()
-
-# Create Hospital Dimension
-hospital_dim = df[["hospital_id", "hospital_name", "city", "type"]].drop_duplicates()
-
-# Create Billing Dimension
-billing_dim = df[[
-    "billing_id", "total_bill_y", "insurance_type_y", "claim_status_y", "payment_method"
-]].drop_duplicates().rename(columns={
-    "total_bill_y": "total_bill",
-    "insurance_type_y": "insurance_type",
-    "claim_status_y": "claim_status"
-})
-
-# Save Cleaned Tables as CSV
-hospital_visits_fact.to_csv("data/cleaned_hospital_visits_fact.csv", index=False)
-patient_dim.to_csv("data/cleaned_patient_dim.csv", index=False)
-disease_dim.to_csv("data/cleaned_disease_dim.csv", index=False)
-doctor_dim.to_csv("data/cleaned_doctor_dim.csv", index=False)
-hospital_dim.to_csv("data/cleaned_hospital_dim.csv", index=False)
-billing_dim.to_csv("data/cleaned_billing_dim.csv", index=False)
-
-print("Fact and Dimension tables created successfully with optimized schema!")
+from etl.metrics import increment
+from etl.partitions import MONTH_COLUMN, add_visit_month
+from etl.staging import DATA_DIR, STAGING_FORMAT, StagingWriter
+from etl.state import INCREMENTAL, WATERMARK, EtlState, delta_dir, state_path
+from etl.surrogate_keys import encode_dimension, encode_fact, load_keymaps, save_keymaps
+
+SOURCE_PATH = os.path.join(DATA_DIR, "complete_healthcare_data.csv")
+OUTPUT_DIR = DATA_DIR
+CHUNK_SIZE = int(os.getenv('clean_chunk_size', 100_000))  # source rows held in memory at once
+CLEAN_WORKERS = int(os.getenv('clean_workers', 1))          # > 1 cleans in parallel processes
+PARTITION_BYTES = int(os.getenv('clean_partition_mb', 64)) * 2**20  # source bytes per parallel reduce partition
+
+# Columns whose missing values are filled with the column mode
+MODE_FILL_COLUMNS = ["alcohol_consumption", "exercise_frequency"]
+
+# Output tables: source columns, renames, and the natural key rows are deduplicated on
+# (None = full-row duplicates only, which were already dropped from the source).
+# Dimension keys are then replaced with integer surrogates (see surrogate_keys.py).
+TABLES = {
+    # Fact Table (Only Numeric + Foreign Keys)
+    "hospital_visits_fact": {
+        "columns": ["visit_id", "patient_id_x", "disease_id", "billing_id", "visit_date",
+                    "hospital_id", "doctor_id", "total_bill_x"],
+        "rename": {"patient_id_x": "patient_id", "total_bill_x": "total_bill"},
+        "key": None,
+    },
+    "patient_dim": {
+        "columns": ["patient_id_y", "name", "age", "gender", "location", "blood_type",
+                    "weight", "height", "smoker_status", "alcohol_consumption", "exercise_frequency"],
+        "rename": {"patient_id_y": "patient_id"},
+        "key": "patient_id",
+    },
+    "disease_dim": {
+        "columns": ["disease_id", "disease_name", "category", "severity_level"],
+        "rename": {},
+        "key": "disease_id",
+    },
+    "doctor_dim": {
+        "columns": ["doctor_id", "doctor_name", "specialization", "years_of_experience"],
+        "rename": {},
+        "key": "doctor_id",
+    },
+    "hospital_dim": {
+        "columns": ["hospital_id", "hospital_name", "city", "type"],
+        "rename": {},
+        "key": "hospital_id",
+    },
+    "billing_dim": {
+        "columns": ["billing_id", "total_bill_y", "insurance_type_y", "claim_status_y", "payment_method"],
+        "rename": {"total_bill_y": "total_bill", "insurance_type_y": "insurance_type",
+                   "claim_status_y": "claim_status"},
+        "key": "billing_id",
+    },
+}
+
+
+# --- On-Disk Dedupe Index ---
+class SeenIndex:
+    """Remembers 64-bit hashes in a temporary SQLite file so memory stays flat.
+
+    Hashes of distinct rows can collide with probability ~n^2 / 2^65, which is
+    negligible below billions of rows.
+    """
+
+    def __init__(self):
+        fd, self.path = tempfile.mkstemp(suffix=".dedupe.sqlite")
+        os.close(fd)
+        self.conn = sqlite3.connect(self.path)
+        self.conn.execute("PRAGMA journal_mode = OFF")
+        self.conn.execute("PRAGMA synchronous = OFF")
+        self.conn.execute("CREATE TABLE seen (h INTEGER PRIMARY KEY)")
+        self.conn.execute("CREATE TEMP TABLE batch (h INTEGER PRIMARY KEY)")
+
+    def first_seen(self, hashes):
+        """Returns a mask marking the first occurrence of every hash not seen before."""
+        hashes = np.asarray(hashes, dtype=np.uint64).view(np.int64)
+        mask = ~pd.Series(hashes).duplicated().to_numpy()
+        candidates = hashes[mask].tolist()
+
+        self.conn.execute("DELETE FROM batch")
+        self.conn.executemany("INSERT INTO batch VALUES (?)", ((h,) for h in candidates))
+        known = [row[0] for row in self.conn.execute("SELECT h FROM batch JOIN seen USING (h)")]
+        self.conn.execute("INSERT OR IGNORE INTO seen SELECT h FROM batch")
+        self.conn.commit()
+
+        if known:
+            mask &= ~np.isin(hashes, np.array(known, dtype=np.int64))
+        return mask
+
+    def close(self):
+        self.conn.close()
+        os.remove(self.path)
+
+
+def _row_hashes(df):
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+# --- Cleaning Passes ---
+def _read_chunks(source, chunk_size):
+    return pd.read_csv(source, chunksize=chunk_size)
+
+
+def compute_fill_values(source=SOURCE_PATH, chunk_size=CHUNK_SIZE):
+    """First pass: counts values of the mode-filled columns and missing values per column."""
+    counts = {col: Counter() for col in MODE_FILL_COLUMNS}
+    missing = None
+    for chunk in _read_chunks(source, chunk_size):
+        for col in MODE_FILL_COLUMNS:
+            counts[col].update(chunk[col].value_counts().to_dict())
+        chunk_missing = chunk.isna().sum()
+        missing = chunk_missing if missing is None else missing.add(chunk_missing, fill_value=0)
+
+    fill_values = {}
+    for col, counter in counts.items():
+        if not counter:
+            fill_values[col] = None  # Entirely missing: there is no mode, so the column stays NULL
+            continue
+        top = max(counter.values())
+        fill_values[col] = min(value for value, n in counter.items() if n == top)  # Same tie-break as Series.mode()
+    return fill_values, missing
+
+
+def split_tables(df):
+    """Projects a cleaned source chunk into the fact and dimension tables."""
+    tables = {
+        name: df[spec["columns"]].rename(columns=spec["rename"])
+        for name, spec in TABLES.items()
+    }
+    # The fact carries its month bucket, the column it is partitioned on (see partitions.py)
+    tables["hospital_visits_fact"] = add_visit_month(tables["hospital_visits_fact"])
+    return tables
+
+
+def _prepare_chunk(chunk, fill_values, watermark):
+    """Keeps visits on or after the watermark and fills missing values; returns (chunk, latest visit_date)."""
+    visit_dates = pd.to_datetime(chunk[WATERMARK], errors="coerce")
+    if watermark is not None:
+        recent = visit_dates >= pd.Timestamp(watermark)
+        chunk, visit_dates = chunk[recent], visit_dates[recent]
+    fills = {col: value for col, value in fill_values.items() if value is not None}
+    return chunk.fillna(fills), visit_dates.max()
+
+
+def _later(a, b):
+    return b if pd.isna(a) else a if pd.isna(b) else max(a, b)
+
+
+def _add_missing(total, missing):
+    return missing if total is None else total.add(missing, fill_value=0)
+
+
+def _table_columns(name):
+    spec = TABLES[name]
+    columns = [spec["rename"].get(col, col) for col in spec["columns"]]
+    return columns + [MONTH_COLUMN] if name == "hospital_visits_fact" else columns
+
+
+def _clean_serial(source, staging_dir, chunk_size, fmt, fill_values, watermark, state, keymaps):
+    """Streams the source once, deduplicating against on-disk hash indexes."""
+    row_index = SeenIndex()
+    key_indexes = {name: SeenIndex() for name, spec in TABLES.items() if spec["key"]}
+    writers = {name: StagingWriter(name, fmt, staging_dir) for name in TABLES}
+    missing_after = high_water = None
+    rows_written = 0
+    try:
+        for chunk in _read_chunks(source, chunk_size):
+            # Fill missing values
+            chunk, latest = _prepare_chunk(chunk, fill_values, watermark)
+            high_water = _later(high_water, latest)
+
+            # Drop full duplicate rows (if any), across all chunks
+            chunk = chunk[row_index.first_seen(_row_hashes(chunk))]
+            rows_written += len(chunk)
+            missing_after = _add_missing(missing_after, chunk.isna().sum())
+
+            tables = split_tables(chunk)
+            fact = tables.pop("hospital_visits_fact")
+            for name, table in tables.items():
+                key = TABLES[name]["key"]
+                table = table[key_indexes[name].first_seen(pd.util.hash_array(table[key].to_numpy()))]
+                table = table[table[key].notna()]
+                changed = state.changed_rows(name, table[key], _row_hashes(table))
+                if watermark is not None:
+                    table = table[changed]
+                writers[name].write(encode_dimension(table, name, keymaps[name]))
+
+            # Dimensions first, so the fact's keys resolve to the surrogates just assigned;
+            # keys with no dimension row stay UNKNOWN_KEY for validation to reject
+            writers["hospital_visits_fact"].write(encode_fact(fact, keymaps))
+    finally:
+        for writer in writers.values():
+            writer.close()
+        row_index.close()
+        for index in key_indexes.values():
+            index.close()
+    return missing_after, high_water, rows_written
+
+
+# --- Parallel Cleaning ---
+MISSING_PREFIX = "_missing."  # Fact spill columns flagging the source's missing values
+
+
+def _partition_chunk(chunk_no, chunk, fill_values, watermark, n_partitions, spill_dir):
+    """Map step (worker process): fills one source chunk and spills every table's rows by key hash.
+
+    Fact rows carry which source values were missing, so missing values are counted
+    after deduplication, as in the serial pass.
+    """
+    chunk, latest = _prepare_chunk(chunk, fill_values, watermark)
+    row_hashes = _row_hashes(chunk)
+    # Source order, so the reduce keeps first occurrences as the serial pass does
+    order = np.arange(len(chunk), dtype=np.int64) + chunk_no * (1 << 32)
+
+    for name, table in split_tables(chunk).items():
+        key = TABLES[name]["key"]
+        table = table.assign(_order=order)
+        if key is None:
+            hashes = row_hashes  # Full duplicate rows share a partition
+            table["_row_hash"] = row_hashes
+            table = pd.concat([table, chunk.isna().add_prefix(MISSING_PREFIX)], axis=1)
+        else:
+            table = table[table[key].notna()]
+            hashes = pd.util.hash_array(table[key].to_numpy())
+        partitions = (hashes % np.uint64(n_partitions)).astype(np.int64)
+        for part, piece in table.groupby(partitions, sort=False):
+            piece.to_pickle(os.path.join(spill_dir, f"{name}.{part}.{chunk_no}.pkl"))
+    return latest
+
+
+def _dedupe_partition(name, paths):
+    """Reduce step (worker process): deduplicates one partition of one table.
+
+    Returns (name, rows in source order, missing values per source column or None).
+    """
+    pieces = [pd.read_pickle(path) for path in paths]
+    key = TABLES[name]["key"]
+    table = pd.concat(pieces, ignore_index=True).sort_values("_order", kind="stable")
+    table = table.drop_duplicates(subset=[key] if key else ["_row_hash"])
+    flags = [col for col in table.columns if col.startswith(MISSING_PREFIX)]
+    missing = table[flags].sum().rename(lambda col: col[len(MISSING_PREFIX):]) if flags else None
+    return name, table.drop(columns=["_order", "_row_hash", *flags], errors="ignore"), missing
+
+
+def _bounded_map(pool, func, tasks, limit):
+    """Yields func(*task) results as they finish, with at most `limit` tasks in flight."""
+    in_flight = set()
+    for task in tasks:
+        if len(in_flight) >= limit:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            yield from (future.result() for future in done)
+        in_flight.add(pool.submit(func, *task))
+    yield from (future.result() for future in as_completed(in_flight))
+
+
+def _clean_parallel(source, staging_dir, chunk_size, fmt, fill_values, watermark, state, keymaps, workers):
+    """Partitions the source by key hash across `workers` processes and writes each partition once deduplicated.
+
+    Partitions are sized by PARTITION_BYTES, so memory holds a few partitions rather
+    than the dataset. Surrogate keys are assigned partition by partition, dimensions
+    before the fact, so they differ from a serial run's but resolve the same way.
+    """
+    spill_dir = tempfile.mkdtemp(suffix=".clean")
+    n_partitions = max(workers, -(-os.path.getsize(source) // PARTITION_BYTES))
+    writers = {name: StagingWriter(name, fmt, staging_dir) for name in TABLES}
+    missing_after = high_water = None
+    rows_written = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            # Map: at most 2 chunks per worker in flight, so memory stays bounded
+            chunks = (
+                (chunk_no, chunk, fill_values, watermark, n_partitions, spill_dir)
+                for chunk_no, chunk in enumerate(_read_chunks(source, chunk_size))
+            )
+            for latest in _bounded_map(pool, _partition_chunk, chunks, 2 * workers):
+                high_water = _later(high_water, latest)
+
+            # Reduce: every (table, partition) is deduplicated independently
+            spilled = {}
+            for filename in sorted(os.listdir(spill_dir)):
+                name, part, _, _ = filename.split(".")
+                spilled.setdefault(name, {}).setdefault(part, []).append(os.path.join(spill_dir, filename))
+
+            # Dimensions first, so the fact's keys resolve to the surrogates just assigned;
+            # keys with no dimension row stay UNKNOWN_KEY for validation to reject
+            dims = [(name, paths) for name, spec in TABLES.items() if spec["key"]
+                    for paths in spilled.get(name, {}).values()]
+            for name, table, _ in _bounded_map(pool, _dedupe_partition, dims, 2 * workers):
+                key = TABLES[name]["key"]
+                changed = state.changed_rows(name, table[key], _row_hashes(table))
+                if watermark is not None:
+                    table = table[changed]
+                writers[name].write(encode_dimension(table, name, keymaps[name]))
+
+            facts = [("hospital_visits_fact", paths) for paths in spilled.get("hospital_visits_fact", {}).values()]
+            for name, fact, missing in _bounded_map(pool, _dedupe_partition, facts, 2 * workers):
+                missing_after = _add_missing(missing_after, missing)
+                rows_written += len(fact)
+                writers[name].write(encode_fact(fact, keymaps))
+
+        # Tables without any rows still get a (header-only) file, replacing an older one
+        for name in set(TABLES) - set(spilled):
+            empty = pd.DataFrame(columns=_table_columns(name))
+            key = TABLES[name]["key"]
+            writers[name].write(encode_dimension(empty, name, keymaps[name]) if key else encode_fact(empty, keymaps))
+    finally:
+        for writer in writers.values():
+            writer.close()
+        shutil.rmtree(spill_dir, ignore_errors=True)
+    return missing_after, high_water, rows_written
+
+
+def run_clean(source=SOURCE_PATH, output_dir=OUTPUT_DIR, chunk_size=CHUNK_SIZE, fmt=STAGING_FORMAT,
+              incremental=INCREMENTAL, workers=CLEAN_WORKERS):
+    """Second pass: fills, deduplicates and writes every table.
+
+    With `workers` > 1 the source is partitioned across a process pool (see
+    _clean_parallel); otherwise it is streamed chunk by chunk in this process.
+    With `incremental=True` only visits on or after the stored visit_date watermark
+    and dimension rows whose content hash changed are written, to `<output_dir>/delta`.
+    The watermark day itself is re-read so late rows for it are not missed; the
+    loaders upsert, so the overlap is harmless.
+    """
+    state = EtlState(state_path(output_dir))
+    state.begin_run()
+    watermark = state.get_watermark() if incremental else None  # None: nothing loaded yet
+
+    if watermark is not None and state.get_fill_values():
+        # Keep the modes of the full history instead of re-reading it
+        fill_values, missing_before = state.get_fill_values(), None
+    else:
+        fill_values, missing_before = compute_fill_values(source, chunk_size)
+        state.save_fill_values(fill_values)
+
+    # Check for missing values
+    if missing_before is not None:
+        print(" Missing values before cleaning:")
+        print(missing_before)
+
+    staging_dir = delta_dir(output_dir) if incremental else output_dir
+    os.makedirs(staging_dir, exist_ok=True)
+
+    keymaps = load_keymaps(output_dir)
+    try:
+        if workers > 1:
+            missing_after, high_water, rows_written = _clean_parallel(
+                source, staging_dir, chunk_size, fmt, fill_values, watermark, state, keymaps, workers
+            )
+        else:
+            missing_after, high_water, rows_written = _clean_serial(
+                source, staging_dir, chunk_size, fmt, fill_values, watermark, state, keymaps
+            )
+        save_keymaps(keymaps)
+        if not pd.isna(high_water):
+            state.stage_watermark(high_water.strftime("%Y-%m-%d"))
+    finally:
+        state.close()
+
+    # Print missing values after cleaning
+    print("Missing values after cleaning:")
+    print(missing_after)
+    increment("etl_rows_loaded_total", rows_written, table="staging")
+    print(f"{'Incremental' if incremental else 'Full'} clean: {rows_written:,} source rows written to {staging_dir}")
+
+
+if __name__ == "__main__":
+    run_clean()
+    print("Fact and Dimension tables created successfully with optimized schema!")
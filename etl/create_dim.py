@@ -1,43 +1,241 @@
+import argparse
+
 import pandas as pd
-from sqlalchemy import create_engine
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
-
-# MySQL Database Connection Details
-DB_CONFIG = {
-        "host": Host,       
-        "user":User,            
-        "password":Password,     
-        "database":Database  
+
+from etl.bulk_load import bulk_load
+from etl.cache import bump_load_version
+from etl.datamarts import MATERIALIZED_MARTS, rebuild_data_marts
+from etl.db import get_connection
+from etl.hll import SKETCH_TABLE, rebuild_distinct_sketches
+from etl.partitions import FACT_TABLE
+from etl.staging import DATA_DIR, read_staging
+from etl.state import INCREMENTAL, commit_dim_hashes, delta_dir
+from etl.surrogate_keys import DIM_KEYS, UNKNOWN_KEY, KeyMap, encode_dimension, natural_key_column
+
+KEY_MIGRATION_CHUNK_SIZE = 100_000  # UUIDs mapped per round trip when migrating keys
+MIGRATE_KEYS_HINT = "run `python -m etl.create_dim --migrate-keys` to convert it"
+
+# Dimension table definitions; keys are declared up front so reloads keep them.
+# `<name>_id` is the integer surrogate, `<name>_uuid` the indexed natural key.
+DIM_TABLES = {
+    "patient_dim": """
+        CREATE TABLE IF NOT EXISTS patient_dim (
+            patient_id INT NOT NULL PRIMARY KEY,
+            patient_uuid VARCHAR(64) CHARACTER SET ascii NOT NULL,
+            name VARCHAR(255),
+            age INT,
+            gender VARCHAR(20),
+            location VARCHAR(255),
+            blood_type VARCHAR(5),
+            weight DOUBLE,
+            height DOUBLE,
+            smoker_status VARCHAR(50),
+            alcohol_consumption VARCHAR(50),
+            exercise_frequency VARCHAR(50),
+            UNIQUE KEY ux_patient_uuid (patient_uuid)
+        );
+    """,
+    "disease_dim": """
+        CREATE TABLE IF NOT EXISTS disease_dim (
+            disease_id INT NOT NULL PRIMARY KEY,
+            disease_uuid VARCHAR(64) CHARACTER SET ascii NOT NULL,
+            disease_name VARCHAR(255),
+            category VARCHAR(100),
+            severity_level VARCHAR(50),
+            UNIQUE KEY ux_disease_uuid (disease_uuid)
+        );
+    """,
+    "doctor_dim": """
+        CREATE TABLE IF NOT EXISTS doctor_dim (
+            doctor_id INT NOT NULL PRIMARY KEY,
+            doctor_uuid VARCHAR(64) CHARACTER SET ascii NOT NULL,
+            doctor_name VARCHAR(255),
+            specialization VARCHAR(100),
+            years_of_experience INT,
+            UNIQUE KEY ux_doctor_uuid (doctor_uuid)
+        );
+    """,
+    "hospital_dim": """
+        CREATE TABLE IF NOT EXISTS hospital_dim (
+            hospital_id INT NOT NULL PRIMARY KEY,
+            hospital_uuid VARCHAR(64) CHARACTER SET ascii NOT NULL,
+            hospital_name VARCHAR(255),
+            city VARCHAR(255),
+            type VARCHAR(50),
+            UNIQUE KEY ux_hospital_uuid (hospital_uuid)
+        );
+    """,
+    "billing_dim": """
+        CREATE TABLE IF NOT EXISTS billing_dim (
+            billing_id INT NOT NULL PRIMARY KEY,
+            billing_uuid VARCHAR(64) CHARACTER SET ascii NOT NULL,
+            total_bill DECIMAL(10, 2),
+            insurance_type VARCHAR(50),
+            claim_status VARCHAR(50),
+            payment_method VARCHAR(50),
+            UNIQUE KEY ux_billing_uuid (billing_uuid)
+        );
+    """,
 }
 
-# Create SQLAlchemy engine using DB_CONFIG
-engine = create_engine(f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}")
 
+# Function to load a staged dimension (Parquet when staging_format=parquet, CSV otherwise).
+# Tables staged before surrogate keys existed are encoded here with the same key map.
+# In incremental mode only the new and changed rows staged by clean.py are read.
+def load_staged_dimension(table_name):
+    staging_dir = delta_dir() if INCREMENTAL else DATA_DIR
+    keymap = KeyMap(table_name)
+    df = encode_dimension(read_staging(table_name, data_dir=staging_dir), table_name, keymap)
+    keymap.save()
+    return df
+
+# --- Surrogate Key Migration ---
+def _column_type(cursor, table, column):
+    cursor.execute(
+        "SELECT data_type AS data_type FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column)
+    )
+    row = cursor.fetchone()
+    return row["data_type"].lower() if row else None
+
+
+def legacy_key_columns(cursor):
+    """(table, column) pairs that still hold natural UUID keys instead of integer surrogates."""
+    return [
+        (table, key)
+        for dim, key in DIM_KEYS.items()
+        for table in (dim, FACT_TABLE)
+        if _column_type(cursor, table, key) not in (None, "int")
+    ]
+
+
+def check_surrogate_keys(cursor, tables):
+    """Fails before a load when one of `tables` was created with UUID keys: upserts would not fit its schema."""
+    legacy = [f"{table}.{column}" for table, column in legacy_key_columns(cursor) if table in tables]
+    if legacy:
+        raise ValueError(f"{', '.join(legacy)} still hold UUID keys from before integer surrogates; {MIGRATE_KEYS_HINT}")
+
+
+def _migrate_dimension_keys(cursor, dim, key):
+    """Moves a dimension's UUIDs to `<name>_uuid` and rewrites its key with the key map's surrogates.
+
+    Every step can be repeated, so an interrupted migration is simply run again.
+    """
+    natural = natural_key_column(key)
+    mapping = f"{dim}_key_migration"
+    if _column_type(cursor, dim, natural) is None:
+        cursor.execute(f"ALTER TABLE {dim} ADD COLUMN {natural} VARCHAR(64) CHARACTER SET ascii NULL AFTER {key}")
+    cursor.execute(f"UPDATE {dim} SET {natural} = {key} WHERE {natural} IS NULL")
+
+    # The key map assigns the surrogates, so later loads of the same UUIDs agree with them
+    cursor.execute(f"DROP TABLE IF EXISTS {mapping}")
+    cursor.execute(
+        f"CREATE TABLE {mapping} (uuid VARCHAR(64) CHARACTER SET ascii NOT NULL PRIMARY KEY, surrogate INT NOT NULL)"
+    )
+    keymap = KeyMap(dim)
+    cursor.execute(f"SELECT {natural} AS uuid FROM {dim}")
+    while True:
+        rows = cursor.fetchmany(KEY_MIGRATION_CHUNK_SIZE)
+        if not rows:
+            break
+        uuids = pd.Series([row["uuid"] for row in rows], dtype=object)
+        bulk_load(pd.DataFrame({"uuid": uuids, "surrogate": keymap.encode(uuids)}), mapping)
+    keymap.save()  # Before any row holds the new keys
 
-# Load CSV files
-disease_dim = pd.read_csv(r"C:\Users\santosh\Desktop\HealthCare\Data\cleaned_disease_dim.csv")
-doctor_dim = pd.read_csv(r"C:\Users\santosh\Desktop\HealthCare\Data\cleaned_doctor_dim.csv")
-hospital_dim = pd.read_csv(r"C:\Users\santosh\Desktop\HealthCare\Data\cleaned_hospital_dim.csv")
-billing_dim = pd.read_csv(r"C:\Users\santosh\Desktop\HealthCare\Data\cleaned_billing_dim.csv")
+    cursor.execute(f"UPDATE {dim} d JOIN {mapping} m ON m.uuid = d.{natural} SET d.{key} = m.surrogate")
+    cursor.execute(f"ALTER TABLE {dim} MODIFY {key} INT NOT NULL, MODIFY {natural} VARCHAR(64) CHARACTER SET ascii NOT NULL")
+    cursor.execute(f"SHOW INDEX FROM {dim} WHERE Key_name = %s", (f"ux_{natural}",))
+    if not cursor.fetchall():
+        cursor.execute(f"ALTER TABLE {dim} ADD UNIQUE KEY ux_{natural} ({natural})")
+    cursor.execute(f"DROP TABLE {mapping}")
+    print(f" Migrated {dim}.{key} to integer surrogates")
 
-# Function to push DataFrame to MySQL
+
+def _migrate_fact_keys(cursor, dim, key):
+    """Rewrites the fact's foreign key to the dimension's surrogates; unknown UUIDs become UNKNOWN_KEY."""
+    natural = natural_key_column(key)
+    # Rows already rewritten by an interrupted run hold digits, not UUIDs
+    cursor.execute(
+        f"UPDATE {FACT_TABLE} f LEFT JOIN {dim} d ON d.{natural} = f.{key} "
+        f"SET f.{key} = COALESCE(d.{key}, {UNKNOWN_KEY}) "
+        f"WHERE f.{key} IS NOT NULL AND f.{key} NOT REGEXP '^[0-9]+$'"
+    )
+    cursor.execute(f"ALTER TABLE {FACT_TABLE} MODIFY {key} INT")
+    print(f" Migrated {FACT_TABLE}.{key} to integer surrogates")
+
+
+def migrate_surrogate_keys():
+    """Converts a warehouse loaded before integer surrogate keys in place; returns the columns migrated.
+
+    Dimensions get their `<name>_uuid` column and integer keys from the key maps, and
+    the fact's foreign keys are rewritten through them. Old foreign key constraints
+    are dropped (the loaders validate keys, see validate.py), and the marts and
+    distinct sketches, which hold the old keys, are rebuilt.
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            legacy = legacy_key_columns(cursor)
+            if not legacy:
+                print("Surrogate keys already in place")
+                return []
+
+            cursor.execute(
+                "SELECT constraint_name AS name, table_name AS child FROM information_schema.referential_constraints "
+                f"WHERE constraint_schema = DATABASE() AND referenced_table_name IN ({', '.join(['%s'] * len(DIM_KEYS))})",
+                list(DIM_KEYS)
+            )
+            for row in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {row['child']} DROP FOREIGN KEY {row['name']}")
+
+            for dim, key in DIM_KEYS.items():
+                if (dim, key) in legacy:
+                    _migrate_dimension_keys(cursor, dim, key)
+                if (FACT_TABLE, key) in legacy:
+                    _migrate_fact_keys(cursor, dim, key)
+            fact_exists = _column_type(cursor, FACT_TABLE, "visit_id") is not None
+
+    if fact_exists:
+        rebuild_data_marts()
+        rebuild_distinct_sketches()
+    bump_load_version(*DIM_TABLES, FACT_TABLE, *MATERIALIZED_MARTS, SKETCH_TABLE)
+    return legacy
+
+
+# Function to create a dimension table if it doesn't exist
+# A table from before integer surrogate keys must be migrated first (see migrate_surrogate_keys)
+def create_dim_table(table_name):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            check_surrogate_keys(cursor, [table_name])
+            cursor.execute(DIM_TABLES[table_name])
+
+# Function to push DataFrame to MySQL (upserts, so existing keys and FKs stay intact).
+# Changed rows overwrite the current version in place (type 1 slowly changing dimension).
 def push_to_mysql(df, table_name):
-    df.to_sql(table_name, engine, if_exists="replace", index=False)
+    create_dim_table(table_name)
+    bulk_load(df, table_name, upsert=True)
     print(f"Data pushed to {table_name}")
 
-# Main function to execute
+# Function to load one dimension end to end; dimensions are independent of each other
+def load_dimension(table_name):
+    push_to_mysql(load_staged_dimension(table_name), table_name)
+
+    # Invalidate dashboard caches that read the table
+    bump_load_version(table_name)
+
+    # The staged row hashes now describe what is loaded
+    commit_dim_hashes(table_name)
+
+# Main function to execute (run from the project root: python -m etl.create_dim)
 if __name__ == "__main__":
-    push_to_mysql(disease_dim, "disease_dim")
-    push_to_mysql(doctor_dim, "doctor_dim")
-    push_to_mysql(hospital_dim, "hospital_dim")
-    push_to_mysql(billing_dim, "billing_dim")
+    parser = argparse.ArgumentParser(description="Load the staged dimension tables.")
+    parser.add_argument("--migrate-keys", action="store_true",
+                        help="convert tables loaded before integer surrogate keys instead of loading")
+    if parser.parse_args().migrate_keys:
+        migrate_surrogate_keys()
+    else:
+        for table_name in DIM_TABLES:
+            load_dimension(table_name)
 
-    print("All dimension tables successfully loaded into MySQL!")
+        print("All dimension tables successfully loaded into MySQL!")
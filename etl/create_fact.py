@@ -1,91 +1,129 @@
-import pandas as pd
-from sqlalchemy import create_engine, text
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
-
-# MySQL Database Connection Details
-DB_CONFIG = {
-        "host": Host,       
-        "user":User,            
-        "password":Password,     
-        "database":Database  
-}
-
-# Create SQLAlchemy engine using DB_CONFIG
-engine = create_engine(f"mysql+mysqlconnector://{DB_CONFIG['user']}:{DB_CONFIG['password']}@{DB_CONFIG['host']}/{DB_CONFIG['database']}")
-
-# Load CSV file for the fact table
-hospital_visits_fact = pd.read_csv(r"C:\Users\santosh\Desktop\HealthCare\Data\cleaned_hospital_visits_fact.csv")
+from etl.bulk_load import bulk_load
+from etl.cache import bump_load_version
+from etl.create_dim import check_surrogate_keys
+from etl.datamarts import MATERIALIZED_MARTS, rebuild_data_marts, refresh_data_marts
+from etl.db import get_connection
+from etl.hll import SKETCH_TABLE, DistinctSketchBuilder, rebuild_distinct_sketches
+from etl.metrics import timed_stage
+from etl.partitions import (
+    MONTH_COLUMN, add_visit_month, drop_moved_visits, ensure_partitions, list_partitions, migrate_fact_table,
+    partition_clause,
+)
+from etl.staging import DATA_DIR, iter_staging
+from etl.state import INCREMENTAL, advance_watermark, delta_dir
+from etl.surrogate_keys import encode_fact, load_keymaps
+from etl.validate import VALIDATION_CHUNK_SIZE, load_key_indexes, validate_fact_chunks
 
 
 # Function to create the fact table if it doesn't exist
+# Partitioned tables cannot have foreign keys in MySQL, and every unique key must
+# include the partitioning column: the loader validates the dimension keys instead
+# (validate.py), and a visit is identified by (visit_id, visit_month).
+# A table created before partitioning is migrated in place first (see partitions.py);
+# one with UUID foreign keys must be migrated to surrogates (see create_dim.py).
 def create_fact_table():
-    create_table_query = """
+    create_table_query = f"""
     CREATE TABLE IF NOT EXISTS hospital_visits_fact (
-        visit_id VARCHAR(50) PRIMARY KEY,
-        patient_id VARCHAR(255),
-        disease_id VARCHAR(255),
-        billing_id VARCHAR(255),
+        visit_id VARCHAR(50) NOT NULL,
+        patient_id INT,
+        disease_id INT,
+        billing_id INT,
         visit_date DATE,
-        hospital_id VARCHAR(255),
-        doctor_id VARCHAR(255),
+        visit_month INT NOT NULL,
+        hospital_id INT,
+        doctor_id INT,
         total_bill DECIMAL(10, 2),
-        FOREIGN KEY (patient_id) REFERENCES patient_dim(patient_id),
-        FOREIGN KEY (disease_id) REFERENCES disease_dim(disease_id),
-        FOREIGN KEY (billing_id) REFERENCES billing_dim(billing_id),
-        FOREIGN KEY (hospital_id) REFERENCES hospital_dim(hospital_id),
-        FOREIGN KEY (doctor_id) REFERENCES doctor_dim(doctor_id)
-    );
+        PRIMARY KEY (visit_id, visit_month),
+        INDEX ix_fact_month_visit (visit_month, visit_id)
+    )
+    {partition_clause()};
     """
-    with engine.connect() as connection:
-        connection.execute(text(create_table_query))
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            check_surrogate_keys(cursor, ["hospital_visits_fact"])
+            cursor.execute(create_table_query)
+            partitioned = bool(list_partitions(cursor))
         print("✅ Fact table `hospital_visits_fact` created (if not already existing).")
 
+    if not partitioned:
+        print("hospital_visits_fact predates monthly partitioning; migrating it before the load")
+        migrate_fact_table()
 
-# Function to push DataFrame to MySQL with foreign key validation
-def push_to_mysql(df, table_name):
-    try:
-        # Validate foreign keys before inserting data
-        with engine.connect() as connection:
-            # Use 'text' function to execute raw SQL queries properly
-            valid_patient_ids = {row[0] for row in connection.execute(text("SELECT patient_id FROM patient_dim")).fetchall()}
-            valid_disease_ids = {row[0] for row in connection.execute(text("SELECT disease_id FROM disease_dim")).fetchall()}
-            valid_billing_ids = {row[0] for row in connection.execute(text("SELECT billing_id FROM billing_dim")).fetchall()}
-            valid_hospital_ids = {row[0] for row in connection.execute(text("SELECT hospital_id FROM hospital_dim")).fetchall()}
-            valid_doctor_ids = {row[0] for row in connection.execute(text("SELECT doctor_id FROM doctor_dim")).fetchall()}
-
-            # Filter invalid rows
-            valid_data = df[
-                df['patient_id'].isin(valid_patient_ids) &
-                df['disease_id'].isin(valid_disease_ids) &
-                df['billing_id'].isin(valid_billing_ids) &
-                df['hospital_id'].isin(valid_hospital_ids) &
-                df['doctor_id'].isin(valid_doctor_ids)
-            ]
-            
-            if valid_data.empty:
-                raise ValueError("No valid rows to insert after foreign key validation.")
-
-            # Insert valid data into MySQL table
-            valid_data.to_sql(table_name, engine, if_exists="append", index=False)
-            print(f"Data pushed to {table_name}")
-    except Exception as e:
-        print(f"Error inserting data into table: {e}")
-
-
-# Main function to execute
-if __name__ == "__main__":
+
+# Function to upsert one validated chunk of visits; returns (rows loaded, stored rows deleted)
+def upsert_fact_chunk(valid_data, table_name):
+    # A visit re-sent within the chunk keeps its last version
+    valid_data = valid_data.drop_duplicates(subset=["visit_id"], keep="last")
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            ensure_partitions(cursor, int(valid_data[MONTH_COLUMN].max()), table_name)
+            # The upsert only replaces a visit filed under the same month
+            removed = drop_moved_visits(cursor, valid_data, table_name)
+    return bulk_load(valid_data, table_name, upsert=True), removed
+
+
+# Function to push fact chunks to MySQL with streaming foreign key validation
+def push_to_mysql(chunks, table_name):
+    # Load every dimension's keys once into compact sorted arrays
+    indexes = load_key_indexes()
+    sketches = DistinctSketchBuilder()
+
+    loaded = removed = 0
+    for valid_data in validate_fact_chunks(chunks, indexes):
+        if valid_data.empty:
+            continue
+
+        # Upsert valid data into MySQL table (re-running a load never duplicates visits)
+        chunk_loaded, chunk_removed = upsert_fact_chunk(valid_data, table_name)
+        loaded += chunk_loaded
+        removed += chunk_removed
+
+        # Incremental loads re-aggregate only the mart groups touched by the new visits;
+        # a full load rebuilds each mart once afterwards (the pipeline's mart stages)
+        if INCREMENTAL:
+            refresh_data_marts(valid_data)
+        sketches.add(valid_data)
+
+    if loaded == 0:
+        raise ValueError("No valid rows to insert after foreign key validation.")
+    if removed:
+        # Sketches can only be merged into, so the deleted rows' old months would stay
+        # counted: recount every sketch from the loaded table instead
+        rebuild_distinct_sketches()
+    else:
+        sketches.save()
+    print(f"Data pushed to {table_name}")
+
+    # Invalidate dashboard caches that read the fact table or the marts
+    bump_load_version(table_name, *MATERIALIZED_MARTS, SKETCH_TABLE)
+
+    # Only now is everything up to the staged high-water mark loaded
+    watermark = advance_watermark()
+    if watermark:
+        print(f"visit_date watermark advanced to {watermark}")
+
+
+# Function to load the staged fact table end to end
+def load_fact():
     # Create the fact table if it doesn't exist
     create_fact_table()
-    
+
     # Push data into the fact table
-    push_to_mysql(hospital_visits_fact, "hospital_visits_fact")
-    
+    # Fact files staged before surrogate keys or visit_month existed are completed on the fly
+    staging_dir = delta_dir() if INCREMENTAL else DATA_DIR
+    keymaps = load_keymaps()
+    chunks = (
+        add_visit_month(encode_fact(chunk, keymaps))
+        for chunk in iter_staging("hospital_visits_fact", VALIDATION_CHUNK_SIZE, data_dir=staging_dir)
+    )
+    push_to_mysql(chunks, "hospital_visits_fact")
+
+
+# Main function to execute (run from the project root: python -m etl.create_fact)
+if __name__ == "__main__":
+    # Failures are recorded once, by the stage (as in the pipeline)
+    with timed_stage("fact"):
+        load_fact()
+    if not INCREMENTAL:
+        rebuild_data_marts()
     print("Fact table successfully loaded into MySQL!")
@@ -0,0 +1,272 @@
+import os
+import threading
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.cache import cached_query
+from etl.engine import get_star_schema
+from etl.hll import estimate_counts, group_registers, register_updates
+from etl.staging import DATA_DIR
+
+load_dotenv()
+
+CUBE_PATH = os.path.join(DATA_DIR, "cube.npz")
+
+# --- Cube Settings ---
+CUBE_DEPTH = int(os.getenv('cube_depth', 2))  # cuboids stored: every combination of up to this many dimensions
+CUBE_HLL_PRECISION = int(os.getenv('cube_hll_precision', 10))  # 1 KiB of registers per group, ~3.3% error
+
+# Cube dimension -> (dimension table, attribute). "month" and "age_group" are derived.
+CUBE_DIMENSIONS = {
+    "month": None,
+    "hospital": ("hospital_dim", "hospital_name"),
+    "doctor": ("doctor_dim", "doctor_name"),
+    "disease": ("disease_dim", "disease_name"),
+    "disease_category": ("disease_dim", "category"),
+    "insurance_type": ("billing_dim", "insurance_type"),
+    "gender": ("patient_dim", "gender"),
+    "age_group": None,
+}
+
+MEASURES = ["revenue", "visits", "billed_visits", "patients"]
+SUMMED_MEASURES = ["revenue", "visits", "billed_visits"]
+
+
+# --- Building ---
+def _dimension_codes(schema):
+    """Per-fact-row member codes and member labels for every cube dimension (-1 = no member)."""
+    codes, labels = {}, {}
+    for dim, source in CUBE_DIMENSIONS.items():
+        if dim == "month":
+            codes[dim], labels[dim] = schema.month_codes, np.asarray(schema.months, dtype=object)
+        elif dim == "age_group":
+            codes[dim], labels[dim] = schema.age_groups()
+        else:
+            codes[dim], labels[dim] = schema.attribute(*source)
+    return codes, labels
+
+
+def _cuboid_name(dims):
+    return "+".join(dims) or "total"
+
+
+def _group_rows(member_codes, sizes, n_rows):
+    """Numbers the distinct member-code combinations of rows (one column per dimension).
+
+    Returns (group of every row, member codes of every group). Codes are packed into
+    one mixed-radix integer per row, so grouping is a single np.unique.
+    """
+    if not sizes:  # Grand total: one group, even over no rows
+        return np.zeros(n_rows, dtype=np.int64), np.zeros((1, 0), dtype=np.int32)
+    packed = np.zeros(n_rows, dtype=np.int64)
+    for column, size in zip(member_codes.T, sizes):
+        packed = packed * size + column
+    packed_groups, group_of_row = np.unique(packed, return_inverse=True)
+    cells = np.empty((len(packed_groups), len(sizes)), dtype=np.int32)
+    for i in reversed(range(len(sizes))):
+        packed_groups, cells[:, i] = np.divmod(packed_groups, sizes[i])
+    return group_of_row.ravel(), cells
+
+
+def _build_cuboid(rows, dims, sizes, precision):
+    """Aggregates fact rows to one cuboid: the measures and a patient sketch per group.
+
+    Rows without a member in one of `dims` drop out, as they would from the joins.
+    """
+    member_codes = np.stack([rows["codes"][dim] for dim in dims], axis=1) if dims else np.zeros((len(rows["bill"]), 0))
+    keep = (member_codes >= 0).all(axis=1)
+    group_of_row, cells = _group_rows(member_codes[keep].astype(np.int64), [sizes[dim] for dim in dims], int(keep.sum()))
+    n_groups = len(cells)
+
+    index, rank, has_patient = (rows[name][keep] for name in ["patient_index", "patient_rank", "has_patient"])
+    return {
+        "cells": cells,
+        "revenue": np.bincount(group_of_row, weights=rows["bill"][keep], minlength=n_groups),
+        "visits": np.bincount(group_of_row, minlength=n_groups),
+        "billed_visits": np.bincount(group_of_row, weights=rows["bill_present"][keep], minlength=n_groups),
+        "registers": group_registers(group_of_row[has_patient], n_groups, index[has_patient],
+                                     rank[has_patient], precision),
+    }
+
+
+def _fact_rows(schema, precision):
+    """The per-visit arrays cuboids are built from."""
+    codes, labels = _dimension_codes(schema)
+    patient_codes, patient_ids = schema.fact_codes["patient_id"]
+    has_patient = patient_codes >= 0
+    index = np.zeros(len(patient_codes), dtype=np.int64)
+    rank = np.zeros(len(patient_codes), dtype=np.uint8)
+    index[has_patient], rank[has_patient] = register_updates(patient_ids[patient_codes[has_patient]], precision)
+    rows = {"codes": codes, "bill": schema.bill, "bill_present": schema.bill_present.astype(float),
+            "patient_index": index, "patient_rank": rank, "has_patient": has_patient}
+    return rows, labels
+
+
+def build_cube(schema=None, depth=CUBE_DEPTH, precision=CUBE_HLL_PRECISION):
+    """Aggregates the fact table into every cuboid of up to `depth` cube dimensions.
+
+    Each group of a cuboid keeps SUM(total_bill), the visit count, the count of
+    billed visits (for averages) and a HyperLogLog sketch of its patients, so
+    distinct patients can be merged across groups without the patient ids. The
+    cuboids are far smaller than the fact table: the largest one at depth 2 is
+    month x doctor.
+    """
+    schema = schema or get_star_schema()
+    rows, labels = _fact_rows(schema, precision)
+    sizes = {dim: len(labels[dim]) for dim in CUBE_DIMENSIONS}
+    cuboids = {}
+    for n in range(depth + 1):
+        for dims in combinations(CUBE_DIMENSIONS, n):
+            cuboids[dims] = _build_cuboid(rows, dims, sizes, precision)
+    return {"depth": depth, "precision": precision, "labels": labels, "cuboids": cuboids}
+
+
+def save_cube(cube, path=CUBE_PATH):
+    arrays = {"depth": np.array(cube["depth"]), "precision": np.array(cube["precision"])}
+    for dim, labels in cube["labels"].items():
+        null = pd.isna(labels)
+        arrays[f"labels.{dim}"] = np.where(null, "", labels.astype(str))
+        arrays[f"label_null.{dim}"] = null
+    for dims, cuboid in cube["cuboids"].items():
+        for key, values in cuboid.items():
+            arrays[f"{_cuboid_name(dims)}.{key}"] = values
+    tmp_path = f"{path}.tmp.npz"
+    np.savez_compressed(tmp_path, **arrays)
+    os.replace(tmp_path, path)  # Readers never see a half-written cube
+
+
+def load_cube(path=CUBE_PATH):
+    with np.load(path) as data:
+        labels = {}
+        for dim in CUBE_DIMENSIONS:
+            labels[dim] = data[f"labels.{dim}"].astype(object)
+            labels[dim][data[f"label_null.{dim}"]] = None
+        depth = int(data["depth"])
+        cuboids = {}
+        for n in range(depth + 1):
+            for dims in combinations(CUBE_DIMENSIONS, n):
+                name = _cuboid_name(dims)
+                cuboids[dims] = {key: data[f"{name}.{key}"] for key in ["cells", *SUMMED_MEASURES, "registers"]}
+        return {"depth": depth, "precision": int(data["precision"]), "labels": labels, "cuboids": cuboids}
+
+
+def run_cube_build(path=CUBE_PATH):
+    """Pipeline stage: rebuilds the cube file from the staged star schema."""
+    cube = build_cube()
+    save_cube(cube, path)
+    groups = sum(len(cuboid["cells"]) for cuboid in cube["cuboids"].values())
+    print(f"Cube built: {len(cube['cuboids'])} cuboids, {groups:,} groups -> {path}")
+
+
+# --- Querying ---
+_lock = threading.Lock()
+_state = {"cube": None, "mtime": None, "deep_cuboids": {}}
+
+
+def get_cube(path=CUBE_PATH):
+    """Returns the process-wide cube, reloading it when the cube file is rebuilt."""
+    mtime = os.path.getmtime(path)
+    with _lock:
+        if _state["cube"] is None or mtime != _state["mtime"]:
+            _state["cube"] = load_cube(path)
+            _state["mtime"] = mtime
+            _state["deep_cuboids"] = {}
+        return _state["cube"]
+
+
+def _cuboid(cube, dims):
+    """The stored cuboid over `dims`, or one built on demand for combinations deeper than the cube."""
+    if dims in cube["cuboids"]:
+        return cube["cuboids"][dims]
+    with _lock:
+        cuboid = _state["deep_cuboids"].get(dims)
+    if cuboid is None:
+        # Beyond the stored lattice: aggregate the staged visits once and keep the result
+        rows, _ = _fact_rows(get_star_schema(), cube["precision"])
+        sizes = {dim: len(labels) for dim, labels in cube["labels"].items()}
+        cuboid = _build_cuboid(rows, dims, sizes, cube["precision"])
+        with _lock:
+            _state["deep_cuboids"][dims] = cuboid
+    return cuboid
+
+
+def _cell_mask(cube, dims, cuboid, filters):
+    """Groups of a cuboid matching every {dimension: value or list of values} filter."""
+    mask = np.ones(len(cuboid["cells"]), dtype=bool)
+    for dim, wanted in (filters or {}).items():
+        wanted = wanted if isinstance(wanted, (list, tuple, set)) else [wanted]
+        member_codes = [code for code, label in enumerate(cube["labels"][dim]) if label in wanted]
+        mask &= np.isin(cuboid["cells"][:, dims.index(dim)], member_codes)
+    return mask
+
+
+def _roll_up(cube, dims, cuboid, group_by, mask):
+    """Aggregates the selected groups of a cuboid over `dims` to the `group_by` cuboid."""
+    selected = np.flatnonzero(mask)
+    positions = [dims.index(dim) for dim in group_by]
+    sizes = [len(cube["labels"][dim]) for dim in group_by]
+    group_of_cell, groups = _group_rows(cuboid["cells"][selected][:, positions].astype(np.int64), sizes, len(selected))
+    n_groups = len(groups)
+
+    result = {dim: cube["labels"][dim][groups[:, i]] for i, dim in enumerate(group_by)}
+    for measure in SUMMED_MEASURES:
+        result[measure] = np.bincount(group_of_cell, weights=cuboid[measure][selected], minlength=n_groups)
+
+    # Distinct patients: the union of the member groups' sketches is their register-wise max
+    registers = np.zeros((n_groups, cuboid["registers"].shape[1]), dtype=np.uint8)
+    if len(selected):
+        order = np.argsort(group_of_cell, kind="stable")
+        starts = np.flatnonzero(np.r_[True, np.diff(group_of_cell[order]) != 0])
+        merged = np.maximum.reduceat(cuboid["registers"][selected[order]], starts, axis=0)
+        registers[group_of_cell[order][starts]] = merged
+    result["patients"] = estimate_counts(registers)
+
+    df = pd.DataFrame(result)
+    df["visits"] = df["visits"].astype(np.int64)
+    df["billed_visits"] = df["billed_visits"].astype(np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        df["avg_bill"] = df["revenue"] / df["billed_visits"]
+    return df
+
+
+def query_cube(group_by=(), filters=None):
+    """Answers a roll-up, slice or drill-down from the cube without touching the fact table.
+
+    `group_by` lists cube dimensions to keep (an empty list rolls up to the grand
+    total); `filters` slices the cube, e.g. {"gender": "Female", "month": ["2021-01", "2021-02"]}.
+    Drilling down is adding a dimension to `group_by`. The query is answered from the
+    cuboid over its grouped and filtered dimensions; combinations of more than
+    CUBE_DEPTH dimensions are aggregated from the staged visits on first use.
+    Returns one row per group with revenue, visits, billed_visits, patients
+    (estimated distinct count) and avg_bill.
+    """
+    group_by = tuple(group_by)
+    unknown = set(group_by) | set(filters or {})
+    unknown -= set(CUBE_DIMENSIONS)
+    if unknown:
+        raise ValueError(f"Unknown cube dimensions: {sorted(unknown)}")
+
+    # Hashable arguments for the result cache; the cube file's mtime retires results of an older cube
+    filters = tuple(sorted(
+        (dim, tuple(wanted) if isinstance(wanted, (list, tuple, set)) else (wanted,))
+        for dim, wanted in (filters or {}).items()
+    ))
+    return _query_cube(group_by, filters, os.path.getmtime(CUBE_PATH))
+
+
+@cached_query
+def _query_cube(group_by, filters, cube_mtime):
+    cube = get_cube()
+    filters = dict(filters)
+    dims = tuple(dim for dim in CUBE_DIMENSIONS if dim in group_by or dim in filters)
+    cuboid = _cuboid(cube, dims)
+    df = _roll_up(cube, dims, cuboid, group_by, _cell_mask(cube, dims, cuboid, filters))
+    return df.sort_values(list(group_by), ignore_index=True) if group_by else df
+
+
+# Build the cube from the staged files (run from the project root: python -m etl.cube)
+if __name__ == "__main__":
+    run_cube_build()
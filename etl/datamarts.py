@@ -1,27 +1,13 @@
 import pymysql
-import pandas as pd
-from dotenv import load_dotenv
-import os
-
-load_dotenv()
-
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
-
-# --- Database Connection ---
-def connect_db():
-    """Establishes a connection to the MySQL database."""
-    return pymysql.connect(
-        host=Host,       
-        user=User,            
-        password=Password,     
-        database=Database,
-        cursorclass=pymysql.cursors.DictCursor
-    )
+
+from etl.cache import cached_query
+from etl.db import get_connection, run_query
+from etl.filters import compile_filters
 
 # --- Data Mart Queries ---
+# `{where}` is filled by build_mart_query(): empty for a full build, a key filter for refreshes.
+# Every selected dimension column is grouped explicitly so the SQL also runs on engines
+# without MySQL's functional-dependency GROUP BY (see embedded.py).
 DATAMART_QUERIES = {
     "patient_data_mart": """
         SELECT 
@@ -38,7 +24,9 @@ DATAMART_QUERIES = {
             AVG(hvf.total_bill) AS avg_bill
         FROM patient_dim pd
         JOIN hospital_visits_fact hvf ON pd.patient_id = hvf.patient_id
-        GROUP BY pd.patient_id;
+        {where}
+        GROUP BY pd.patient_id, pd.name, pd.age, pd.gender, pd.location, pd.blood_type,
+                 pd.smoker_status, pd.alcohol_consumption, pd.exercise_frequency;
     """,
 
     "financial_data_mart": """
@@ -52,7 +40,9 @@ DATAMART_QUERIES = {
             SUM(hvf.total_bill) AS total_revenue_per_hospital
         FROM hospital_visits_fact hvf
         JOIN billing_dim hf ON hvf.billing_id = hf.billing_id
-        GROUP BY hvf.hospital_id, hf.billing_id;
+        {where}
+        GROUP BY hvf.hospital_id, hf.billing_id, hf.total_bill, hf.insurance_type,
+                 hf.claim_status, hf.payment_method;
     """,
 
     "doctor_performance_data_mart": """
@@ -65,7 +55,8 @@ DATAMART_QUERIES = {
             AVG(hvf.total_bill) AS avg_bill_per_patient
         FROM doctor_dim dd
         JOIN hospital_visits_fact hvf ON dd.doctor_id = hvf.doctor_id
-        GROUP BY dd.doctor_id;
+        {where}
+        GROUP BY dd.doctor_id, dd.doctor_name, dd.specialization, dd.years_of_experience;
     """,
 
     "disease_analytics_data_mart": """
@@ -78,30 +69,235 @@ DATAMART_QUERIES = {
             AVG(hvf.total_bill) AS avg_treatment_cost
         FROM disease_dim dd
         JOIN hospital_visits_fact hvf ON dd.disease_id = hvf.disease_id
-        GROUP BY dd.disease_id;
+        {where}
+        GROUP BY dd.disease_id, dd.disease_name, dd.category, dd.severity_level;
     """
 }
 
-# --- Functions to Fetch Data ---
-def run_query(query):
-    """Executes SQL query and returns a Pandas DataFrame."""
-    conn = connect_db()
-    try:
+# --- Materialized Data Marts ---
+# Each mart is persisted as a table keyed by its GROUP BY columns. `refresh_key`
+# is the fact column whose new values identify the groups a fact load touches.
+MATERIALIZED_MARTS = {
+    "patient_data_mart": {"primary_key": ["patient_id"], "refresh_key": "patient_id"},
+    "financial_data_mart": {"primary_key": ["hospital_id", "billing_id"], "refresh_key": "billing_id"},
+    "doctor_performance_data_mart": {"primary_key": ["doctor_id"], "refresh_key": "doctor_id"},
+    "disease_analytics_data_mart": {"primary_key": ["disease_id"], "refresh_key": "disease_id"},
+}
+
+REFRESH_BATCH_SIZE = 1000  # keys per DELETE/INSERT round trip
+
+
+def build_mart_query(name, where=""):
+    """Renders a data mart query with an optional WHERE clause."""
+    return DATAMART_QUERIES[name].format(where=where)
+
+
+def build_filtered_mart_query(name, filters):
+    """The mart's live query over the visits in a dashboard slice; returns (sql, params)."""
+    where, params = compile_filters(filters, alias="hvf")
+    return build_mart_query(name, f"WHERE {where}"), params
+
+
+def _table_exists(cursor, table):
+    cursor.execute("SHOW TABLES LIKE %s", (table,))
+    return cursor.fetchone() is not None
+
+
+def rebuild_data_mart(name):
+    """Rebuilds one mart table from scratch and swaps it in atomically."""
+    spec = MATERIALIZED_MARTS[name]
+    staging = f"{name}_rebuild"
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute(query)
-            df = pd.DataFrame(cursor.fetchall())
-            return df
-    finally:
-        conn.close()
+            cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+            cursor.execute(f"CREATE TABLE {staging} AS {build_mart_query(name)}")
+            cursor.execute(f"ALTER TABLE {staging} ADD PRIMARY KEY ({', '.join(spec['primary_key'])})")
+
+            if _table_exists(cursor, name):
+                cursor.execute(f"RENAME TABLE {name} TO {name}_old, {staging} TO {name}")
+                cursor.execute(f"DROP TABLE {name}_old")
+            else:
+                cursor.execute(f"RENAME TABLE {staging} TO {name}")
+    print(f"Rebuilt data mart {name}")
+
+
+def rebuild_data_marts():
+    for name in MATERIALIZED_MARTS:
+        rebuild_data_mart(name)
+
+
+def refresh_data_marts(new_facts):
+    """Recomputes only the mart groups touched by newly loaded fact rows.
+
+    `new_facts` is the DataFrame that was appended to hospital_visits_fact. For each
+    mart the affected keys are deleted and re-aggregated from the fact table in
+    batches, one transaction per batch. Marts that do not exist yet are built in full.
+    """
+    for name, spec in MATERIALIZED_MARTS.items():
+        refresh_key = spec["refresh_key"]
+        keys = new_facts[refresh_key].dropna().unique().tolist()
+        if not keys:
+            continue
+
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                exists = _table_exists(cursor, name)
+        if not exists:
+            rebuild_data_mart(name)
+            continue
+
+        with get_connection() as conn:
+            for start in range(0, len(keys), REFRESH_BATCH_SIZE):
+                batch = keys[start:start + REFRESH_BATCH_SIZE]
+                placeholders = ", ".join(["%s"] * len(batch))
+                conn.begin()
+                try:
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"DELETE FROM {name} WHERE {refresh_key} IN ({placeholders})", batch)
+                        where = f"WHERE hvf.{refresh_key} IN ({placeholders})"
+                        cursor.execute(f"INSERT INTO {name} {build_mart_query(name, where)}", batch)
+                    conn.commit()
+                except pymysql.MySQLError:
+                    conn.rollback()
+                    raise
+        print(f"Refreshed {len(keys)} {refresh_key} groups in {name}")
+
+
+def read_data_mart(name, filters=None):
+    """Reads a materialized mart, falling back to the live query before the first build.
+
+    Marts hold all-time aggregates, so a filtered view is computed live over its slice.
+    """
+    if filters:
+        return run_query(*build_filtered_mart_query(name, filters), name=name)
+    try:
+        return run_query(f"SELECT * FROM {name}", name=name)
+    except pymysql.err.ProgrammingError:
+        return run_query(build_mart_query(name), name=name)
+
+
+# --- Paged and Aggregated Access ---
+# Push-down aggregates over the mart tables; `{mart}` is the mart table (or its live query)
+MART_AGGREGATES = {
+    "smoker_status": ("patient_data_mart", """
+        SELECT COALESCE(smoker_status, 'Unknown') AS smoker_status, COUNT(*) AS count
+        FROM {mart}
+        GROUP BY COALESCE(smoker_status, 'Unknown');
+    """),
+    "alcohol_consumption": ("patient_data_mart", """
+        SELECT COALESCE(alcohol_consumption, 'Unknown') AS alcohol_consumption, COUNT(*) AS count
+        FROM {mart}
+        GROUP BY COALESCE(alcohol_consumption, 'Unknown');
+    """),
+    "exercise_frequency": ("patient_data_mart", """
+        SELECT COALESCE(exercise_frequency, 'Unknown') AS exercise_frequency, COUNT(*) AS count
+        FROM {mart}
+        GROUP BY COALESCE(exercise_frequency, 'Unknown');
+    """),
+    "claim_status": ("financial_data_mart", """
+        SELECT claim_status, COUNT(*) AS count
+        FROM {mart}
+        WHERE claim_status IS NOT NULL
+        GROUP BY claim_status;
+    """),
+    "avg_bill_by_payment_method": ("financial_data_mart", """
+        SELECT payment_method, AVG(total_bill) AS average_bill
+        FROM {mart}
+        WHERE payment_method IS NOT NULL
+        GROUP BY payment_method;
+    """),
+}
+
+MART_PAGE_SIZE = 100  # default rows per page
+
+
+def _run_on_mart(name, template, params=None, query_name=None, filters=None):
+    """Runs `template` against the mart table, or its live query before the first build or for a slice."""
+    if filters:
+        live, filter_params = build_filtered_mart_query(name, filters)
+        live = f"({live.strip().rstrip(';')}) AS live_mart"
+        return run_query(template.format(mart=live), [*filter_params, *(params or [])], name=query_name)
+    try:
+        return run_query(template.format(mart=name), params, name=query_name)
+    except pymysql.err.ProgrammingError:
+        live = f"({build_mart_query(name).strip().rstrip(';')}) AS live_mart"
+        return run_query(template.format(mart=live), params, name=query_name)
+
+
+def _keyset_condition(key_columns):
+    """WHERE clause selecting rows after a key tuple: (a, b) > (%s, %s), spelled out for every engine."""
+    terms = []
+    for i, column in enumerate(key_columns):
+        equal = [f"{previous} = %s" for previous in key_columns[:i]]
+        terms.append("(" + " AND ".join([*equal, f"{column} > %s"]) + ")")
+    return "WHERE " + " OR ".join(terms)
+
+
+def read_mart_page(name, columns=None, after=None, limit=MART_PAGE_SIZE, filters=None):
+    """Reads one page of a mart in primary-key order (keyset pagination).
+
+    Only `columns` (plus the key) are transferred. `after` is the key tuple of the
+    last row already shown (None for the first page). Returns (rows, next_after),
+    where next_after is None on the last page. Each page is an index range scan on
+    the mart's primary key, however deep into the mart it is (with `filters`, the
+    slice's live mart is paged instead).
+    """
+    key_columns = MATERIALIZED_MARTS[name]["primary_key"]
+    selected = list(dict.fromkeys([*key_columns, *(columns or [])])) if columns else ["*"]
+    if not all(column == "*" or column.isidentifier() for column in selected):
+        raise ValueError(f"Invalid column list {columns!r}")
+
+    where, params = "", None
+    if after is not None:
+        after = tuple(after)
+        where = _keyset_condition(key_columns)
+        params = [value for i in range(len(key_columns)) for value in (*after[:i], after[i])]
+    template = (
+        f"SELECT {', '.join(selected)} FROM {{mart}} {where} "
+        f"ORDER BY {', '.join(key_columns)} LIMIT {int(limit)}"
+    )
+    rows = _run_on_mart(name, template, params, query_name=f"{name}_page", filters=filters)
+    if len(rows) < limit:
+        return rows, None
+    last = rows.iloc[-1]
+    return rows, tuple(last[column].item() if hasattr(last[column], "item") else last[column] for column in key_columns)
+
+
+# --- Functions to Fetch Data ---
+@cached_query
+def get_patient_data_mart(filters=None):
+    return read_data_mart("patient_data_mart", filters)
+
+@cached_query
+def get_financial_data_mart(filters=None):
+    return read_data_mart("financial_data_mart", filters)
+
+@cached_query
+def get_doctor_data_mart(filters=None):
+    return read_data_mart("doctor_performance_data_mart", filters)
+
+@cached_query
+def get_disease_data_mart(filters=None):
+    return read_data_mart("disease_analytics_data_mart", filters)
+
+
+@cached_query
+def get_mart_page(name, columns=None, after=None, limit=MART_PAGE_SIZE, filters=None):
+    """Cached read_mart_page(); `columns` and `after` must be tuples."""
+    return read_mart_page(name, columns, after, limit, filters)
 
-def get_patient_data_mart():
-    return run_query(DATAMART_QUERIES["patient_data_mart"])
+@cached_query
+def get_mart_aggregate(aggregate, filters=None):
+    mart, template = MART_AGGREGATES[aggregate]
+    return _run_on_mart(mart, template, query_name=aggregate, filters=filters)
 
-def get_financial_data_mart():
-    return run_query(DATAMART_QUERIES["financial_data_mart"])
+@cached_query
+def get_mart_row_count(name, filters=None):
+    template = "SELECT COUNT(*) AS row_count FROM {mart}"
+    return int(_run_on_mart(name, template, query_name=f"{name}_count", filters=filters)["row_count"][0])
 
-def get_doctor_data_mart():
-    return run_query(DATAMART_QUERIES["doctor_performance_data_mart"])
 
-def get_disease_data_mart():
-    return run_query(DATAMART_QUERIES["disease_analytics_data_mart"])
+# Build every mart table from scratch (run from the project root: python -m etl.datamarts)
+if __name__ == "__main__":
+    rebuild_data_marts()
+    print("All data marts materialized!")
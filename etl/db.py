@@ -0,0 +1,154 @@
+import threading
+import time
+from contextlib import contextmanager
+from queue import Empty, LifoQueue
+
+import pymysql
+import pandas as pd
+from dotenv import load_dotenv
+import os
+
+from etl.metrics import observe, record_error, record_query
+
+load_dotenv()
+
+Host=os.getenv('host')
+User=os.getenv('user')
+Password=os.getenv('password')
+Database=os.getenv('database')
+
+# --- Backend Selection ---
+# "mysql" queries the warehouse server; "duckdb" runs the same SQL in-process over
+# the staged Data/cleaned_* files (see embedded.py)
+DB_BACKEND = os.getenv('db_backend', 'mysql')
+DB_BACKENDS = ("mysql", "duckdb")
+
+# --- Pool Settings ---
+POOL_SIZE = int(os.getenv('pool_size', 5))                  # max open connections
+POOL_TIMEOUT = float(os.getenv('pool_timeout', 10))         # seconds to wait for a free connection
+POOL_IDLE_TIMEOUT = float(os.getenv('pool_idle_timeout', 300))  # evict connections idle longer than this
+
+DB_CONFIG = {
+        "host": Host,
+        "user":User,
+        "password":Password,
+        "database":Database
+}
+
+
+# --- Connection Pool ---
+_idle = LifoQueue()  # (connection, last_used) pairs; LIFO keeps the warmest connection on top
+_slots = threading.BoundedSemaphore(POOL_SIZE)
+
+
+def _open_connection():
+    """Opens a new MySQL connection returning rows as dictionaries."""
+    return pymysql.connect(**DB_CONFIG, cursorclass=pymysql.cursors.DictCursor, autocommit=True)
+
+
+def _close_quietly(conn):
+    try:
+        conn.close()
+    except pymysql.MySQLError:
+        pass
+
+
+def _checkout():
+    """Returns a healthy connection, reusing an idle one when possible."""
+    if not _slots.acquire(timeout=POOL_TIMEOUT):
+        error = TimeoutError(f"No database connection available within {POOL_TIMEOUT}s (pool_size={POOL_SIZE})")
+        record_error("connection_pool", error)
+        raise error
+    try:
+        while True:
+            try:
+                conn, last_used = _idle.get_nowait()
+            except Empty:
+                try:
+                    return _open_connection()
+                except pymysql.MySQLError as e:
+                    record_error("connect", e)
+                    raise
+
+            if time.monotonic() - last_used > POOL_IDLE_TIMEOUT:
+                _close_quietly(conn)
+                continue
+
+            # Pre-ping: drop connections the server has already closed
+            try:
+                conn.ping(reconnect=False)
+                return conn
+            except pymysql.MySQLError:
+                _close_quietly(conn)
+    except BaseException:
+        _slots.release()
+        raise
+
+
+def _checkin(conn, broken=False):
+    try:
+        if broken:
+            _close_quietly(conn)
+        else:
+            _idle.put((conn, time.monotonic()))
+    finally:
+        _slots.release()
+
+
+@contextmanager
+def get_connection():
+    """Borrows a pooled connection for the duration of a `with` block."""
+    started = time.perf_counter()
+    conn = _checkout()
+    observe("etl_connection_acquire_seconds", time.perf_counter() - started)
+    broken = False
+    try:
+        yield conn
+    except (pymysql.OperationalError, pymysql.InterfaceError):
+        broken = True
+        raise
+    finally:
+        _checkin(conn, broken)
+
+
+def close_pool():
+    """Closes every idle connection held by the pool."""
+    while True:
+        try:
+            conn, _ = _idle.get_nowait()
+        except Empty:
+            return
+        _close_quietly(conn)
+
+
+# --- Query Execution ---
+def run_query(query, params=None, name=None, backend=None):
+    """Executes a SQL query on the configured backend and returns a Pandas DataFrame."""
+    backend = backend or DB_BACKEND
+    if backend not in DB_BACKENDS:
+        raise ValueError(f"Unknown db_backend {backend!r}; expected one of {DB_BACKENDS}")
+
+    started = time.perf_counter()
+    if backend == "duckdb":
+        from etl.embedded import run_query as run_embedded_query
+
+        df = run_embedded_query(query, params)
+        record_query(name or " ".join(query.split())[:80], query, params, backend, time.perf_counter() - started, df)
+        return df
+
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query, params)
+            result = cursor.fetchall()
+            if result:
+                df = pd.DataFrame(result)
+            else:
+                columns = [col[0] for col in cursor.description] if cursor.description else []
+                df = pd.DataFrame(columns=columns)  # Empty DataFrame with correct column names
+    record_query(name or " ".join(query.split())[:80], query, params, backend, time.perf_counter() - started, df)
+    return df
+
+
+def run_scalar(query, column, params=None, name=None):
+    """Executes a single-row query and returns the value of one column."""
+    return run_query(query, params, name)[column][0]
@@ -0,0 +1,105 @@
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from etl.cache import VERSION_CHECK_INTERVAL, get_load_version
+from etl.db import run_query
+
+# --- Cached Dimensions ---
+# The small dimensions the charts only join for labels: dimension -> (key column, attributes).
+# patient_dim and billing_dim grow with the visits and stay in SQL.
+DIMENSIONS = {
+    "disease_dim": ("disease_id", ["disease_name", "category", "severity_level"]),
+    "doctor_dim": ("doctor_id", ["doctor_name", "specialization"]),
+    "hospital_dim": ("hospital_id", ["hospital_name", "city", "type"]),
+}
+
+_lock = threading.Lock()
+_dimensions = {}  # dimension -> Dimension
+_state = {"versions": {}, "checked_at": float("-inf")}
+
+
+class Dimension:
+    """A dimension held as its keys plus one categorical array per attribute.
+
+    Keys are interned in a pd.Index, so resolving fact keys to dimension rows is one
+    hash lookup per distinct key. Attributes keep only their distinct values and a
+    small integer code per row.
+    """
+    __slots__ = ("name", "key", "version", "keys", "attributes")
+
+    def __init__(self, name, rows, version=None):
+        key, columns = DIMENSIONS[name]
+        rows = rows.drop_duplicates(subset=[key])
+        self.name, self.key, self.version = name, key, version
+        self.keys = pd.Index(rows[key].to_numpy())
+        self.attributes = {col: pd.Categorical(rows[col]) for col in columns}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def positions(self, keys):
+        """Dimension row of every key; -1 for keys the dimension does not have."""
+        return self.keys.get_indexer(pd.Index(keys))
+
+    def labels(self, keys, column):
+        """An attribute for fact keys, as an object array (None for unknown keys and NULLs)."""
+        positions = self.positions(keys)
+        values = np.asarray(self.attributes[column], dtype=object)
+        labels = np.where(positions >= 0, values[positions], None)
+        return np.where(pd.isna(labels), None, labels)
+
+
+def load_dimension(name, version=None):
+    key, columns = DIMENSIONS[name]
+    rows = run_query(f"SELECT {', '.join([key, *columns])} FROM {name}", name=f"dimension_{name}")
+    return Dimension(name, rows, version)
+
+
+def _table_version(name):
+    """The dimension's load version, looked up at most every VERSION_CHECK_INTERVAL seconds."""
+    now = time.monotonic()
+    with _lock:
+        stale = now - _state["checked_at"] >= VERSION_CHECK_INTERVAL
+    if stale:
+        versions = dict(get_load_version() or ())
+        with _lock:
+            _state["versions"], _state["checked_at"] = versions, now
+    with _lock:
+        return _state["versions"].get(name)
+
+
+def get_dimension(name):
+    """The process-wide copy of a dimension, reloaded only when its load version changes."""
+    version = _table_version(name)
+    with _lock:
+        dimension = _dimensions.get(name)
+    if dimension is None or dimension.version != version:
+        dimension = load_dimension(name, version)
+        with _lock:
+            _dimensions[name] = dimension
+    return dimension
+
+
+def reset_dimensions():
+    with _lock:
+        _dimensions.clear()
+        _state["checked_at"] = float("-inf")
+
+
+# --- Decorating Fact Aggregates ---
+def group_by_attribute(df, name, column):
+    """Re-aggregates per-key SUM/COUNT rows of a fact query onto a dimension attribute.
+
+    Gives the result of joining the dimension and grouping by `column`: keys missing
+    from the dimension are dropped like an inner join, keys sharing a value are
+    summed, and NULL is a group of its own.
+    """
+    dimension = get_dimension(name)
+    df = df[dimension.positions(df[dimension.key]) >= 0]
+    labels = dimension.labels(df[dimension.key], column)
+    values = df.drop(columns=[dimension.key])
+    grouped = values.groupby(pd.Series(labels, index=df.index, name=column), dropna=False).sum()
+    return grouped.reset_index()
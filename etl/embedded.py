@@ -0,0 +1,122 @@
+import re
+import threading
+import time
+
+import pandas as pd
+
+from etl.staging import DATA_DIR, STAGING_FORMAT, resolve_format, staged_version, staging_path
+
+# Warehouse tables served straight from the staged files
+STAGED_TABLES = [
+    "patient_dim", "disease_dim", "doctor_dim", "hospital_dim", "billing_dim", "hospital_visits_fact",
+]
+
+_lock = threading.Lock()
+_state = {"connection": None, "version": None}
+
+
+# --- Embedded DuckDB Backend ---
+def _create_connection(data_dir=DATA_DIR, fmt=STAGING_FORMAT):
+    """Opens an in-process DuckDB database holding a columnar copy of every staged file."""
+    import duckdb
+
+    from etl.datamarts import DATAMART_QUERIES, build_mart_query
+
+    conn = duckdb.connect(database=":memory:")
+    for table in STAGED_TABLES:
+        table_fmt = resolve_format(table, fmt, data_dir)
+        path = staging_path(table, table_fmt, data_dir).replace("'", "''")
+        reader = f"read_parquet('{path}')" if table_fmt == "parquet" else f"read_csv_auto('{path}')"
+        conn.execute(f"CREATE TABLE {table} AS SELECT * FROM {reader}")
+
+    # Fact files staged before visit_month existed get the month bucket computed here
+    fact_columns = [row[0] for row in conn.execute("DESCRIBE hospital_visits_fact").fetchall()]
+    if "visit_month" not in fact_columns:
+        conn.execute("ALTER TABLE hospital_visits_fact ADD COLUMN visit_month INTEGER")
+        conn.execute(
+            "UPDATE hospital_visits_fact SET visit_month = COALESCE(year(visit_date) * 100 + month(visit_date), 0)"
+        )
+
+    # Data marts are views here; there is no load step to materialize them
+    for name in DATAMART_QUERIES:
+        conn.execute(f"CREATE VIEW {name} AS {build_mart_query(name).strip().rstrip(';')}")
+    return conn
+
+
+def get_embedded_connection():
+    """Returns the shared in-process database, reloading it when a staged file changed."""
+    version = get_load_version()
+    with _lock:
+        if _state["connection"] is None or version != _state["version"]:
+            if _state["connection"] is not None:
+                _state["connection"].close()
+            _state["connection"] = _create_connection()
+            _state["version"] = version
+        return _state["connection"]
+
+
+def reset_embedded_connection():
+    """Drops the in-process database so the next query re-reads the staged files."""
+    with _lock:
+        if _state["connection"] is not None:
+            _state["connection"].close()
+        _state["connection"] = None
+
+
+# MySQL-only syntax used by the query registries -> DuckDB equivalent
+_DIALECT_REWRITES = [
+    (re.compile(r"DATE_FORMAT\(\s*([^,]+?)\s*,\s*('[^']*')\s*\)", re.IGNORECASE), r"strftime(\1, \2)"),
+]
+
+
+def translate(query, params=None):
+    """Rewrites a MySQL/pymysql query into DuckDB SQL with `?` placeholders."""
+    for pattern, replacement in _DIALECT_REWRITES:
+        query = pattern.sub(replacement, query)
+    if params is not None:
+        query = query.replace("%s", "?").replace("%%", "%")
+    return query
+
+
+def run_query(query, params=None):
+    """Executes a query in the embedded engine and returns a Pandas DataFrame."""
+    conn = get_embedded_connection()
+    with _lock:  # DuckDB connections are not safe for concurrent use
+        return conn.execute(translate(query, params), list(params) if params else []).df()
+
+
+def get_load_version(data_dir=DATA_DIR):
+    """Staged file modification times stand in for the MySQL load-version table."""
+    return staged_version(STAGED_TABLES, data_dir=data_dir)
+
+
+# --- Side-by-Side Comparison ---
+def compare_backends(repeats=3):
+    """Times every registered query on MySQL and on the embedded engine (best of `repeats`)."""
+    from etl import db
+    from etl.index_advisor import registered_queries
+
+    def best_ms(run, query):
+        best = float("inf")
+        for _ in range(repeats):
+            started = time.perf_counter()
+            run(query)
+            best = min(best, time.perf_counter() - started)
+        return best * 1000
+
+    rows = []
+    for name, query in registered_queries().items():
+        rows.append({
+            "query": name,
+            "mysql_ms": best_ms(lambda q: db.run_query(q, backend="mysql"), query),
+            "duckdb_ms": best_ms(run_query, query),
+        })
+    report = pd.DataFrame(rows).set_index("query")
+    report["speedup"] = report["mysql_ms"] / report["duckdb_ms"]
+    return report
+
+
+# Run from the project root: python -m etl.embedded
+if __name__ == "__main__":
+    with pd.option_context("display.width", 200):
+        print(compare_backends())
@@ -0,0 +1,438 @@
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.datamarts import MART_AGGREGATES, MART_PAGE_SIZE, MATERIALIZED_MARTS
+from etl.kpi import TOP_K, KPISnapshot, top_k_spec
+from etl.staging import DATA_DIR, read_staging, staged_version
+
+load_dotenv()
+
+# query_engine=numpy makes app.py answer every getter from this module instead of SQL
+USE_NUMPY_ENGINE = os.getenv('query_engine', 'sql') == 'numpy'
+
+FACT_TABLE = "hospital_visits_fact"
+FACT_COLUMNS = ["visit_id", "patient_id", "disease_id", "billing_id", "visit_date",
+                "hospital_id", "doctor_id", "total_bill"]
+
+# Dimension -> (key column, attribute columns loaded)
+DIM_COLUMNS = {
+    "patient_dim": ("patient_id", ["name", "age", "gender", "location", "blood_type",
+                                   "smoker_status", "alcohol_consumption", "exercise_frequency"]),
+    "disease_dim": ("disease_id", ["disease_name", "category", "severity_level"]),
+    "doctor_dim": ("doctor_id", ["doctor_name", "specialization", "years_of_experience"]),
+    "hospital_dim": ("hospital_id", ["hospital_name", "city", "type"]),
+    "billing_dim": ("billing_id", ["total_bill", "insurance_type", "claim_status", "payment_method"]),
+}
+
+AGE_GROUPS = np.array(["0-18", "19-35", "36-60", "60+"], dtype=object)
+
+
+# --- In-Memory Star Schema ---
+def _selected(codes, wanted):
+    """Row mask of codes whose value is wanted; code -1 (no value) is never selected."""
+    return np.append(wanted, False)[codes]
+
+
+def _top_k(values, keys, k, descending):
+    """Positions of the k best values, ties broken by key and NaN ranked last.
+
+    np.partition finds the k-th best score in linear time, so only the members that
+    can still make the cut are sorted.
+    """
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    score = np.where(np.isnan(values), np.inf, -values if descending else values)
+    candidates = np.arange(len(score))
+    if k < len(score):
+        candidates = np.flatnonzero(score <= np.partition(score, k - 1)[k - 1])
+    order = np.lexsort((keys[candidates], score[candidates]))
+    return candidates[order[:k]]
+
+
+def _grouped(codes, n_groups, weights=None):
+    """Sums `weights` (or counts rows) per group code; negative codes are skipped."""
+    mask = codes >= 0
+    return np.bincount(codes[mask], weights=None if weights is None else weights[mask], minlength=n_groups)
+
+
+class StarSchema:
+    """The fact table and dimensions held as dictionary-encoded NumPy arrays.
+
+    Every fact foreign key is resolved once to the row position of its dimension
+    record (-1 when there is none, which mirrors an inner join). Grouping by any
+    dimension attribute is then a gather of that attribute's integer codes followed
+    by np.bincount.
+    """
+
+    def __init__(self, fact, dims):
+        self.dims = {}
+        self.rows = {}
+        for dim, (key, _) in DIM_COLUMNS.items():
+            table = dims[dim].drop_duplicates(subset=[key]).reset_index(drop=True)
+            self.dims[dim] = table
+            self.rows[dim] = pd.Index(table[key]).get_indexer(fact[key]).astype(np.int64)
+
+        bill = pd.to_numeric(fact["total_bill"], errors="coerce").to_numpy(dtype=float)
+        self.bill_present = ~np.isnan(bill)
+        self.bill = np.where(self.bill_present, bill, 0.0)
+        self.n_visits = len(fact)
+        self.distinct_visits = int(fact["visit_id"].nunique())
+
+        # Fact keys grouped without a dimension join: (codes, distinct values)
+        self.fact_codes = {}
+        for col in ["patient_id", "hospital_id"]:
+            codes, values = pd.factorize(fact[col])
+            self.fact_codes[col] = (codes.astype(np.int64), np.asarray(values))
+        visit_dates = pd.to_datetime(fact["visit_date"], errors="coerce")
+        self.month_codes, self.months = pd.factorize(visit_dates.dt.strftime("%Y-%m"), sort=True)
+        self.month_codes = self.month_codes.astype(np.int64)
+        self.visit_days = visit_dates.to_numpy(dtype="datetime64[D]")
+        self._attributes = {}
+
+    # --- Dashboard Slices ---
+    def select(self, filters):
+        """A view of the visits in a QueryFilters slice, sharing the dimensions (see filters.py)."""
+        mask = np.ones(self.n_visits, dtype=bool)
+        if filters.start_date is not None:
+            mask &= self.visit_days >= np.datetime64(filters.start_date, "D")
+        if filters.end_date is not None:
+            mask &= self.visit_days <= np.datetime64(filters.end_date, "D")
+        if filters.hospital_ids:
+            codes, values = self.fact_codes["hospital_id"]
+            mask &= _selected(codes, np.isin(values, filters.hospital_ids))
+        if filters.doctor_ids:
+            keys = self.dims["doctor_dim"]["doctor_id"].to_numpy()
+            mask &= _selected(self.rows["doctor_dim"], np.isin(keys, filters.doctor_ids))
+        for dim, column, wanted in [("disease_dim", "category", filters.disease_categories),
+                                    ("billing_dim", "insurance_type", filters.insurance_types)]:
+            if wanted:
+                codes, labels = self.attribute(dim, column)
+                mask &= _selected(codes, np.isin(labels, wanted))
+        return self._subset(mask)
+
+    def _subset(self, mask):
+        view = object.__new__(StarSchema)
+        view.dims = self.dims
+        view.rows = {dim: rows[mask] for dim, rows in self.rows.items()}
+        view.bill, view.bill_present = self.bill[mask], self.bill_present[mask]
+        view.n_visits = int(mask.sum())
+        view.distinct_visits = view.n_visits  # visit_id is the fact's primary key
+        view.fact_codes = {col: (codes[mask], values) for col, (codes, values) in self.fact_codes.items()}
+        view.month_codes, view.months = self.month_codes[mask], self.months
+        view.visit_days = self.visit_days[mask]
+        view._attributes = {key: (codes[mask], labels) for key, (codes, labels) in self._attributes.items()}
+        return view
+
+    def attribute(self, dim, column):
+        """Returns (codes per fact row, labels) for a dimension attribute; NULL is its own group."""
+        if (dim, column) not in self._attributes:
+            dim_codes, labels = pd.factorize(self.dims[dim][column], sort=True, use_na_sentinel=False)
+            rows = self.rows[dim]
+            fact_codes = np.where(rows >= 0, dim_codes[rows], -1).astype(np.int64)
+            self._attributes[dim, column] = (fact_codes, np.asarray(labels, dtype=object))
+        return self._attributes[dim, column]
+
+    def age_groups(self):
+        if ("patient_dim", "age_group") not in self._attributes:
+            age = pd.to_numeric(self.dims["patient_dim"]["age"], errors="coerce").to_numpy()
+            # Same buckets as the SQL CASE; NULL ages fall into ELSE '60+'
+            dim_codes = np.select([age <= 18, age <= 35, age <= 60], [0, 1, 2], default=3)
+            dim_codes[age < 0] = 3
+            rows = self.rows["patient_dim"]
+            fact_codes = np.where(rows >= 0, dim_codes[rows], -1).astype(np.int64)
+            self._attributes["patient_dim", "age_group"] = (fact_codes, AGE_GROUPS)
+        return self._attributes["patient_dim", "age_group"]
+
+    # --- Grouped Reductions ---
+    def group_sum(self, codes, labels, label_name, value_name):
+        visits = _grouped(codes, len(labels))
+        sums = _grouped(codes, len(labels), self.bill)
+        billed = _grouped(np.where(self.bill_present, codes, -1), len(labels))
+        sums = np.where(billed > 0, sums, np.nan)  # SUM over only NULL bills is NULL
+        present = visits > 0
+        return pd.DataFrame({label_name: labels[present], value_name: sums[present]})
+
+    def group_count(self, codes, labels, label_name, value_name):
+        visits = _grouped(codes, len(labels))
+        present = visits > 0
+        return pd.DataFrame({label_name: labels[present], value_name: visits[present]})
+
+    def group_distinct(self, codes, labels, values, label_name, value_name):
+        """COUNT(DISTINCT values) per group via unique (group, value) pairs."""
+        mask = (codes >= 0) & (values >= 0)
+        pairs = np.unique(codes[mask] * (values.max(initial=0) + 1) + values[mask])
+        distinct = np.bincount(pairs // (values.max(initial=0) + 1), minlength=len(labels))
+        present = _grouped(codes, len(labels)) > 0
+        return pd.DataFrame({label_name: labels[present], value_name: distinct[present]})
+
+    def mart(self, dim, count_name, avg_name):
+        """One row per dimension record with visits: its attributes, visit count and average bill."""
+        rows = self.rows[dim]
+        n = len(self.dims[dim])
+        visits = _grouped(rows, n)
+        billed = _grouped(np.where(self.bill_present, rows, -1), n)
+        sums = _grouped(rows, n, self.bill)
+        present = visits > 0
+        key, attributes = DIM_COLUMNS[dim]
+        df = self.dims[dim].loc[present, [key, *attributes]].reset_index(drop=True)
+        df[count_name] = visits[present]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            df[avg_name] = sums[present] / billed[present]
+        return df
+
+
+_lock = threading.Lock()
+_state = {"schema": None, "version": None, "slices": {}}
+
+
+def load_star_schema(data_dir=DATA_DIR):
+    fact = read_staging(FACT_TABLE, columns=FACT_COLUMNS, data_dir=data_dir)
+    dims = {
+        dim: read_staging(dim, columns=[key, *attributes], data_dir=data_dir)
+        for dim, (key, attributes) in DIM_COLUMNS.items()
+    }
+    return StarSchema(fact, dims)
+
+
+def get_star_schema():
+    """Returns the process-wide arrays, reloading them when a staged file changed."""
+    version = staged_version([FACT_TABLE, *DIM_COLUMNS])
+    with _lock:
+        if _state["schema"] is None or version != _state["version"]:
+            _state["schema"] = load_star_schema()
+            _state["version"] = version
+            _state["slices"] = {}
+        return _state["schema"]
+
+
+def _schema(filters=None):
+    """The star schema, or its view of a dashboard slice (the last few are kept)."""
+    schema = get_star_schema()
+    if not filters:
+        return schema
+    with _lock:
+        view = _state["slices"].get(filters)
+    if view is None:
+        view = schema.select(filters)
+        with _lock:
+            if len(_state["slices"]) >= 8:
+                _state["slices"].pop(next(iter(_state["slices"])))
+            _state["slices"][filters] = view
+    return view
+
+
+def get_filter_options():
+    """Values the dashboard filters offer, as filters.get_filter_options() returns them."""
+    s = get_star_schema()
+    days = s.visit_days[~np.isnat(s.visit_days)]
+    return {
+        "hospitals": s.dims["hospital_dim"][["hospital_id", "hospital_name"]].sort_values(["hospital_name", "hospital_id"]),
+        "doctors": s.dims["doctor_dim"][["doctor_id", "doctor_name"]].sort_values(["doctor_name", "doctor_id"]),
+        "disease_categories": pd.DataFrame({"category": sorted(s.dims["disease_dim"]["category"].dropna().unique())}),
+        "insurance_types": pd.DataFrame({"insurance_type": sorted(s.dims["billing_dim"]["insurance_type"].dropna().unique())}),
+        "date_range": pd.DataFrame([{"first_date": days.min() if len(days) else None,
+                                     "last_date": days.max() if len(days) else None}]),
+    }
+
+
+# --- KPI Getters ---
+def get_total_revenue(filters=None):
+    s = _schema(filters)
+    return float(s.bill.sum()) if s.bill_present.any() else None  # SUM over only NULL bills is NULL
+
+def get_revenue_by_disease(filters=None):
+    s = _schema(filters)
+    return s.group_sum(*s.attribute("disease_dim", "disease_name"), "disease_name", "total_revenue")
+
+def get_revenue_by_doctor(filters=None):
+    top = get_top_k("doctor", filters=filters)
+    return top[["doctor_name", "revenue", "doctor_id"]].rename(columns={"revenue": "total_revenue"})
+
+def get_revenue_by_hospital(filters=None):
+    top = get_top_k("hospital", filters=filters)
+    return top[["hospital_name", "revenue", "hospital_id"]].rename(columns={"revenue": "total_revenue"})
+
+def get_total_visits(filters=None):
+    return _schema(filters).distinct_visits
+
+def get_avg_revenue_per_visit(filters=None):
+    s = _schema(filters)
+    billed = s.bill_present.sum()
+    return float(s.bill.sum() / billed) if billed else float("nan")
+
+def get_revenue_per_patient(filters=None):
+    top = get_top_k("patient", filters=filters)
+    return top[["name", "revenue", "patient_id"]].rename(columns={"revenue": "revenue_per_patient"})
+
+# visit_id is the fact's primary key, so COUNT(DISTINCT visit_id) per group is a row count
+def get_visits_by_gender(filters=None):
+    s = _schema(filters)
+    return s.group_count(*s.attribute("patient_dim", "gender"), "gender", "total_visits")
+
+def get_visits_by_age_group(filters=None):
+    s = _schema(filters)
+    return s.group_count(*s.age_groups(), "age_group", "total_visits")
+
+def get_claim_status_breakdown(filters=None):
+    if filters:
+        # A slice has no billings of its own: count the claims of its visits
+        return get_kpi_snapshot(filters).claim_status_breakdown
+    billing = get_star_schema().dims["billing_dim"]
+    codes, labels = pd.factorize(billing["claim_status"], sort=True, use_na_sentinel=False)
+    counts = np.bincount(codes, minlength=len(labels))
+    return pd.DataFrame({"claim_status": np.asarray(labels, dtype=object), "total_claims": counts})
+
+def get_revenue_by_insurance_type(filters=None):
+    s = _schema(filters)
+    return s.group_sum(*s.attribute("billing_dim", "insurance_type"), "insurance_type", "total_revenue")
+
+def get_hospital_visits_trend(filters=None):
+    s = _schema(filters)
+    return s.group_count(s.month_codes, np.asarray(s.months, dtype=object), "month", "total_visits")
+
+def get_kpi_snapshot(filters=None):
+    s = _schema(filters)
+    # Claims are the distinct billings referenced by visits, as in the SQL snapshot
+    billing_rows = s.rows["billing_dim"]
+    referenced = np.unique(billing_rows[billing_rows >= 0])
+    claim_codes, claim_labels = pd.factorize(
+        s.dims["billing_dim"]["claim_status"].to_numpy()[referenced], sort=True
+    )
+    claims = np.bincount(claim_codes[claim_codes >= 0], minlength=len(claim_labels))
+    return KPISnapshot(
+        total_revenue=get_total_revenue(filters),
+        total_visits=get_total_visits(filters),
+        avg_revenue_per_visit=get_avg_revenue_per_visit(filters),
+        claim_status_breakdown=pd.DataFrame({"claim_status": np.asarray(claim_labels, dtype=object),
+                                             "total_claims": claims}),
+        revenue_by_insurance_type=get_revenue_by_insurance_type(filters),
+    )
+
+def get_top_k(dimension, metric="revenue", k=TOP_K, descending=True, filters=None):
+    key, table, label = top_k_spec(dimension, metric)
+    s = _schema(filters)
+    rows, members = s.rows[table], s.dims[table]
+    visits = _grouped(rows, len(members))
+    billed = _grouped(rows, len(members), s.bill_present.astype(float))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        revenue = np.where(billed > 0, _grouped(rows, len(members), s.bill), np.nan)
+        avg_bill = revenue / billed
+    values = {"revenue": revenue, "visits": visits.astype(float), "avg_bill": avg_bill}[metric]
+    keys = members[key].to_numpy()
+
+    present = np.flatnonzero(visits > 0)
+    top = present[_top_k(values[present], keys[present], int(k), descending)]
+    return pd.DataFrame({key: keys[top], label: members[label].to_numpy()[top],
+                         "revenue": revenue[top], "visits": visits[top], "avg_bill": avg_bill[top]})
+
+
+
+# --- Aggregation Getters ---
+def get_patient_statistics(filters=None):
+    s = _schema(filters)
+    rows = s.rows["patient_dim"]
+    matched = rows >= 0
+    age = pd.to_numeric(s.dims["patient_dim"]["age"], errors="coerce").to_numpy()[rows[matched]]
+    return pd.DataFrame([{
+        "total_patients": len(np.unique(rows[matched])),
+        "average_age": float(np.nanmean(age)) if len(age) else float("nan"),
+        "total_visits": int(matched.sum()),
+    }])
+
+def get_financial_metrics(filters=None):
+    return pd.DataFrame([{
+        "average_bill_per_visit": get_avg_revenue_per_visit(filters),
+        "total_revenue": get_total_revenue(filters),
+    }])
+
+def get_hospital_revenue(filters=None):
+    s = _schema(filters)
+    return s.group_sum(*s.attribute("hospital_dim", "hospital_name"), "hospital_name", "revenue")
+
+def get_patients_per_doctor(filters=None):
+    s = _schema(filters)
+    codes, labels = s.attribute("doctor_dim", "doctor_name")
+    return s.group_distinct(codes, labels, s.fact_codes["patient_id"][0], "doctor_name", "patient_count")
+
+def get_disease_category_counts(filters=None):
+    s = _schema(filters)
+    return s.group_count(*s.attribute("disease_dim", "category"), "category", "disease_count")
+
+
+# --- Data Mart Getters ---
+def get_patient_data_mart(filters=None):
+    return _schema(filters).mart("patient_dim", "total_visits", "avg_bill")
+
+def get_doctor_data_mart(filters=None):
+    return _schema(filters).mart("doctor_dim", "total_patients_seen", "avg_bill_per_patient")
+
+def get_disease_data_mart(filters=None):
+    return _schema(filters).mart("disease_dim", "total_cases", "avg_treatment_cost")
+
+def get_financial_data_mart(filters=None):
+    s = _schema(filters)
+    billing_rows = s.rows["billing_dim"]
+    hospital_codes, hospital_ids = s.fact_codes["hospital_id"]
+    mask = (billing_rows >= 0) & (hospital_codes >= 0)
+    n_billing = len(s.dims["billing_dim"])
+    groups, inverse = np.unique(hospital_codes[mask] * n_billing + billing_rows[mask], return_inverse=True)
+    revenue = np.bincount(inverse, weights=s.bill[mask], minlength=len(groups))
+    billed = np.bincount(inverse, weights=s.bill_present[mask], minlength=len(groups))
+    revenue = np.where(billed > 0, revenue, np.nan)  # SUM over only NULL bills is NULL
+
+    billing = s.dims["billing_dim"].iloc[groups % n_billing].reset_index(drop=True)
+    billing["hospital_id"] = hospital_ids[groups // n_billing]
+    billing["total_revenue_per_hospital"] = revenue
+    return billing
+
+
+# --- Data Mart Pages and Aggregates ---
+# Mart table -> getter of the same mart, so the Data Marts page never queries SQL
+MART_GETTERS = {
+    "patient_data_mart": get_patient_data_mart,
+    "financial_data_mart": get_financial_data_mart,
+    "doctor_performance_data_mart": get_doctor_data_mart,
+    "disease_analytics_data_mart": get_disease_data_mart,
+}
+
+
+def _mart_rows(name, filters=None):
+    """A mart in primary-key order, as the mart table is paged."""
+    key_columns = MATERIALIZED_MARTS[name]["primary_key"]
+    return MART_GETTERS[name](filters=filters).sort_values(key_columns, ignore_index=True)
+
+
+def get_mart_page(name, columns=None, after=None, limit=MART_PAGE_SIZE, filters=None):
+    """datamarts.read_mart_page() over the in-memory mart: (rows, next_after)."""
+    key_columns = MATERIALIZED_MARTS[name]["primary_key"]
+    df = _mart_rows(name, filters)
+    if after is not None:
+        # (a, b) > after, as the keyset condition spells it out
+        later, equal = np.zeros(len(df), dtype=bool), np.ones(len(df), dtype=bool)
+        for column, value in zip(key_columns, tuple(after)):
+            later |= equal & (df[column].to_numpy() > value)
+            equal &= df[column].to_numpy() == value
+        df = df[later]
+    selected = list(dict.fromkeys([*key_columns, *columns])) if columns else list(df.columns)
+    rows = df[selected].iloc[:int(limit)].reset_index(drop=True)
+    if len(rows) < limit:
+        return rows, None
+    last = rows.iloc[-1]
+    return rows, tuple(last[column].item() if hasattr(last[column], "item") else last[column] for column in key_columns)
+
+def get_mart_aggregate(aggregate, filters=None):
+    mart = MART_GETTERS[MART_AGGREGATES[aggregate][0]](filters=filters)
+    if aggregate == "avg_bill_by_payment_method":
+        rows = mart[mart["payment_method"].notna()].astype({"payment_method": object})
+        return rows.groupby("payment_method")["total_bill"].mean().rename("average_bill").reset_index()
+    values = mart[aggregate].astype(object)
+    # claim_status skips NULL; the lifestyle columns count it as 'Unknown'
+    values = values.dropna() if aggregate == "claim_status" else values.where(values.notna(), "Unknown")
+    return values.value_counts().rename_axis(aggregate).rename("count").reset_index()
+
+def get_mart_row_count(name, filters=None):
+    return len(MART_GETTERS[name](filters=filters))
@@ -0,0 +1,117 @@
+import datetime
+from dataclasses import dataclass
+
+from etl.cache import cached_query
+from etl.db import run_query, run_scalar
+
+FACT_TABLE = "hospital_visits_fact"
+
+
+# --- Dashboard Slices ---
+@dataclass(frozen=True)
+class QueryFilters:
+    """A slice of the visits; empty fields do not restrict. Dates are inclusive.
+
+    Frozen and built from tuples, so a slice is hashable and becomes part of the
+    result-cache key of every getter it is passed to.
+    """
+    start_date: datetime.date = None
+    end_date: datetime.date = None
+    hospital_ids: tuple = ()
+    doctor_ids: tuple = ()
+    disease_categories: tuple = ()
+    insurance_types: tuple = ()
+
+    def __bool__(self):
+        return any([self.start_date, self.end_date, self.hospital_ids, self.doctor_ids,
+                    self.disease_categories, self.insurance_types])
+
+
+def _month(date):
+    return date.year * 100 + date.month
+
+
+def _placeholders(values):
+    return ", ".join(["%s"] * len(values))
+
+
+def compile_filters(filters, alias=None):
+    """Compiles a slice into (conditions on fact rows joined by AND, bound parameters).
+
+    Every condition is on an indexed fact column: dates bound visit_month as well as
+    visit_date, so MySQL prunes the monthly partitions; hospitals and doctors are
+    fact keys; disease categories and insurance types become key lookups in their
+    dimension. Values are always bound, never inlined, so the SQL text only depends
+    on which filters are set and how many values each has. Returns ("", []) for no
+    filters.
+    """
+    if not filters:
+        return "", []
+    prefix = f"{alias}." if alias else ""
+    conditions, params = [], []
+    if filters.start_date is not None:
+        conditions += [f"{prefix}visit_month >= %s", f"{prefix}visit_date >= %s"]
+        params += [_month(filters.start_date), filters.start_date]
+    if filters.end_date is not None:
+        conditions += [f"{prefix}visit_month <= %s", f"{prefix}visit_date <= %s"]
+        params += [_month(filters.end_date), filters.end_date]
+    if filters.hospital_ids:
+        conditions.append(f"{prefix}hospital_id IN ({_placeholders(filters.hospital_ids)})")
+        params += list(filters.hospital_ids)
+    if filters.doctor_ids:
+        conditions.append(f"{prefix}doctor_id IN ({_placeholders(filters.doctor_ids)})")
+        params += list(filters.doctor_ids)
+    if filters.disease_categories:
+        conditions.append(
+            f"{prefix}disease_id IN (SELECT disease_id FROM disease_dim "
+            f"WHERE category IN ({_placeholders(filters.disease_categories)}))"
+        )
+        params += list(filters.disease_categories)
+    if filters.insurance_types:
+        conditions.append(
+            f"{prefix}billing_id IN (SELECT billing_id FROM billing_dim "
+            f"WHERE insurance_type IN ({_placeholders(filters.insurance_types)}))"
+        )
+        params += list(filters.insurance_types)
+    return " AND ".join(conditions), params
+
+
+def render_query(query, filters=None):
+    """Fills a registered query's `{fact}` with the fact table, or the slice of it in `filters`.
+
+    The slice is a derived table, which MySQL merges into the outer query, so its
+    conditions are applied to the fact scan itself. Returns (sql, params or None).
+    """
+    where, params = compile_filters(filters)
+    fact = FACT_TABLE if not where else f"(SELECT * FROM {FACT_TABLE} WHERE {where})"
+    return query.format(fact=fact), params or None
+
+
+def run_filtered(query, filters=None, name=None):
+    sql, params = render_query(query, filters)
+    return run_query(sql, params, name=name)
+
+
+def run_filtered_scalar(query, column, filters=None, name=None):
+    sql, params = render_query(query, filters)
+    return run_scalar(sql, column, params, name=name)
+
+
+# --- Filter Choices ---
+FILTER_OPTION_QUERIES = {
+    "hospitals": "SELECT hospital_id, hospital_name FROM hospital_dim ORDER BY hospital_name, hospital_id",
+    "doctors": "SELECT doctor_id, doctor_name FROM doctor_dim ORDER BY doctor_name, doctor_id",
+    "disease_categories": "SELECT DISTINCT category FROM disease_dim WHERE category IS NOT NULL ORDER BY category",
+    "insurance_types": """
+        SELECT DISTINCT insurance_type FROM billing_dim
+        WHERE insurance_type IS NOT NULL
+        ORDER BY insurance_type
+    """,
+    "date_range": f"SELECT MIN(visit_date) AS first_date, MAX(visit_date) AS last_date FROM {FACT_TABLE}",
+}
+
+
+@cached_query
+def get_filter_options():
+    """Values the dashboard filters offer: {name: DataFrame}."""
+    return {name: run_query(query, name=f"filter_{name}") for name, query in FILTER_OPTION_QUERIES.items()}
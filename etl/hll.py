@@ -0,0 +1,309 @@
+import os
+import zlib
+
+import numpy as np
+import pandas as pd
+import pymysql
+from dotenv import load_dotenv
+
+from etl.cache import cached_query
+from etl.db import DB_BACKEND, get_connection, run_query
+
+load_dotenv()
+
+# --- Sketch Settings ---
+# distinct_mode=approx answers the COUNT(DISTINCT ...) getters from stored sketches
+APPROX_DISTINCT = os.getenv('distinct_mode', 'exact') == 'approx'
+HLL_PRECISION = int(os.getenv('hll_precision', 14))  # 2**p registers; p=14 -> ~0.8% standard error
+SKETCH_FETCH_SIZE = 50_000  # fact rows streamed per round trip when rebuilding
+PATIENT_LOOKUP_BATCH = 1_000  # patient ids per gender/age lookup while loading
+
+SKETCH_TABLE = "distinct_sketches"
+NULL_GROUP = "\\N"  # group key stored for a NULL dimension attribute
+
+# Sketch name -> (grouping column or None for a single total, column counted distinctly)
+DISTINCT_SKETCHES = {
+    "total_visits": (None, "visit_id"),
+    "visits_by_gender": ("gender", "visit_id"),
+    "visits_by_age_group": ("age_group", "visit_id"),
+    "hospital_visits_trend": ("month", "visit_id"),
+    "total_patients": (None, "patient_id"),
+    "patients_per_doctor": ("doctor_id", "patient_id"),
+}
+
+# Groupings by a patient attribute: the exact queries inner-join patient_dim, so
+# visits whose patient has no dimension row are left out of them
+PATIENT_GROUPINGS = {"gender", "age_group"}
+
+
+# --- HyperLogLog ---
+def _hash(values):
+    """64-bit hashes of keys; integers and strings hash the same wherever they were read."""
+    values = np.asarray(values)
+    values = values.astype(np.int64) if values.dtype.kind in "iu" else values.astype(str).astype(object)
+    return pd.util.hash_array(values, categorize=False)
+
+
+def _bit_length(x):
+    """Vectorized int.bit_length() for uint64 arrays."""
+    length = np.zeros(x.shape, dtype=np.uint8)
+    for shift in (32, 16, 8, 4, 2, 1):
+        high = (x >> np.uint64(shift)) > 0
+        x = np.where(high, x >> np.uint64(shift), x)
+        length += high.astype(np.uint8) * np.uint8(shift)
+    return length + (x > 0).astype(np.uint8)
+
+
+def register_updates(values, precision=HLL_PRECISION):
+    """Returns (register index, rank) for every value."""
+    hashes = _hash(values)
+    index = (hashes >> np.uint64(64 - precision)).astype(np.int64)
+    remainder = hashes & np.uint64((1 << (64 - precision)) - 1)
+    rank = np.uint8(64 - precision + 1) - _bit_length(remainder)
+    return index, rank
+
+
+class HyperLogLog:
+    """Mergeable distinct-count sketch: 2**precision one-byte registers.
+
+    The standard error of count() is 1.04 / sqrt(2**precision). Two sketches of the
+    same precision merge with an element-wise max, so the sketch of a union of
+    groups is the merge of the groups' sketches.
+    """
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        if not 4 <= precision <= 18:
+            raise ValueError(f"HyperLogLog precision must be between 4 and 18, got {precision}")
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    @property
+    def relative_error(self):
+        return 1.04 / np.sqrt(len(self.registers))
+
+    def add(self, values):
+        index, rank = register_updates(values, self.precision)
+        np.maximum.at(self.registers, index, rank)
+        return self
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(f"Cannot merge sketches of precision {self.precision} and {other.precision}")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        return int(estimate_counts(self.registers)[0])
+
+    def to_bytes(self):
+        return zlib.compress(self.registers.tobytes())
+
+    @classmethod
+    def from_bytes(cls, data):
+        registers = np.frombuffer(zlib.decompress(data), dtype=np.uint8).copy()
+        return cls(int(np.log2(len(registers))), registers)
+
+
+def estimate_counts(registers):
+    """Distinct-count estimates for a (sketches, 2**precision) register array, one per row."""
+    registers = np.atleast_2d(registers)
+    m = registers.shape[1]
+    alpha = 0.7213 / (1 + 1.079 / m)
+    estimate = alpha * m * m / np.ldexp(1.0, -registers.astype(np.int64)).sum(axis=1)
+    zeros = (registers == 0).sum(axis=1)
+    small = (estimate <= 2.5 * m) & (zeros > 0)
+    # Linear counting for small cardinalities
+    estimate = np.where(small, m * np.log(m / np.maximum(zeros, 1)), estimate)
+    return np.rint(estimate).astype(np.int64)
+
+
+def group_registers(codes, n_groups, index, rank, precision=HLL_PRECISION):
+    """Registers of one sketch per group, from the register updates of rows in group `codes`."""
+    registers = np.zeros((n_groups, 1 << precision), dtype=np.uint8)
+    np.maximum.at(registers, (codes, index), rank)
+    return registers
+
+
+def merged(sketches):
+    """Union sketch of several sketches (None when there are none)."""
+    result = None
+    for sketch in sketches:
+        result = HyperLogLog(sketch.precision, sketch.registers.copy()) if result is None else result.merge(sketch)
+    return result
+
+
+# --- Sketch Maintenance ---
+def _age_group(age):
+    # Same buckets as the SQL CASE; NULL ages fall into ELSE '60+'
+    return np.select([age <= 18, age <= 35, age <= 60], ["0-18", "19-35", "36-60"], default="60+")
+
+
+def _patient_labels(patient_ids):
+    """Gender and age of just these patients, indexed by patient_id."""
+    ids = pd.unique(pd.Series(patient_ids).dropna()).tolist()
+    parts = []
+    for start in range(0, len(ids), PATIENT_LOOKUP_BATCH):
+        batch = ids[start:start + PATIENT_LOOKUP_BATCH]
+        placeholders = ", ".join(["%s"] * len(batch))
+        query = f"SELECT patient_id, gender, age FROM patient_dim WHERE patient_id IN ({placeholders})"
+        parts.append(run_query(query, batch, name="sketch_patient_labels", backend="mysql"))
+    if not parts:
+        return pd.DataFrame(columns=["gender", "age"])
+    return pd.concat(parts).set_index("patient_id")
+
+
+class DistinctSketchBuilder:
+    """Accumulates per-group sketches over fact chunks as they are loaded.
+
+    Chunks carrying `gender`, `age` and `has_patient` (joined in SQL) are used as
+    they are; for the others only the chunk's own patients are looked up in
+    patient_dim.
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.sketches = {name: {} for name in DISTINCT_SKETCHES}
+
+    def _group_keys(self, chunk, column):
+        if column == "month":
+            return pd.to_datetime(chunk["visit_date"]).dt.strftime("%Y-%m")
+        if column == "doctor_id":
+            return chunk["doctor_id"].astype(str)
+        if column == "gender":
+            return chunk["gender"]
+        age = pd.to_numeric(chunk["age"], errors="coerce").to_numpy()
+        return pd.Series(_age_group(age), index=chunk.index)
+
+    def add(self, chunk):
+        if not {"gender", "age", "has_patient"} <= set(chunk.columns):
+            labels = _patient_labels(chunk["patient_id"])
+            patients = labels.reindex(chunk["patient_id"])
+            chunk = chunk.assign(gender=patients["gender"].to_numpy(), age=patients["age"].to_numpy(),
+                                 has_patient=chunk["patient_id"].isin(labels.index).to_numpy())
+        has_patient = chunk["has_patient"].astype(bool).to_numpy()
+        updates = {column: register_updates(chunk[column].to_numpy(), self.precision)
+                   for column in {counted for _, counted in DISTINCT_SKETCHES.values()}}
+        for name, (group_column, counted) in DISTINCT_SKETCHES.items():
+            index, rank = updates[counted]
+            if group_column is None:
+                codes, groups = np.zeros(len(chunk), dtype=np.int64), ["all"]
+            else:
+                keys = pd.Series(self._group_keys(chunk, group_column)).fillna(NULL_GROUP).to_numpy()
+                if group_column in PATIENT_GROUPINGS:
+                    keys, index, rank = keys[has_patient], index[has_patient], rank[has_patient]
+                codes, groups = pd.factorize(keys)
+            registers = group_registers(codes, len(groups), index, rank, self.precision)
+            for group, sketch_registers in zip(groups, registers):
+                sketch = HyperLogLog(self.precision, sketch_registers)
+                existing = self.sketches[name].get(group)
+                self.sketches[name][group] = sketch if existing is None else existing.merge(sketch)
+
+    def save(self, replace=False):
+        """Merges the accumulated sketches into the stored ones (or overwrites them)."""
+        stored = {} if replace else load_sketches.uncached()
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                ensure_sketch_table(cursor)
+                if replace:
+                    cursor.execute(f"DELETE FROM {SKETCH_TABLE}")
+                for name, groups in self.sketches.items():
+                    for group, sketch in groups.items():
+                        previous = stored.get(name, {}).get(group)
+                        if previous is not None:
+                            sketch = sketch.merge(previous)
+                        cursor.execute(
+                            f"REPLACE INTO {SKETCH_TABLE} (sketch_name, group_key, registers) VALUES (%s, %s, %s)",
+                            (name, str(group), sketch.to_bytes())
+                        )
+            conn.commit()
+
+
+def ensure_sketch_table(cursor):
+    cursor.execute(f"""
+        CREATE TABLE IF NOT EXISTS {SKETCH_TABLE} (
+            sketch_name VARCHAR(64) NOT NULL,
+            group_key VARCHAR(64) NOT NULL,
+            registers MEDIUMBLOB NOT NULL,
+            PRIMARY KEY (sketch_name, group_key)
+        );
+    """)
+
+
+def rebuild_distinct_sketches(precision=HLL_PRECISION):
+    """Recomputes every sketch from the loaded fact table (e.g. after changing the precision)."""
+    builder = DistinctSketchBuilder(precision)
+    with get_connection() as conn:
+        with conn.cursor(pymysql.cursors.SSCursor) as cursor:
+            # Patient labels come with the visits, so the builder never looks them up
+            cursor.execute("""
+                SELECT hvf.visit_id, hvf.patient_id, hvf.doctor_id, hvf.visit_date, pd.gender, pd.age,
+                       pd.patient_id IS NOT NULL AS has_patient
+                FROM hospital_visits_fact hvf
+                LEFT JOIN patient_dim pd ON pd.patient_id = hvf.patient_id
+            """)
+            columns = ["visit_id", "patient_id", "doctor_id", "visit_date", "gender", "age", "has_patient"]
+            while True:
+                rows = cursor.fetchmany(SKETCH_FETCH_SIZE)
+                if not rows:
+                    break
+                builder.add(pd.DataFrame(rows, columns=columns))
+    builder.save(replace=True)
+
+
+# --- Approximate Counts ---
+@cached_query
+def load_sketches():
+    """Returns {sketch name: {group key: HyperLogLog}} ({} when no sketches are stored)."""
+    if DB_BACKEND != "mysql":
+        return {}
+    try:
+        df = run_query(f"SELECT sketch_name, group_key, registers FROM {SKETCH_TABLE}", name="load_sketches")
+    except pymysql.err.ProgrammingError:
+        return {}  # Table not created yet
+    sketches = {}
+    for row in df.itertuples(index=False):
+        sketches.setdefault(row.sketch_name, {})[row.group_key] = HyperLogLog.from_bytes(row.registers)
+    return sketches
+
+
+def use_approximate(approximate=None):
+    """Whether a getter should answer from sketches: explicit argument, else distinct_mode."""
+    return APPROX_DISTINCT if approximate is None else approximate
+
+
+def approx_distinct(name, groups=None):
+    """Estimated distinct count over the union of `groups` (all groups when None)."""
+    stored = load_sketches().get(name, {})
+    keys = stored if groups is None else [NULL_GROUP if group is None else str(group) for group in groups]
+    sketch = merged(stored[key] for key in keys if key in stored)
+    return 0 if sketch is None else sketch.count()
+
+
+def approx_distinct_by_group(name, group_name, value_name, labels=None):
+    """One row per group with its estimated distinct count.
+
+    `labels` maps stored group keys to display labels; groups sharing a label are
+    merged as a union, like a GROUP BY on the label would.
+    """
+    stored = load_sketches().get(name, {})
+    by_label = {}
+    for key, sketch in stored.items():
+        label = None if key == NULL_GROUP else key
+        if labels is not None:
+            if key not in labels:
+                continue  # No dimension row: dropped, as by the inner join
+            label = labels[key]
+        by_label.setdefault(label, []).append(sketch)
+    rows = [{group_name: label, value_name: merged(sketches).count()} for label, sketches in by_label.items()]
+    return pd.DataFrame(rows, columns=[group_name, value_name])
+
+
+def has_sketches(name):
+    return bool(load_sketches().get(name))
+
+
+# Rebuild the sketches from the warehouse (run from the project root: python -m etl.hll)
+if __name__ == "__main__":
+    rebuild_distinct_sketches()
+    print(f"Distinct-count sketches rebuilt at precision {HLL_PRECISION} "
+          f"(~{HyperLogLog().relative_error:.2%} standard error)")
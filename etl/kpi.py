@@ -1,189 +1,350 @@
-import pymysql
+import os
+from dataclasses import dataclass
+
 import pandas as pd
 from dotenv import load_dotenv
-import os
-# Database connection details
-import mysql.connector
+
+from etl.cache import cached_query
+from etl.db import run_query
+from etl.dimensions import DIMENSIONS, get_dimension, group_by_attribute
+from etl.filters import run_filtered, run_filtered_scalar
+from etl.hll import approx_distinct, approx_distinct_by_group, has_sketches, use_approximate
+from etl.partitions import month_label
 
 load_dotenv()
 
-Host=os.getenv('host')
-User=os.getenv('user')
-Password=os.getenv('password')
-Database=os.getenv('database')
+# kpi_source=cube answers the unfiltered headline KPIs from the pre-aggregated cube
+# (see cube.py) once it is built; anything else queries the warehouse
+KPI_SOURCE = os.getenv('kpi_source', 'sql')
 
+# --- KPI Queries ---
+# `{fact}` is the fact table, or the slice of it a dashboard filter selects (see filters.py).
+# Breakdowns by a small dimension group the fact by key; the names come from dimensions.py.
+KPI_QUERIES = {
+    "total_revenue": "SELECT SUM(v.total_bill) AS total_revenue FROM {fact} v",
 
+    "revenue_by_disease": """
+        SELECT v.disease_id, SUM(v.total_bill) AS total_revenue
+        FROM {fact} v
+        GROUP BY v.disease_id;
+    """,
+
+    "total_visits": "SELECT COUNT(DISTINCT v.visit_id) AS total_visits FROM {fact} v",
+
+    "avg_revenue_per_visit": "SELECT AVG(v.total_bill) AS avg_revenue_per_visit FROM {fact} v",
+
+    "visits_by_gender": """
+        SELECT p.gender, COUNT(DISTINCT v.visit_id) AS total_visits
+        FROM {fact} v
+        JOIN patient_dim p ON v.patient_id = p.patient_id
+        GROUP BY p.gender;
+    """,
+
+    "visits_by_age_group": """
+        SELECT
+            CASE
+                WHEN p.age BETWEEN 0 AND 18 THEN '0-18'
+                WHEN p.age BETWEEN 19 AND 35 THEN '19-35'
+                WHEN p.age BETWEEN 36 AND 60 THEN '36-60'
+                ELSE '60+'
+            END AS age_group,
+            COUNT(DISTINCT v.visit_id) AS total_visits
+        FROM {fact} v
+        JOIN patient_dim p ON v.patient_id = p.patient_id
+        GROUP BY age_group;
+    """,
+
+    "claim_status_breakdown": """
+        SELECT b.claim_status, COUNT(b.billing_id) AS total_claims
+        FROM billing_dim b
+        GROUP BY b.claim_status;
+    """,
+
+    "revenue_by_insurance_type": """
+        SELECT b.insurance_type, SUM(v.total_bill) AS total_revenue
+        FROM {fact} v
+        JOIN billing_dim b ON v.billing_id = b.billing_id
+        GROUP BY b.insurance_type;
+    """,
+
+    "hospital_visits_trend": """
+        SELECT v.visit_month, COUNT(DISTINCT v.visit_id) AS total_visits
+        FROM {fact} v
+        GROUP BY v.visit_month
+        ORDER BY v.visit_month;
+    """,
+
+    "kpi_snapshot": """
+        SELECT
+            b.claim_status,
+            b.insurance_type,
+            SUM(v.total_bill) AS total_revenue,
+            COUNT(v.total_bill) AS billed_visits,
+            COUNT(DISTINCT v.visit_id) AS total_visits,
+            COUNT(DISTINCT v.billing_id) AS total_claims
+        FROM {fact} v
+        LEFT JOIN billing_dim b ON v.billing_id = b.billing_id
+        GROUP BY b.claim_status, b.insurance_type;
+    """,
+}
+
+
+# --- Cube Roll-Ups ---
+def _from_cube(filters, group_by=()):
+    """The cube's roll-up for an unfiltered KPI, or None when the KPI is queried from the warehouse."""
+    if KPI_SOURCE != "cube" or filters:
+        return None
+    from etl import cube  # Imported here: cube.py builds on the engine, which imports this module
+
+    if not os.path.exists(cube.CUBE_PATH):
+        return None
+    return cube.query_cube(group_by)
 
-# Function to connect to the MySQL database
-def get_db_connection():
-    connection = mysql.connector.connect(
-        host=Host,       
-        user=User,            
-        password=Password,     
-        database=Database       
-    )
-    return connection
+
+def _cube_revenue(rolled):
+    """SUM(total_bill) per cube group: NULL where none of the group's visits has a bill."""
+    return rolled["revenue"].where(rolled["billed_visits"] > 0)
+
+
+def _scalar(value):
+    return None if pd.isna(value) else float(value)
 
 
 # 1. Total Revenue (Billing) Analysis
-def get_total_revenue():
-    query = "SELECT SUM(total_bill) AS total_revenue FROM hospital_visits_fact"
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df['total_revenue'][0]
+@cached_query
+def get_total_revenue(filters=None):
+    rolled = _from_cube(filters)
+    if rolled is not None:
+        return _scalar(_cube_revenue(rolled).iloc[0])
+    query = KPI_QUERIES["total_revenue"]
+    return run_filtered_scalar(query, 'total_revenue', filters, name="get_total_revenue")
 
 
 # 2. Revenue by Disease (Join with disease_dim)
-def get_revenue_by_disease():
-    query = """
-    SELECT d.disease_name, SUM(v.total_bill) AS total_revenue
-    FROM hospital_visits_fact v
-    JOIN disease_dim d ON v.disease_id = d.disease_id
-    GROUP BY d.disease_name;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+@cached_query
+def get_revenue_by_disease(filters=None):
+    query = KPI_QUERIES["revenue_by_disease"]
+    df = run_filtered(query, filters, name="get_revenue_by_disease")
+    return group_by_attribute(df, "disease_dim", "disease_name")
 
 
-# 3. Revenue by Doctor (Join with doctor_dim)
-def get_revenue_by_doctor():
-    query = """
-    SELECT d.doctor_name, SUM(v.total_bill) AS total_revenue
-    FROM hospital_visits_fact v
-    JOIN doctor_dim d ON v.doctor_id = d.doctor_id
-    GROUP BY d.doctor_name
-    limit 15;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+# 3. Revenue by Doctor (top doctors by revenue, see get_top_k)
+@cached_query
+def get_revenue_by_doctor(filters=None):
+    top = get_top_k("doctor", filters=filters)
+    return top[["doctor_name", "revenue", "doctor_id"]].rename(columns={"revenue": "total_revenue"})
 
 
-# 4. Revenue by Hospital (Join with hospital_dim)
-def get_revenue_by_hospital():
-    query = """
-    SELECT h.hospital_name, SUM(v.total_bill) AS total_revenue
-    FROM hospital_visits_fact v
-    JOIN hospital_dim h ON v.hospital_id = h.hospital_id
-    GROUP BY h.hospital_name
-    limit 15;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+# 4. Revenue by Hospital (top hospitals by revenue, see get_top_k)
+@cached_query
+def get_revenue_by_hospital(filters=None):
+    top = get_top_k("hospital", filters=filters)
+    return top[["hospital_name", "revenue", "hospital_id"]].rename(columns={"revenue": "total_revenue"})
 
 
 # 5. Number of Visits (Volume) Analysis
-def get_total_visits():
-    query = "SELECT COUNT(DISTINCT visit_id) AS total_visits FROM hospital_visits_fact"
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df['total_visits'][0]
+# Sketches cover the whole history, so filtered views are always counted exactly
+@cached_query
+def get_total_visits(approximate=None, filters=None):
+    if use_approximate(approximate) and not filters and has_sketches("total_visits"):
+        return approx_distinct("total_visits")
+    rolled = _from_cube(filters)
+    if rolled is not None:
+        return int(rolled["visits"].iloc[0])
+    query = KPI_QUERIES["total_visits"]
+    return run_filtered_scalar(query, 'total_visits', filters, name="get_total_visits")
 
 
 # 6. Average Revenue per Visit
-def get_avg_revenue_per_visit():
-    query = "SELECT AVG(total_bill) AS avg_revenue_per_visit FROM hospital_visits_fact"
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df['avg_revenue_per_visit'][0]
-
-
-# 7. Revenue per Patient (Join with patient_dim)
-def get_revenue_per_patient():
-    query = """
-    SELECT p.name, SUM(v.total_bill) AS revenue_per_patient
-    FROM hospital_visits_fact v
-    JOIN patient_dim p ON v.patient_id = p.patient_id
-    GROUP BY p.name
-    limit 15;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+@cached_query
+def get_avg_revenue_per_visit(filters=None):
+    rolled = _from_cube(filters)
+    if rolled is not None:
+        return _scalar(rolled["avg_bill"].iloc[0])
+    query = KPI_QUERIES["avg_revenue_per_visit"]
+    return run_filtered_scalar(query, 'avg_revenue_per_visit', filters, name="get_avg_revenue_per_visit")
+
+
+# 7. Revenue per Patient (top patients by spend, grouped by patient_id so namesakes stay apart)
+@cached_query
+def get_revenue_per_patient(filters=None):
+    top = get_top_k("patient", filters=filters)
+    return top[["name", "revenue", "patient_id"]].rename(columns={"revenue": "revenue_per_patient"})
 
 
 # 8. Patient Visits by Gender (Join with patient_dim)
-def get_visits_by_gender():
-    query = """
-    SELECT p.gender, COUNT(DISTINCT v.visit_id) AS total_visits
-    FROM hospital_visits_fact v
-    JOIN patient_dim p ON v.patient_id = p.patient_id
-    GROUP BY p.gender;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+@cached_query
+def get_visits_by_gender(approximate=None, filters=None):
+    if use_approximate(approximate) and not filters and has_sketches("visits_by_gender"):
+        return approx_distinct_by_group("visits_by_gender", "gender", "total_visits")
+    rolled = _from_cube(filters, ["gender"])
+    if rolled is not None:
+        return rolled[["gender", "visits"]].rename(columns={"visits": "total_visits"})
+    query = KPI_QUERIES["visits_by_gender"]
+    return run_filtered(query, filters, name="get_visits_by_gender")
 
 
 # 9. Patient Visits by Age Group (Join with patient_dim)
-def get_visits_by_age_group():
-    query = """
-    SELECT
-        CASE
-            WHEN p.age BETWEEN 0 AND 18 THEN '0-18'
-            WHEN p.age BETWEEN 19 AND 35 THEN '19-35'
-            WHEN p.age BETWEEN 36 AND 60 THEN '36-60'
-            ELSE '60+'
-        END AS age_group,
-        COUNT(DISTINCT v.visit_id) AS total_visits
-    FROM hospital_visits_fact v
-    JOIN patient_dim p ON v.patient_id = p.patient_id
-    GROUP BY age_group;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+@cached_query
+def get_visits_by_age_group(approximate=None, filters=None):
+    if use_approximate(approximate) and not filters and has_sketches("visits_by_age_group"):
+        return approx_distinct_by_group("visits_by_age_group", "age_group", "total_visits")
+    rolled = _from_cube(filters, ["age_group"])
+    if rolled is not None:
+        return rolled[["age_group", "visits"]].rename(columns={"visits": "total_visits"})
+    query = KPI_QUERIES["visits_by_age_group"]
+    return run_filtered(query, filters, name="get_visits_by_age_group")
 
 
 # 10. Claim Status Breakdown (Join with billing_dim)
-def get_claim_status_breakdown():
-    query = """
-    SELECT b.claim_status, COUNT(b.billing_id) AS total_claims
-    FROM billing_dim b
-    GROUP BY b.claim_status;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+@cached_query
+def get_claim_status_breakdown(filters=None):
+    if filters:
+        # A slice has no billings of its own: count the claims of its visits
+        return get_kpi_snapshot(filters).claim_status_breakdown
+    query = KPI_QUERIES["claim_status_breakdown"]
+    return run_filtered(query, name="get_claim_status_breakdown")
 
 
 # 11. Revenue by Insurance Type (Join with billing_dim)
-def get_revenue_by_insurance_type():
-    query = """
-    SELECT b.insurance_type, SUM(v.total_bill) AS total_revenue
-    FROM hospital_visits_fact v
-    JOIN billing_dim b ON v.billing_id = b.billing_id
-    GROUP BY b.insurance_type;
-    """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
-    return df
+@cached_query
+def get_revenue_by_insurance_type(filters=None):
+    rolled = _from_cube(filters, ["insurance_type"])
+    if rolled is not None:
+        return pd.DataFrame({"insurance_type": rolled["insurance_type"], "total_revenue": _cube_revenue(rolled)})
+    query = KPI_QUERIES["revenue_by_insurance_type"]
+    return run_filtered(query, filters, name="get_revenue_by_insurance_type")
 
 
 # 12. Hospital Visits Trend Over Time
-def get_hospital_visits_trend():
-    query = """
-    SELECT DATE_FORMAT(v.visit_date, '%Y-%m') AS month, COUNT(DISTINCT v.visit_id) AS total_visits
-    FROM hospital_visits_fact v
-    GROUP BY month
-    ORDER BY month;
+@cached_query
+def get_hospital_visits_trend(approximate=None, filters=None):
+    if use_approximate(approximate) and not filters and has_sketches("hospital_visits_trend"):
+        df = approx_distinct_by_group("hospital_visits_trend", "month", "total_visits")
+        return df.sort_values("month", ignore_index=True)
+    rolled = _from_cube(filters, ["month"])
+    if rolled is not None:
+        return rolled[["month", "visits"]].rename(columns={"visits": "total_visits"})
+    # Grouped on the stored month bucket: an index scan instead of DATE_FORMAT on every row
+    query = KPI_QUERIES["hospital_visits_trend"]
+    df = run_filtered(query, filters, name="get_hospital_visits_trend")
+    return pd.DataFrame({"month": month_label(df["visit_month"]).to_numpy(), "total_visits": df["total_visits"]})
+
+
+# 13. KPI Snapshot (all headline metrics in one fact-table scan)
+@dataclass(frozen=True)
+class KPISnapshot:
+    total_revenue: float
+    total_visits: int
+    avg_revenue_per_visit: float
+    claim_status_breakdown: pd.DataFrame     # claim_status, total_claims
+    revenue_by_insurance_type: pd.DataFrame  # insurance_type, total_revenue
+
+
+@cached_query
+def get_kpi_snapshot(filters=None):
+    """Computes the headline KPIs and billing breakdowns with a single grouped scan.
+
+    Groups are (claim_status, insurance_type), which are disjoint in both visits
+    and billing ids, so the totals and both breakdowns are re-aggregated from the
+    grouped rows in pandas. Claims are counted from billings referenced by visits.
+    """
+    query = KPI_QUERIES["kpi_snapshot"]
+    df = run_filtered(query, filters, name="get_kpi_snapshot")
+    for col in ["total_revenue", "billed_visits", "total_visits", "total_claims"]:
+        df[col] = pd.to_numeric(df[col]).fillna(0)
+
+    total_revenue = float(df["total_revenue"].sum())
+    billed_visits = int(df["billed_visits"].sum())
+
+    return KPISnapshot(
+        total_revenue=total_revenue,
+        total_visits=int(df["total_visits"].sum()),
+        avg_revenue_per_visit=total_revenue / billed_visits if billed_visits else float("nan"),
+        claim_status_breakdown=(
+            df.groupby("claim_status", as_index=False)["total_claims"].sum()
+            .astype({"total_claims": int})
+        ),
+        revenue_by_insurance_type=df.groupby("insurance_type", as_index=False)["total_revenue"].sum(),
+    )
+
+
+# 14. Top-K Rankings
+# Dimension -> (fact key, dimension table, label column)
+TOP_K_DIMENSIONS = {
+    "patient": ("patient_id", "patient_dim", "name"),
+    "doctor": ("doctor_id", "doctor_dim", "doctor_name"),
+    "hospital": ("hospital_id", "hospital_dim", "hospital_name"),
+    "disease": ("disease_id", "disease_dim", "disease_name"),
+}
+# Ranking metric -> its aggregate over the visits of one dimension member
+TOP_K_METRICS = {
+    "revenue": "SUM(v.total_bill)",
+    "visits": "COUNT(*)",
+    "avg_bill": "AVG(v.total_bill)",
+}
+TOP_K = 15  # rows in the dashboard's top-N charts
+
+# Only keys with a dimension row are ranked, as the joins this replaced did. Members
+# without a billed visit have a NULL revenue and average; they rank last either way.
+TOP_K_QUERY = """
+    SELECT
+        v.{key},
+        SUM(v.total_bill) AS revenue,
+        COUNT(*) AS visits,
+        AVG(v.total_bill) AS avg_bill
+    FROM {{fact}} v
+    WHERE v.{key} IN (SELECT {key} FROM {table})
+    GROUP BY v.{key}
+    ORDER BY {order} IS NULL, {order} {direction}, v.{key}
+    LIMIT {k};
+"""
+
+
+def top_k_spec(dimension, metric):
+    """(fact key, dimension table, label column) for a ranking; raises ValueError for unknown names."""
+    if dimension not in TOP_K_DIMENSIONS:
+        raise ValueError(f"Unknown top-k dimension {dimension!r}; expected one of {list(TOP_K_DIMENSIONS)}")
+    if metric not in TOP_K_METRICS:
+        raise ValueError(f"Unknown top-k metric {metric!r}; expected one of {list(TOP_K_METRICS)}")
+    return TOP_K_DIMENSIONS[dimension]
+
+
+def build_top_k_query(dimension, metric="revenue", k=TOP_K, descending=True):
+    key, table, _ = top_k_spec(dimension, metric)
+    return TOP_K_QUERY.format(key=key, table=table, order=TOP_K_METRICS[metric], direction="DESC" if descending else "ASC",
+                              k=max(int(k), 0))
+
+
+def _member_labels(table, key, label, keys):
+    """Labels of the ranked members only: small dimensions from the cache, others by key."""
+    if table in DIMENSIONS:
+        return get_dimension(table).labels(keys, label)
+    if not len(keys):
+        return []
+    placeholders = ", ".join(["%s"] * len(keys))
+    rows = run_query(f"SELECT {key}, {label} FROM {table} WHERE {key} IN ({placeholders})",
+                     list(keys), name=f"top_k_{table}_labels")
+    return pd.Series(keys).map(dict(zip(rows[key], rows[label]))).to_numpy(dtype=object)
+
+
+@cached_query
+def get_top_k(dimension, metric="revenue", k=TOP_K, descending=True, filters=None):
+    """The k members of a dimension ranked by revenue, visit count or average bill.
+
+    Members are grouped by their key, never by name, and keys without a dimension
+    row are left out like an inner join would. The ranking is done by the
+    database: each fact key has a (key, total_bill) index (see index_advisor.py), so
+    the groups stream from the index in key order, and ORDER BY ... LIMIT keeps only
+    the best k in a bounded priority queue instead of sorting every group. Ties are
+    broken by key. Only the k winners are looked up for their label.
+
+    Returns key, label, revenue, visits and avg_bill per member, in rank order.
     """
-    connection = get_db_connection()
-    df = pd.read_sql(query, connection)
-    connection.close()
+    key, table, label = top_k_spec(dimension, metric)
+    query = build_top_k_query(dimension, metric, k, descending)
+    df = run_filtered(query, filters, name=f"get_top_k_{dimension}_{metric}")
+    df.insert(1, label, _member_labels(table, key, label, df[key].tolist()))
     return df
 
 
@@ -201,3 +362,5 @@ if __name__ == "__main__":
     print("Claim Status Breakdown: \n", get_claim_status_breakdown())
     print("Revenue by Insurance Type: \n", get_revenue_by_insurance_type())
     print("Hospital Visits Trend: \n", get_hospital_visits_trend())
+    print("KPI Snapshot: \n", get_kpi_snapshot())
+    print("Top 5 Patients by Visits: \n", get_top_k("patient", "visits", 5))
@@ -0,0 +1,282 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.staging import DATA_DIR
+
+load_dotenv()
+
+logger = logging.getLogger("etl")
+
+# --- Metrics Settings ---
+SLOW_QUERY_SECONDS = float(os.getenv('slow_query_ms', 500)) / 1000  # queries this slow are sampled with their plan
+SLOW_QUERY_SAMPLES = 50        # most recent slow queries kept for the diagnostics page
+EXPLAIN_INTERVAL = 300         # seconds before the same slow query is EXPLAINed again
+METRICS_PORT = os.getenv('metrics_port')  # serve /metrics on this port when set
+METRICS_TEXTFILE = os.path.join(DATA_DIR, "etl_metrics.prom")  # written by the pipeline after each run
+
+# Bucket upper bounds per unit (an implicit +Inf bucket follows)
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+ROWS_BUCKETS = (1, 10, 100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000)
+BYTES_BUCKETS = (1 << 10, 1 << 14, 1 << 17, 1 << 20, 1 << 23, 1 << 26, 1 << 30)
+
+# Metric name -> (type, help, bucket bounds for histograms)
+METRICS = {
+    "etl_query_duration_seconds": ("histogram", "Query wall time including the fetch.", SECONDS_BUCKETS),
+    "etl_query_rows": ("histogram", "Rows returned per query.", ROWS_BUCKETS),
+    "etl_query_result_bytes": ("histogram", "In-memory size of each query result.", BYTES_BUCKETS),
+    "etl_connection_acquire_seconds": ("histogram", "Time to borrow a pooled connection.", SECONDS_BUCKETS),
+    "etl_stage_duration_seconds": ("histogram", "ETL stage wall time.", SECONDS_BUCKETS),
+    "etl_stage_runs_total": ("counter", "ETL stage runs by outcome.", None),
+    "etl_rows_loaded_total": ("counter", "Rows written by the ETL, per table or stage.", None),
+    "etl_errors_total": ("counter", "Failures logged by the ETL and the query layer.", None),
+}
+
+_lock = threading.Lock()
+_series = {}  # (metric, sorted label items) -> histogram state dict or counter value
+_slow_queries = deque(maxlen=SLOW_QUERY_SAMPLES)
+_explained_at = {}  # query name -> monotonic time of its last EXPLAIN
+
+
+# --- Recording ---
+def _key(metric, labels):
+    if metric not in METRICS:
+        raise ValueError(f"Unknown metric {metric!r}")
+    return metric, tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def observe(metric, value, **labels):
+    """Adds one observation to a histogram series."""
+    key = _key(metric, labels)
+    bounds = METRICS[metric][2]
+    with _lock:
+        series = _series.get(key)
+        if series is None:
+            series = _series[key] = {"buckets": [0] * (len(bounds) + 1), "count": 0, "sum": 0.0, "max": 0.0}
+        series["buckets"][bisect.bisect_left(bounds, value)] += 1
+        series["count"] += 1
+        series["sum"] += value
+        series["max"] = max(series["max"], value)
+
+
+def increment(metric, amount=1, **labels):
+    key = _key(metric, labels)
+    with _lock:
+        _series[key] = _series.get(key, 0) + amount
+
+
+def record_error(component, error):
+    """Logs a failure with its traceback and counts it, instead of only printing it."""
+    increment("etl_errors_total", component=component, error=type(error).__name__)
+    logger.error("%s failed: %s", component, error, exc_info=error)
+
+
+def record_query(name, query, params, backend, seconds, df):
+    """Called by db.run_query for every query; samples the slow ones with their plan."""
+    size = int(df.memory_usage(index=False, deep=True).sum())  # Decoded size, not wire bytes
+    observe("etl_query_duration_seconds", seconds, query=name, backend=backend)
+    observe("etl_query_rows", len(df), query=name, backend=backend)
+    observe("etl_query_result_bytes", size, query=name, backend=backend)
+    if seconds >= SLOW_QUERY_SECONDS:
+        _sample_slow_query(name, query, params, backend, seconds, len(df))
+
+
+@contextmanager
+def timed_stage(stage):
+    """Times an ETL stage and counts its outcome."""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        increment("etl_stage_runs_total", stage=stage, status="failed")
+        record_error(stage, e)
+        raise
+    finally:
+        observe("etl_stage_duration_seconds", time.perf_counter() - started, stage=stage)
+    increment("etl_stage_runs_total", stage=stage, status="done")
+
+
+QUERY_METRICS = ("etl_query_duration_seconds", "etl_query_rows", "etl_query_result_bytes")
+
+
+def reset_metrics():
+    with _lock:
+        _series.clear()
+        _slow_queries.clear()
+        _explained_at.clear()
+
+
+def reset_query_stats():
+    """Clears the per-query series and the slow-query log; ETL, pool and error series are kept."""
+    with _lock:
+        for key in [key for key in _series if key[0] in QUERY_METRICS]:
+            del _series[key]
+        _slow_queries.clear()
+        _explained_at.clear()
+
+
+# --- Slow Query Log ---
+def _explain(query, params, backend):
+    """The query's plan as rows of text, from the backend that ran it."""
+    if backend == "duckdb":
+        from etl.embedded import run_query as run_embedded_query
+
+        return run_embedded_query("EXPLAIN " + query.strip().rstrip(";"), params).astype(str).to_dict("records")
+
+    from etl.db import get_connection
+
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute("EXPLAIN " + query.strip().rstrip(";"), params)
+            return [{col: str(value) for col, value in row.items()} for row in cursor.fetchall()]
+
+
+def _format_plan(plan):
+    if all("explain_value" in row for row in plan):
+        return "\n".join(row["explain_value"] for row in plan)  # DuckDB: one rendered tree
+    return pd.DataFrame(plan).to_string(index=False)
+
+
+def _sample_slow_query(name, query, params, backend, seconds, rows):
+    now = time.monotonic()
+    with _lock:
+        explain = now - _explained_at.get(name, float("-inf")) >= EXPLAIN_INTERVAL
+        if explain:
+            _explained_at[name] = now
+    plan = None
+    if explain:
+        try:
+            plan = _explain(query, params, backend)
+        except Exception as e:  # A failed EXPLAIN must never fail the query itself
+            logger.warning("EXPLAIN of slow query %s failed: %s", name, e)
+
+    sample = {
+        "query": name, "backend": backend, "seconds": seconds, "rows": rows,
+        "sql": " ".join(query.split()), "params": params, "plan": plan,
+        "logged_at": pd.Timestamp.now(tz="UTC"),
+    }
+    with _lock:
+        _slow_queries.append(sample)
+    logger.warning("Slow query %s: %.3fs, %s rows%s", name, seconds, rows,
+                   "" if plan is None else "\n" + _format_plan(plan))
+
+
+def get_slow_queries():
+    """The most recent slow-query samples, newest first."""
+    with _lock:
+        return list(reversed(_slow_queries))
+
+
+# --- Reports ---
+def _histograms(metric):
+    with _lock:
+        return [(dict(labels), dict(series)) for (name, labels), series in _series.items() if name == metric]
+
+
+def get_query_stats():
+    """Returns per-query call counts, timings, rows and bytes as a DataFrame, hottest first."""
+    stats = {}
+    for metric, prefix in [("etl_query_duration_seconds", ""), ("etl_query_rows", "rows_"),
+                           ("etl_query_result_bytes", "bytes_")]:
+        for labels, series in _histograms(metric):
+            row = stats.setdefault((labels["query"], labels["backend"]), {})
+            if not prefix:
+                row.update(calls=series["count"], total_seconds=series["sum"], max_seconds=series["max"])
+            else:
+                row[f"{prefix}total"] = series["sum"]
+    columns = ["query", "backend", "calls", "total_seconds", "avg_seconds", "max_seconds", "rows_total", "bytes_total"]
+    df = pd.DataFrame([{"query": query, "backend": backend, **row} for (query, backend), row in stats.items()],
+                      columns=columns)
+    df["avg_seconds"] = df["total_seconds"] / df["calls"]
+    df[["rows_total", "bytes_total"]] = df[["rows_total", "bytes_total"]].astype("int64")
+    return df.sort_values("total_seconds", ascending=False, ignore_index=True)
+
+
+def histogram_summary(metric):
+    """Count, mean and max per series of a histogram, e.g. the connection-acquire latency."""
+    rows = [{**labels, "count": s["count"], "mean": s["sum"] / s["count"], "max": s["max"]}
+            for labels, s in _histograms(metric)]
+    return pd.DataFrame(rows)
+
+
+def _format_labels(labels, **extra):
+    items = [*labels, *extra.items()]
+    if not items:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in items)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(items, escaped)) + "}"
+
+
+def render_metrics():
+    """Every metric in the Prometheus text exposition format."""
+    with _lock:
+        series = sorted(_series.items(), key=lambda item: item[0])
+        series = [(key, dict(value) if isinstance(value, dict) else value) for key, value in series]
+
+    lines, described = [], set()
+    for (metric, labels), value in series:
+        kind, help_text, bounds = METRICS[metric]
+        if metric not in described:
+            lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} {kind}"]
+            described.add(metric)
+        if kind == "counter":
+            lines.append(f"{metric}{_format_labels(labels)} {value}")
+            continue
+        cumulative = 0
+        for bound, count in zip([*bounds, "+Inf"], value["buckets"]):
+            cumulative += count
+            lines.append(f"{metric}_bucket{_format_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {value['sum']}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {value['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics(path=METRICS_TEXTFILE):
+    """Writes the metrics for a textfile collector (batch runs have nothing to scrape)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_metrics())
+    os.replace(tmp_path, path)
+
+
+# --- Scrape Endpoint ---
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render_metrics().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # Scrapes are not worth a log line each
+
+
+_server = {"instance": None}
+
+
+def start_metrics_server(port=METRICS_PORT):
+    """Serves /metrics from a daemon thread; safe to call on every Streamlit rerun."""
+    if port is None:
+        return None
+    with _lock:
+        if _server["instance"] is None:
+            try:
+                _server["instance"] = ThreadingHTTPServer(("", int(port)), _MetricsHandler)
+            except OSError as e:
+                logger.warning("Metrics endpoint not started on port %s: %s", port, e)
+                return None
+            threading.Thread(target=_server["instance"].serve_forever, name="metrics", daemon=True).start()
+        return _server["instance"]
@@ -0,0 +1,227 @@
+import argparse
+import datetime
+import os
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.cache import bump_load_version
+from etl.datamarts import MATERIALIZED_MARTS, rebuild_data_marts
+from etl.db import get_connection
+from etl.hll import SKETCH_TABLE, rebuild_distinct_sketches
+
+load_dotenv()
+
+# --- Partition Settings ---
+# hospital_visits_fact is RANGE-partitioned by month on visit_month, a YYYYMM bucket
+# of visit_date the loaders store with every row (0 when the date is unknown)
+FACT_TABLE = "hospital_visits_fact"
+MONTH_COLUMN = "visit_month"
+PARTITION_START = os.getenv('partition_start', '2020-01')  # first monthly partition; older visits share one
+HISTORY_PARTITION = "p_history"  # visits before PARTITION_START
+FUTURE_PARTITION = "p_future"    # MAXVALUE catch-all, split off month by month as data arrives
+
+
+# --- Month Buckets ---
+def month_bucket(dates):
+    """YYYYMM integers for visit dates; missing or invalid dates map to 0."""
+    dates = pd.to_datetime(pd.Series(dates), errors="coerce")
+    return (dates.dt.year * 100 + dates.dt.month).fillna(0).astype("int64")
+
+
+def month_label(months):
+    """'YYYY-MM' labels for YYYYMM integers (None for the unknown-date bucket)."""
+    months = pd.Series(months).astype("int64")
+    labels = (months // 100).astype(str) + "-" + (months % 100).astype(str).str.zfill(2)
+    return labels.where(months > 0, None)
+
+
+def add_visit_month(fact):
+    """Adds the month bucket to fact rows staged without it."""
+    if MONTH_COLUMN in fact.columns:
+        return fact
+    return fact.assign(**{MONTH_COLUMN: month_bucket(fact["visit_date"]).to_numpy()})
+
+
+def _parse_month(month):
+    """'YYYY-MM' (or a date) -> YYYYMM."""
+    date = pd.Timestamp(month)
+    return date.year * 100 + date.month
+
+
+def _next_month(month):
+    year, mon = divmod(month, 100)
+    return (year + 1) * 100 + 1 if mon == 12 else month + 1
+
+
+def _months(first, last):
+    """Every YYYYMM from `first` through `last`."""
+    month = first
+    while month <= last:
+        yield month
+        month = _next_month(month)
+
+
+def _partition_definitions(months):
+    return [f"PARTITION p{month} VALUES LESS THAN ({_next_month(month)})" for month in months]
+
+
+def partition_clause(last_month=None):
+    """PARTITION BY clause with one partition per month from PARTITION_START through `last_month` (or today)."""
+    first = _parse_month(PARTITION_START)
+    last = max(first, last_month or 0, _parse_month(datetime.date.today()))
+    definitions = [
+        f"PARTITION {HISTORY_PARTITION} VALUES LESS THAN ({first})",
+        *_partition_definitions(_months(first, last)),
+        f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE",
+    ]
+    return f"PARTITION BY RANGE ({MONTH_COLUMN}) (\n    " + ",\n    ".join(definitions) + "\n)"
+
+
+# --- Partition Maintenance ---
+def list_partitions(cursor, table=FACT_TABLE):
+    """[(partition name, upper bound or None for MAXVALUE)] in range order; [] when unpartitioned."""
+    cursor.execute(
+        "SELECT partition_name AS name, partition_description AS bound FROM information_schema.partitions "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND partition_name IS NOT NULL "
+        "ORDER BY partition_ordinal_position",
+        (table,)
+    )
+    return [(row["name"], None if row["bound"] == "MAXVALUE" else int(row["bound"])) for row in cursor.fetchall()]
+
+
+def ensure_partitions(cursor, last_month, table=FACT_TABLE):
+    """Splits monthly partitions off the MAXVALUE partition so months up to `last_month` have their own.
+
+    The loaders call this before every chunk, so the future partition stays empty and
+    the split only changes metadata.
+    """
+    partitions = list_partitions(cursor, table)
+    if not partitions:
+        return []  # Not partitioned (created before partitioning; see migrate_fact_table)
+    bounds = [bound for _, bound in partitions if bound is not None]
+    first = bounds[-1] if bounds else _parse_month(PARTITION_START)
+    if last_month < first:
+        return []
+    months = list(_months(first, last_month))
+    definitions = [*_partition_definitions(months), f"PARTITION {FUTURE_PARTITION} VALUES LESS THAN MAXVALUE"]
+    cursor.execute(
+        f"ALTER TABLE {table} REORGANIZE PARTITION {FUTURE_PARTITION} INTO ({', '.join(definitions)})"
+    )
+    print(f" Added partitions p{months[0]}..p{months[-1]} to {table}")
+    return months
+
+
+MOVED_VISIT_BATCH = 1_000  # visit ids looked up per statement
+
+
+def drop_moved_visits(cursor, fact, table=FACT_TABLE):
+    """Deletes the stored rows of incoming visits that are filed under another month.
+
+    A visit is keyed by (visit_id, visit_month), so upserting a re-sent visit whose
+    date moved to another month would add a second row instead of replacing the
+    first. The lookup by visit_id alone has to probe every partition, which is why
+    it is batched. Returns the number of rows deleted.
+    """
+    months = dict(zip(fact["visit_id"], fact[MONTH_COLUMN].astype("int64")))
+    ids = list(months)
+    moved = []
+    for start in range(0, len(ids), MOVED_VISIT_BATCH):
+        batch = ids[start:start + MOVED_VISIT_BATCH]
+        cursor.execute(
+            f"SELECT visit_id, {MONTH_COLUMN} AS month FROM {table} WHERE visit_id IN ({', '.join(['%s'] * len(batch))})",
+            batch
+        )
+        moved += [(row["visit_id"], row["month"]) for row in cursor.fetchall() if row["month"] != months[row["visit_id"]]]
+    if moved:
+        cursor.executemany(f"DELETE FROM {table} WHERE visit_id = %s AND {MONTH_COLUMN} = %s", moved)
+        print(f" Removed {len(moved):,} visits re-sent under another month from {table}")
+    return len(moved)
+
+
+def migrate_fact_table(table=FACT_TABLE):
+    """Converts an unpartitioned fact table in place: adds and backfills visit_month, then partitions it.
+
+    MySQL does not allow foreign keys on partitioned tables, and every unique key must
+    include the partitioning column, so the foreign keys are dropped (the loaders
+    validate them, see validate.py) and the primary key becomes (visit_id, visit_month).
+    """
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            if list_partitions(cursor, table):
+                print(f"{table} is already partitioned")
+                return
+            cursor.execute(
+                "SELECT constraint_name AS name FROM information_schema.referential_constraints "
+                "WHERE constraint_schema = DATABASE() AND table_name = %s",
+                (table,)
+            )
+            for row in cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {table} DROP FOREIGN KEY {row['name']}")
+
+            cursor.execute(f"SHOW COLUMNS FROM {table} LIKE %s", (MONTH_COLUMN,))
+            if not cursor.fetchall():
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {MONTH_COLUMN} INT NOT NULL DEFAULT 0 AFTER visit_date")
+            cursor.execute(
+                f"UPDATE {table} SET {MONTH_COLUMN} = COALESCE(YEAR(visit_date) * 100 + MONTH(visit_date), 0)"
+            )
+            cursor.execute(f"SELECT MAX({MONTH_COLUMN}) AS last_month FROM {table}")
+            last_month = cursor.fetchone()["last_month"] or None
+
+            cursor.execute(
+                f"ALTER TABLE {table} DROP PRIMARY KEY, ADD PRIMARY KEY (visit_id, {MONTH_COLUMN}), "
+                f"ADD INDEX ix_fact_month_visit ({MONTH_COLUMN}, visit_id)"
+            )
+            cursor.execute(f"ALTER TABLE {table} {partition_clause(last_month)}")
+        conn.commit()
+    print(f"{table} partitioned by {MONTH_COLUMN}")
+
+
+def archive_partitions(before, table=FACT_TABLE):
+    """Moves every month before `before` ('YYYY-MM') out of the fact table into its own table.
+
+    Each partition is swapped with an empty table of the same shape (EXCHANGE
+    PARTITION only changes metadata) and then dropped, so no rows are copied.
+    Archived months are named <table>_<YYYYMM> (<table>_history for the oldest
+    partition). Returns the archive tables created.
+    """
+    cutoff = _parse_month(before)
+    archived = []
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            for name, bound in list_partitions(cursor, table):
+                if bound is None or bound > cutoff:
+                    continue
+                archive = f"{table}_{name[1:].lstrip('_')}"
+                cursor.execute("SHOW TABLES LIKE %s", (archive,))
+                if cursor.fetchall():
+                    raise ValueError(f"Archive table {archive} already exists; drop or rename it first")
+                cursor.execute(f"CREATE TABLE {archive} LIKE {table}")
+                cursor.execute(f"ALTER TABLE {archive} REMOVE PARTITIONING")
+                cursor.execute(f"ALTER TABLE {table} EXCHANGE PARTITION {name} WITH TABLE {archive}")
+                cursor.execute(f"ALTER TABLE {table} DROP PARTITION {name}")
+                print(f" Archived partition {name} to {archive}")
+                archived.append(archive)
+
+    if archived:
+        # Marts and distinct-count sketches summarized the archived visits too
+        rebuild_data_marts()
+        rebuild_distinct_sketches()
+        bump_load_version(table, *MATERIALIZED_MARTS, SKETCH_TABLE)
+    return archived
+
+
+# Partition an existing warehouse or archive old months (run from the project root):
+#   python -m etl.partitions migrate
+#   python -m etl.partitions archive --before 2021-01
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Maintain the monthly partitions of the fact table.")
+    parser.add_argument("action", choices=["migrate", "archive"])
+    parser.add_argument("--before", help="archive every month before this one (YYYY-MM)")
+    args = parser.parse_args()
+    if args.action == "migrate":
+        migrate_fact_table()
+    elif args.before is None:
+        parser.error("archive needs --before YYYY-MM")
+    else:
+        print(f"Archived {len(archive_partitions(args.before))} partitions")
@@ -0,0 +1,162 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import partial
+
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.add_primary_key import modify_and_set_primary_keys
+from etl.cache import bump_load_version
+from etl.clean import run_clean
+from etl.create_dim import DIM_TABLES, load_dimension, migrate_surrogate_keys
+from etl.create_fact import load_fact
+from etl.cube import run_cube_build
+from etl.datamarts import MATERIALIZED_MARTS, rebuild_data_mart
+from etl.metrics import timed_stage, write_metrics
+from etl.staging import DATA_DIR
+from etl.state import INCREMENTAL, merge_delta
+
+load_dotenv()
+
+# --- Pipeline Settings ---
+PIPELINE_WORKERS = int(os.getenv('pipeline_workers', 4))  # stages run at the same time
+CHECKPOINT_PATH = os.path.join(DATA_DIR, "pipeline_checkpoint.json")
+
+
+def refresh_mart(name):
+    """Full runs rebuild the mart once here; incremental fact loads refresh the touched groups per chunk."""
+    if INCREMENTAL:
+        print(f"Data mart {name} refreshed by the incremental fact load")
+        return
+    rebuild_data_mart(name)
+    bump_load_version(name)
+
+
+def merge_staged_delta():
+    """Incremental runs fold the delta into the full staged tables the cube and the engine read."""
+    if not INCREMENTAL:
+        print("Full run: the staged tables are already complete")
+        return
+    merge_delta()
+
+
+# Stage name -> (callable, stages it depends on)
+STAGES = {
+    "clean": (run_clean, []),
+    "surrogate_keys": (migrate_surrogate_keys, ["clean"]),  # no-op once the warehouse has integer keys
+    **{table: (partial(load_dimension, table), ["surrogate_keys"]) for table in DIM_TABLES},
+    "primary_keys": (modify_and_set_primary_keys, list(DIM_TABLES)),
+    "fact": (load_fact, ["primary_keys"]),
+    **{name: (partial(refresh_mart, name), ["fact"]) for name in MATERIALIZED_MARTS},
+    "merge_delta": (merge_staged_delta, ["fact"]),
+    "cube": (run_cube_build, ["merge_delta"]),
+}
+
+
+# --- Checkpoints ---
+def load_checkpoint(path=CHECKPOINT_PATH):
+    """Returns {stage: seconds} for the stages a previous, failed run completed."""
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)["completed"]
+
+
+def save_checkpoint(completed, path=CHECKPOINT_PATH):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"completed": completed}, f, indent=2)
+    os.replace(tmp_path, path)  # Never leave a half-written checkpoint behind
+
+
+def _check_graph(stages):
+    """Rejects unknown dependencies and cycles before anything runs."""
+    for name, (_, deps) in stages.items():
+        unknown = set(deps) - set(stages)
+        if unknown:
+            raise ValueError(f"Stage {name!r} depends on unknown stages {sorted(unknown)}")
+    done, remaining = set(), dict(stages)
+    while remaining:
+        ready = [name for name, (_, deps) in remaining.items() if set(deps) <= done]
+        if not ready:
+            raise ValueError(f"Dependency cycle between stages {sorted(remaining)}")
+        done.update(ready)
+        for name in ready:
+            del remaining[name]
+
+
+# --- Runner ---
+def _timed(name, func):
+    started = time.perf_counter()
+    with timed_stage(name):
+        func()
+    return time.perf_counter() - started
+
+
+def run_pipeline(stages=STAGES, workers=PIPELINE_WORKERS, checkpoint_path=CHECKPOINT_PATH, restart=False):
+    """Runs every stage once its dependencies are done, independent stages in parallel.
+
+    Completed stages are checkpointed as they finish; after a failure the next run
+    skips them and resumes with the failed stage. The checkpoint is removed once a
+    run completes. Returns the per-stage timing report.
+    """
+    _check_graph(stages)
+    if restart and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    completed = {name: seconds for name, seconds in load_checkpoint(checkpoint_path).items() if name in stages}
+    report = {name: {"stage": name, "status": "resumed", "seconds": seconds} for name, seconds in completed.items()}
+    if completed:
+        print(f"Resuming: skipping completed stages {sorted(completed)}")
+
+    pending = [name for name in stages if name not in completed]
+    running = {}
+    failure = None
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while running or (pending and failure is None):
+            if failure is None:
+                for name in [name for name in pending if set(stages[name][1]) <= set(completed)]:
+                    print(f"▶ {name}")
+                    running[pool.submit(_timed, name, stages[name][0])] = name
+                    pending.remove(name)
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    seconds = future.result()
+                except Exception as e:
+                    print(f"✖ {name} failed: {e}")
+                    report[name] = {"stage": name, "status": "failed", "seconds": None}
+                    failure = failure or e
+                    continue
+                print(f"✔ {name} ({seconds:.2f}s)")
+                completed[name] = seconds
+                report[name] = {"stage": name, "status": "done", "seconds": seconds}
+                save_checkpoint(completed, checkpoint_path)
+
+    for name in pending:
+        report[name] = {"stage": name, "status": "not run", "seconds": None}
+    report = pd.DataFrame([report[name] for name in stages], columns=["stage", "status", "seconds"])
+    print(report.to_string(index=False))
+    print(f"Pipeline wall time: {time.perf_counter() - started:.2f}s")
+    write_metrics()
+
+    if failure is not None:
+        print(f"Completed stages are checkpointed in {checkpoint_path}; re-run to resume.")
+        raise failure
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return report
+
+
+# Run the whole ETL (run from the project root: python -m etl.pipeline [--restart])
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the ETL pipeline as a dependency graph.")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint of a failed run")
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS, help="stages run at the same time")
+    args = parser.parse_args()
+    run_pipeline(workers=args.workers, restart=args.restart)
@@ -0,0 +1,148 @@
+import os
+
+import pandas as pd
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Staging Settings ---
+# Files handed from clean.py to the loaders. "parquet" writes typed, zstd-compressed
+# files with dictionary-encoded categoricals; "csv" keeps the original cleaned_*.csv.
+DATA_DIR = os.getenv('data_dir', 'Data')  # staged files, key maps and ETL state
+STAGING_FORMAT = os.getenv('staging_format', 'csv')
+STAGING_FORMATS = ("csv", "parquet")
+
+# Low-cardinality columns stored as categoricals (dictionary-encoded in Parquet)
+CATEGORICAL_COLUMNS = {
+    "patient_dim": ["gender", "blood_type", "smoker_status", "alcohol_consumption", "exercise_frequency"],
+    "disease_dim": ["category", "severity_level"],
+    "doctor_dim": ["specialization"],
+    "hospital_dim": ["type"],
+    "billing_dim": ["insurance_type", "claim_status", "payment_method"],
+}
+
+DATE_COLUMNS = {
+    "hospital_visits_fact": ["visit_date"],
+}
+
+# Columns that are whole numbers in every chunk (surrogate keys, the month bucket).
+# Any other integer column is widened to float64: the Parquet schema is fixed by the
+# first chunk, and a later chunk of the same column may hold NaN or fractions.
+INTEGER_COLUMNS = {
+    "patient_dim": ["patient_id"],
+    "disease_dim": ["disease_id"],
+    "doctor_dim": ["doctor_id"],
+    "hospital_dim": ["hospital_id"],
+    "billing_dim": ["billing_id"],
+    "hospital_visits_fact": ["patient_id", "disease_id", "billing_id", "hospital_id", "doctor_id", "visit_month"],
+}
+
+
+def staging_path(table, fmt=STAGING_FORMAT, data_dir=DATA_DIR):
+    extension = {"csv": "csv", "parquet": "parquet"}[fmt]
+    return os.path.join(data_dir, f"cleaned_{table}.{extension}")
+
+
+def _typed(df, table):
+    """Applies the staging types a table is written with."""
+    df = df.copy()
+    for col in CATEGORICAL_COLUMNS.get(table, []):
+        if col in df.columns:
+            df[col] = df[col].astype("category")
+    for col in DATE_COLUMNS.get(table, []):
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    for col in df.columns:
+        if pd.api.types.is_integer_dtype(df[col]) and col not in INTEGER_COLUMNS.get(table, []):
+            df[col] = df[col].astype("float64")
+    return df
+
+
+# --- Writing ---
+class StagingWriter:
+    """Appends DataFrame chunks of one table to its staging file."""
+
+    def __init__(self, table, fmt=STAGING_FORMAT, data_dir=DATA_DIR):
+        if fmt not in STAGING_FORMATS:
+            raise ValueError(f"Unknown staging format {fmt!r}; expected one of {STAGING_FORMATS}")
+        self.table = table
+        self.fmt = fmt
+        self.path = staging_path(table, fmt, data_dir)
+        self._parquet_writer = None
+        self._schema = None
+        self._first = True
+
+    def _arrow_schema(self, df):
+        import pyarrow as pa
+
+        fields = []
+        for field in pa.Schema.from_pandas(df, preserve_index=False):
+            if pa.types.is_dictionary(field.type):
+                field = field.with_type(pa.dictionary(pa.int32(), pa.string()))
+            elif pa.types.is_timestamp(field.type):
+                field = field.with_type(pa.date32())
+            elif pa.types.is_null(field.type):
+                field = field.with_type(pa.string())  # All-missing first chunk
+            fields.append(field)
+        return pa.schema(fields)
+
+    def write(self, df):
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="w" if self._first else "a", header=self._first, index=False)
+        else:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            df = _typed(df, self.table)
+            if self._parquet_writer is None:
+                self._schema = self._arrow_schema(df)
+                self._parquet_writer = pq.ParquetWriter(self.path, self._schema, compression="zstd")
+            batch = pa.Table.from_pandas(df, preserve_index=False).cast(self._schema)
+            self._parquet_writer.write_table(batch)
+        self._first = False
+
+    def close(self):
+        if self._parquet_writer is not None:
+            self._parquet_writer.close()
+
+
+# --- Reading ---
+def resolve_format(table, fmt, data_dir):
+    """Uses the configured format, falling back to CSV when no Parquet file was staged."""
+    fmt = fmt or STAGING_FORMAT
+    if fmt == "parquet" and not os.path.exists(staging_path(table, "parquet", data_dir)):
+        return "csv"
+    return fmt
+
+
+def staged_version(tables, fmt=None, data_dir=DATA_DIR):
+    """Fingerprints staged files by modification time (None if none are staged)."""
+    versions = []
+    for table in tables:
+        path = staging_path(table, resolve_format(table, fmt, data_dir), data_dir)
+        if os.path.exists(path):
+            versions.append((table, os.path.getmtime(path)))
+    return tuple(versions) or None
+
+
+def read_staging(table, columns=None, fmt=None, data_dir=DATA_DIR):
+    """Loads a staged table, reading only `columns` when given."""
+    fmt = resolve_format(table, fmt, data_dir)
+    path = staging_path(table, fmt, data_dir)
+    if fmt == "parquet":
+        return pd.read_parquet(path, columns=columns, memory_map=True)
+    return pd.read_csv(path, usecols=columns)
+
+
+def iter_staging(table, chunksize, columns=None, fmt=None, data_dir=DATA_DIR):
+    """Yields a staged table as DataFrames of at most `chunksize` rows."""
+    fmt = resolve_format(table, fmt, data_dir)
+    path = staging_path(table, fmt, data_dir)
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        for batch in parquet_file.iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, usecols=columns, chunksize=chunksize)
@@ -0,0 +1,173 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from etl.staging import DATA_DIR, StagingWriter, iter_staging, read_staging, resolve_format, staging_path
+from etl.surrogate_keys import DIM_KEYS
+
+load_dotenv()
+
+# etl_mode=incremental makes the loaders process only records at or after the
+# visit_date watermark, plus dimension rows whose content changed
+INCREMENTAL = os.getenv('etl_mode', 'full') == 'incremental'
+WATERMARK = "visit_date"
+MERGE_CHUNK_SIZE = 100_000  # staged rows rewritten at once when merging a delta
+
+# Staged table -> key a delta row replaces the staged row by
+MERGE_KEYS = {**DIM_KEYS, "hospital_visits_fact": "visit_id"}
+
+
+def state_path(data_dir=DATA_DIR):
+    return os.path.join(data_dir, "etl_state.sqlite")
+
+
+def delta_dir(data_dir=DATA_DIR):
+    """Staging directory for the records of an incremental run."""
+    return os.path.join(data_dir, "delta")
+
+
+class EtlState:
+    """Watermarks and per-dimension row hashes of the last successful load.
+
+    Cleaning stages pending values; each loader commits its part only after its
+    load succeeded, so a failed run is simply repeated by the next one.
+    """
+
+    def __init__(self, path=None):
+        self.conn = sqlite3.connect(path or state_path(), timeout=30)  # Dimensions commit concurrently
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS watermarks (
+                name TEXT PRIMARY KEY, value TEXT, pending TEXT
+            );
+            CREATE TABLE IF NOT EXISTS dim_row_hashes (
+                dim TEXT, natural_key TEXT, row_hash INTEGER, PRIMARY KEY (dim, natural_key)
+            );
+            CREATE TABLE IF NOT EXISTS pending_dim_hashes (
+                dim TEXT, natural_key TEXT, row_hash INTEGER, PRIMARY KEY (dim, natural_key)
+            );
+            CREATE TABLE IF NOT EXISTS fill_values (
+                column_name TEXT PRIMARY KEY, value TEXT
+            );
+            CREATE TEMP TABLE batch (natural_key TEXT PRIMARY KEY, row_hash INTEGER);
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    # --- Watermarks ---
+    def get_watermark(self, name=WATERMARK):
+        row = self.conn.execute("SELECT value FROM watermarks WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    def stage_watermark(self, value, name=WATERMARK):
+        self.conn.execute(
+            "INSERT INTO watermarks (name, pending) VALUES (?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET pending = excluded.pending",
+            (name, value)
+        )
+        self.conn.commit()
+
+    def advance_watermark(self, name=WATERMARK):
+        """Commits the staged watermark; returns the new value (None if nothing was staged)."""
+        self.conn.execute(
+            "UPDATE watermarks SET value = pending, pending = NULL WHERE name = ? AND pending IS NOT NULL",
+            (name,)
+        )
+        self.conn.commit()
+        return self.get_watermark(name)
+
+    # --- Dimension Row Hashes ---
+    def begin_run(self):
+        """Discards whatever a previous, unfinished run staged."""
+        self.conn.execute("DELETE FROM pending_dim_hashes")
+        self.conn.execute("UPDATE watermarks SET pending = NULL")
+        self.conn.commit()
+
+    def changed_rows(self, dim, natural_keys, row_hashes):
+        """Marks rows that are new or whose content hash differs, and stages their hashes."""
+        batch = pd.DataFrame({
+            "natural_key": pd.Series(natural_keys).astype(str).to_numpy(),
+            "row_hash": np.asarray(row_hashes, dtype=np.uint64).view(np.int64),
+        })
+        self.conn.execute("DELETE FROM batch")
+        self.conn.executemany("INSERT OR REPLACE INTO batch VALUES (?, ?)", batch.itertuples(index=False))
+        stored = dict(self.conn.execute(
+            "SELECT natural_key, h.row_hash FROM batch JOIN dim_row_hashes h USING (natural_key) WHERE h.dim = ?",
+            (dim,)
+        ).fetchall())
+        self.conn.execute(
+            "INSERT OR REPLACE INTO pending_dim_hashes SELECT ?, natural_key, row_hash FROM batch", (dim,)
+        )
+        self.conn.commit()
+        return (batch["natural_key"].map(stored) != batch["row_hash"]).to_numpy()
+
+    def commit_dim_hashes(self, dim):
+        self.conn.execute("INSERT OR REPLACE INTO dim_row_hashes SELECT * FROM pending_dim_hashes WHERE dim = ?", (dim,))
+        self.conn.execute("DELETE FROM pending_dim_hashes WHERE dim = ?", (dim,))
+        self.conn.commit()
+
+    # --- Cleaning Settings ---
+    def get_fill_values(self):
+        return dict(self.conn.execute("SELECT column_name, value FROM fill_values").fetchall())
+
+    def save_fill_values(self, fill_values):
+        self.conn.execute("DELETE FROM fill_values")
+        self.conn.executemany("INSERT INTO fill_values VALUES (?, ?)", fill_values.items())
+        self.conn.commit()
+
+
+def commit_dim_hashes(dim, data_dir=DATA_DIR):
+    """Called by create_dim once a dimension's staged rows are loaded."""
+    state = EtlState(state_path(data_dir))
+    try:
+        state.commit_dim_hashes(dim)
+    finally:
+        state.close()
+
+
+def advance_watermark(data_dir=DATA_DIR):
+    """Called by create_fact once the staged visits are loaded."""
+    state = EtlState(state_path(data_dir))
+    try:
+        return state.advance_watermark()
+    finally:
+        state.close()
+
+
+# --- Delta Merge ---
+def merge_delta(data_dir=DATA_DIR, chunk_size=MERGE_CHUNK_SIZE):
+    """Folds the delta of an incremental run into the full staged tables.
+
+    The engine, the cube and the embedded backend read the full staged set, which
+    an incremental clean leaves untouched. Staged rows whose key is in the delta
+    are replaced by their delta version, and the rest of the delta is appended;
+    without a full staged table the delta becomes it. Merging twice is harmless.
+    """
+    source_dir = delta_dir(data_dir)
+    merge_dir = tempfile.mkdtemp(suffix=".merge", dir=data_dir)  # Same filesystem, so os.replace is atomic
+    try:
+        for table, key in MERGE_KEYS.items():
+            delta_fmt = resolve_format(table, None, source_dir)
+            if not os.path.exists(staging_path(table, delta_fmt, source_dir)):
+                continue
+            delta = read_staging(table, data_dir=source_dir)
+            fmt = resolve_format(table, None, data_dir)
+            full_path = staging_path(table, fmt, data_dir)
+            writer = StagingWriter(table, fmt, merge_dir)
+            try:
+                if os.path.exists(full_path):
+                    for chunk in iter_staging(table, chunk_size, data_dir=data_dir):
+                        delta = delta.reindex(columns=chunk.columns)  # Appended CSV rows must follow the header
+                        writer.write(chunk[~chunk[key].isin(delta[key])])
+                writer.write(delta)
+            finally:
+                writer.close()
+            os.replace(staging_path(table, fmt, merge_dir), full_path)
+            print(f"Merged {len(delta):,} delta rows into {full_path}")
+    finally:
+        shutil.rmtree(merge_dir, ignore_errors=True)
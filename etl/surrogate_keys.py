@@ -0,0 +1,136 @@
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from etl.staging import DATA_DIR
+
+# Dimension -> key column. The key column holds a compact integer surrogate and the
+# natural UUID moves to `<name>_uuid`, e.g. patient_id (INT) + patient_uuid.
+DIM_KEYS = {
+    "patient_dim": "patient_id",
+    "disease_dim": "disease_id",
+    "doctor_dim": "doctor_id",
+    "hospital_dim": "hospital_id",
+    "billing_dim": "billing_id",
+}
+
+# Surrogates start at 1; fact keys that map to no known dimension row become 0 and
+# are rejected by foreign key validation
+UNKNOWN_KEY = 0
+
+
+def natural_key_column(key_column):
+    return key_column.replace("_id", "_uuid")
+
+
+def keymap_path(dim, data_dir=DATA_DIR):
+    return os.path.join(data_dir, f"keymap_{dim}.sqlite")
+
+
+def legacy_keymap_path(dim, data_dir=DATA_DIR):
+    """The CSV mapping file of earlier versions, imported on first use."""
+    return os.path.join(data_dir, f"keymap_{dim}.csv")
+
+
+class KeyMap:
+    """Persisted UUID -> integer mapping for one dimension, so reloads keep their keys.
+
+    The mapping lives in an on-disk SQLite index (like clean.SeenIndex), so only
+    the keys of the chunk being encoded are held in memory. Keys assigned by
+    `encode` become durable on `save`.
+    """
+
+    def __init__(self, dim, data_dir=DATA_DIR):
+        self.dim = dim
+        self.path = keymap_path(dim, data_dir)
+        self.conn = sqlite3.connect(self.path, timeout=30)
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS keymap (uuid TEXT PRIMARY KEY, key INTEGER NOT NULL);
+            CREATE TEMP TABLE batch (uuid TEXT PRIMARY KEY);
+        """)
+        self._import_legacy(legacy_keymap_path(dim, data_dir))
+        self._next = self.conn.execute("SELECT COALESCE(MAX(key), ?) + 1 FROM keymap", (UNKNOWN_KEY,)).fetchone()[0]
+
+    def _import_legacy(self, csv_path):
+        if not os.path.exists(csv_path) or self.conn.execute("SELECT 1 FROM keymap LIMIT 1").fetchone():
+            return
+        for saved in pd.read_csv(csv_path, dtype={"uuid": str, "key": np.int64}, chunksize=100_000):
+            self.conn.executemany("INSERT OR IGNORE INTO keymap VALUES (?, ?)",
+                                  zip(saved["uuid"], saved["key"].tolist()))
+        self.conn.commit()
+
+    def encode(self, uuids, assign_new=True):
+        """Maps natural keys to surrogates, assigning the next free integer to unseen keys."""
+        uuids = pd.Series(uuids, dtype=object)
+        present = uuids.notna().to_numpy()
+        values = uuids[present].astype(str)
+        uniques = pd.Index(values.unique())
+        encoded = np.full(len(uuids), UNKNOWN_KEY, dtype=np.int64)
+        if uniques.empty:
+            return encoded
+
+        self.conn.execute("DELETE FROM batch")
+        self.conn.executemany("INSERT INTO batch VALUES (?)", ((uuid,) for uuid in uniques))
+        known = pd.DataFrame(
+            self.conn.execute("SELECT uuid, key FROM batch JOIN keymap USING (uuid)").fetchall(),
+            columns=["uuid", "key"]
+        )
+        keys = np.full(len(uniques), UNKNOWN_KEY, dtype=np.int64)
+        keys[uniques.get_indexer(known["uuid"])] = known["key"].to_numpy(dtype=np.int64)
+
+        new = keys == UNKNOWN_KEY
+        if assign_new and new.any():
+            keys[new] = np.arange(self._next, self._next + new.sum(), dtype=np.int64)
+            self._next += int(new.sum())
+            self.conn.executemany("INSERT INTO keymap VALUES (?, ?)", zip(uniques[new], keys[new].tolist()))
+
+        encoded[present] = keys[uniques.get_indexer(values)]
+        return encoded
+
+    def save(self):
+        """Commits newly assigned keys to the mapping file."""
+        self.conn.commit()
+
+
+def load_keymaps(data_dir=DATA_DIR):
+    return {dim: KeyMap(dim, data_dir) for dim in DIM_KEYS}
+
+
+def save_keymaps(keymaps):
+    for keymap in keymaps.values():
+        keymap.save()
+
+
+def encode_dimension(df, dim, keymap):
+    """Replaces a dimension's natural key with its surrogate, keeping the UUID as an attribute.
+
+    Tables that already carry surrogates are returned unchanged.
+    """
+    key = DIM_KEYS[dim]
+    natural = natural_key_column(key)
+    if natural in df.columns:
+        return df
+    df = df[df[key].notna()].rename(columns={key: natural})
+    df.insert(0, key, keymap.encode(df[natural]))
+    return df
+
+
+def encode_fact(df, keymaps, assign_new=False):
+    """Rewrites the fact's foreign keys to surrogates; integer keys are left as they are.
+
+    A key with no dimension row becomes UNKNOWN_KEY and keeps its natural key in
+    `<name>_uuid` (empty for resolved keys), so validation can quarantine the row
+    with the UUID it arrived with.
+    """
+    df = df.copy()
+    for dim, key in DIM_KEYS.items():
+        natural = natural_key_column(key)
+        if not pd.api.types.is_integer_dtype(df[key]):
+            encoded = keymaps[dim].encode(df[key], assign_new)
+            df[natural] = df[key].astype(object).where(encoded == UNKNOWN_KEY, None)
+            df[key] = encoded
+        elif natural not in df.columns:
+            df[natural] = None
+    return df
@@ -0,0 +1,58 @@
+import os
+import shutil
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# The etl modules read their settings when imported, so the tests point them at a
+# scratch copy of the staged files (served by the embedded DuckDB backend) up front
+DATA_DIR = tempfile.mkdtemp(prefix="etl_tests_")
+os.environ.update(db_backend="duckdb", data_dir=DATA_DIR, query_engine="sql", distinct_mode="exact", kpi_source="sql")
+
+# MySQL tests only ever run against a scratch schema
+if os.getenv("test_database"):
+    os.environ["database"] = os.environ["test_database"]
+
+
+def _stage_test_data():
+    """Copies the shipped staged files, with a few edge cases added to the fact table.
+
+    The shipped visits already reference patients missing from patient_dim. On top of
+    that, three patients get only NULL bills, and two patients get one equal bill each
+    so rankings have ties to break.
+    """
+    for name in os.listdir(os.path.join(ROOT, "Data")):
+        if name.startswith("cleaned_") and name.endswith(".csv"):
+            shutil.copy(os.path.join(ROOT, "Data", name), DATA_DIR)
+
+    path = os.path.join(DATA_DIR, "cleaned_hospital_visits_fact.csv")
+    fact = pd.read_csv(path)
+    patients = set(pd.read_csv(os.path.join(DATA_DIR, "cleaned_patient_dim.csv"))["patient_id"])
+    visits = fact["patient_id"].value_counts()
+    single = [patient for patient in visits[visits == 1].index if patient in patients]
+
+    fact.loc[fact["patient_id"].isin(single[:3]), "total_bill"] = np.nan
+    fact.loc[fact["patient_id"].isin(single[3:5]), "total_bill"] = 54321.0
+    fact.to_csv(path, index=False)
+
+
+_stage_test_data()
+
+
+@pytest.fixture(scope="session")
+def data_dir():
+    return DATA_DIR
+
+
+@pytest.fixture
+def mysql_database():
+    """Skips the test unless `test_database` names a scratch MySQL schema to run it in."""
+    if not os.getenv("test_database"):
+        pytest.skip("set test_database to a scratch MySQL schema to run the MySQL tests")
+    return os.environ["test_database"]
@@ -0,0 +1,42 @@
+import pandas as pd
+import pytest
+
+from etl.bulk_load import BULK_LOAD_METHODS, bulk_load
+from etl.db import get_connection
+
+TABLE = "bulk_load_test"
+
+
+def _stored():
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT id, name, score FROM {TABLE} ORDER BY id")
+            return cursor.fetchall()
+
+
+@pytest.fixture
+def table(mysql_database):
+    def drop():
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {TABLE}")
+
+    drop()
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"CREATE TABLE {TABLE} (id INT PRIMARY KEY, name VARCHAR(20), score INT)")
+    yield TABLE
+    drop()
+
+
+@pytest.mark.parametrize("method", BULK_LOAD_METHODS)
+def test_upsert_updates_existing_rows_in_place(table, method):
+    bulk_load(pd.DataFrame({"id": [1, 2], "name": ["a", "b"], "score": [10, 20]}), table, method=method)
+    bulk_load(pd.DataFrame({"id": [2, 3], "name": ["B", "c"], "score": [None, 30]}), table,
+              batch_size=1, method=method, upsert=True)
+
+    assert _stored() == [
+        {"id": 1, "name": "a", "score": 10},
+        {"id": 2, "name": "B", "score": None},
+        {"id": 3, "name": "c", "score": 30},
+    ]
@@ -0,0 +1,60 @@
+import os
+
+import pandas as pd
+
+from etl import clean
+from etl.benchmark import generate_source
+from etl.clean import TABLES, _prepare_chunk, compute_fill_values
+from etl.staging import read_staging
+from etl.state import EtlState, state_path
+from etl.surrogate_keys import load_keymaps, natural_key_column
+
+
+def test_an_entirely_missing_mode_column_stays_null(tmp_path):
+    source = tmp_path / "source.csv"
+    pd.DataFrame({
+        "visit_date": ["2021-01-01", "2021-01-02", "2021-01-03"],
+        "alcohol_consumption": [None, None, None],
+        "exercise_frequency": ["Daily", None, "Daily"],
+    }).to_csv(source, index=False)
+
+    fill_values, missing = compute_fill_values(source)
+    chunk, _ = _prepare_chunk(pd.read_csv(source), fill_values, watermark=None)
+
+    assert fill_values == {"alcohol_consumption": None, "exercise_frequency": "Daily"}
+    assert missing["alcohol_consumption"] == 3
+    assert chunk["alcohol_consumption"].isna().all()
+    assert chunk["exercise_frequency"].tolist() == ["Daily"] * 3
+
+
+def _clean(clean, source, tmp_path, *args):
+    out = tmp_path / clean.__name__
+    out.mkdir()
+    state = EtlState(state_path(out))
+    keymaps = load_keymaps(out)
+    fill_values, _ = compute_fill_values(source)
+    try:
+        missing, _, rows = clean(source, out, 500, "csv", fill_values, None, state, keymaps, *args)
+    finally:
+        state.close()
+    tables = {name: read_staging(name, fmt="csv", data_dir=out) for name in TABLES}
+    return missing, rows, tables
+
+
+def test_parallel_clean_matches_the_serial_pass(tmp_path, monkeypatch):
+    source = tmp_path / "source.csv"
+    generate_source(3_000, source)
+    rows = pd.read_csv(source)
+    rows.loc[:99, "location"] = None  # Missing in rows that are also duplicated
+    pd.concat([rows, rows.head(200)]).to_csv(source, index=False)  # Full duplicate rows
+    monkeypatch.setattr(clean, "PARTITION_BYTES", os.path.getsize(source) // 5)
+
+    serial_missing, serial_rows, serial = _clean(clean._clean_serial, source, tmp_path)
+    parallel_missing, parallel_rows, parallel = _clean(clean._clean_parallel, source, tmp_path, 2)
+
+    assert parallel_rows == serial_rows == 3_000
+    assert parallel_missing.to_dict() == serial_missing.to_dict()
+    assert serial_missing["location"] == 100
+    for name, spec in TABLES.items():
+        key = natural_key_column(spec["key"]) if spec["key"] else "visit_id"
+        assert sorted(parallel[name][key]) == sorted(serial[name][key])
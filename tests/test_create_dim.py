@@ -0,0 +1,68 @@
+import re
+
+import pytest
+
+from etl.create_dim import DIM_TABLES, create_dim_table, migrate_surrogate_keys
+from etl.db import get_connection
+from etl.partitions import FACT_TABLE
+from etl.surrogate_keys import UNKNOWN_KEY, KeyMap
+
+TABLES = ["hospital_visits_fact", "disease_analytics_data_mart", "doctor_performance_data_mart",
+          "financial_data_mart", "patient_data_mart", "distinct_sketches",
+          "patient_dim", "disease_dim", "doctor_dim", "hospital_dim", "billing_dim"]
+
+
+def _execute(*statements):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
+            return cursor.fetchall()
+
+
+@pytest.fixture
+def legacy_warehouse(mysql_database):
+    """Dimensions and fact as loaded before integer surrogate keys, with UUID keys."""
+    def drop():
+        _execute(*(f"DROP TABLE IF EXISTS {table}" for table in TABLES))
+
+    drop()
+    # The current DDL with the UUID in the key column and no <name>_uuid column
+    statements = [
+        re.sub(r"\n\s*\w+_uuid VARCHAR.*|,\s*UNIQUE KEY.*", "", ddl).replace("INT NOT NULL PRIMARY KEY", "VARCHAR(50) PRIMARY KEY")
+        for ddl in DIM_TABLES.values()
+    ]
+    statements += [
+        "INSERT INTO patient_dim (patient_id, gender, age) VALUES ('p-a', 'Female', 30), ('p-b', 'Male', 60)",
+        f"""CREATE TABLE {FACT_TABLE} (
+            visit_id VARCHAR(50) PRIMARY KEY, patient_id VARCHAR(50), disease_id VARCHAR(50),
+            billing_id VARCHAR(50), visit_date DATE, hospital_id VARCHAR(50), doctor_id VARCHAR(50),
+            total_bill DECIMAL(10, 2),
+            FOREIGN KEY (patient_id) REFERENCES patient_dim (patient_id)
+        )""",
+        f"INSERT INTO {FACT_TABLE} (visit_id, patient_id) VALUES ('v1', 'p-b'), ('v2', 'p-a'), ('v3', NULL)",
+    ]
+    _execute(*statements)
+    yield
+    drop()
+
+
+def test_loading_into_a_legacy_table_fails_with_the_migration_hint(legacy_warehouse):
+    with pytest.raises(ValueError, match="--migrate-keys"):
+        create_dim_table("patient_dim")
+
+
+def test_migration_rewrites_uuid_keys_to_surrogates(legacy_warehouse):
+    migrated = migrate_surrogate_keys()
+
+    assert ("patient_dim", "patient_id") in migrated and (FACT_TABLE, "patient_id") in migrated
+    patients = {row["patient_uuid"]: row["patient_id"]
+                for row in _execute("SELECT patient_id, patient_uuid FROM patient_dim")}
+    assert len(set(patients.values())) == 2 and UNKNOWN_KEY not in patients.values()
+    visits = {row["visit_id"]: row["patient_id"]
+              for row in _execute(f"SELECT visit_id, patient_id FROM {FACT_TABLE}")}
+    assert visits == {"v1": patients["p-b"], "v2": patients["p-a"], "v3": None}
+    # Later loads assign the same surrogates
+    assert KeyMap("patient_dim").encode(["p-a", "p-b"]).tolist() == [patients["p-a"], patients["p-b"]]
+    assert KeyMap("patient_dim").encode(["p-c"], assign_new=False).tolist() == [UNKNOWN_KEY]
+    assert migrate_surrogate_keys() == []
@@ -0,0 +1,70 @@
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from etl.create_fact import create_fact_table, upsert_fact_chunk
+from etl.db import get_connection
+from etl.partitions import FACT_TABLE, add_visit_month, list_partitions
+
+
+def _visits(*rows):
+    """Fact rows from (visit_id, visit_date, total_bill) tuples."""
+    df = pd.DataFrame(rows, columns=["visit_id", "visit_date", "total_bill"])
+    df = df.assign(patient_id=1, disease_id=1, billing_id=1, hospital_id=1, doctor_id=1)
+    return add_visit_month(df)
+
+
+def _stored(visit_id):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SELECT visit_month, total_bill FROM {FACT_TABLE} WHERE visit_id = %s", (visit_id,))
+            return cursor.fetchall()
+
+
+@pytest.fixture
+def fact_table(mysql_database):
+    def drop():
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(f"DROP TABLE IF EXISTS {FACT_TABLE}")
+
+    drop()
+    yield FACT_TABLE
+    drop()
+
+
+def test_upsert_moves_a_resent_visit_to_its_new_month(fact_table):
+    create_fact_table()
+    upsert_fact_chunk(_visits(("v1", "2021-03-10", 100.0), ("v2", "2021-03-11", 50.0)), fact_table)
+    upsert_fact_chunk(_visits(("v1", "2021-05-02", 250.0)), fact_table)
+
+    assert _stored("v1") == [{"visit_month": 202105, "total_bill": Decimal("250.00")}]
+    assert _stored("v2") == [{"visit_month": 202103, "total_bill": Decimal("50.00")}]
+
+
+def test_upsert_keeps_the_last_copy_of_a_visit_sent_twice_in_one_chunk(fact_table):
+    create_fact_table()
+    upsert_fact_chunk(_visits(("v1", "2021-03-10", 100.0), ("v1", "2021-04-01", 120.0)), fact_table)
+
+    assert _stored("v1") == [{"visit_month": 202104, "total_bill": Decimal("120.00")}]
+
+
+def test_create_fact_table_migrates_an_unpartitioned_table(fact_table):
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            # The fact table as loaders before monthly partitioning created it
+            cursor.execute(f"""
+                CREATE TABLE {FACT_TABLE} (
+                    visit_id VARCHAR(50) PRIMARY KEY, patient_id INT, disease_id INT, billing_id INT,
+                    visit_date DATE, hospital_id INT, doctor_id INT, total_bill DECIMAL(10, 2)
+                )
+            """)
+            cursor.execute(f"INSERT INTO {FACT_TABLE} VALUES ('v1', 1, 1, 1, '2021-03-10', 1, 1, 100.00)")
+
+    create_fact_table()
+
+    with get_connection() as conn:
+        with conn.cursor() as cursor:
+            assert list_partitions(cursor, FACT_TABLE)
+    assert _stored("v1") == [{"visit_month": 202103, "total_bill": Decimal("100.00")}]
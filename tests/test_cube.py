@@ -0,0 +1,111 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl import cube, engine, kpi
+from etl.benchmark import generate_source
+from etl.clean import run_clean
+from etl.state import advance_watermark, merge_delta
+
+
+@pytest.fixture(scope="module")
+def built_cube():
+    cube.run_cube_build()
+    return cube.get_cube()
+
+
+def _by(df, column, value):
+    return df.set_index(column)[value].astype(float).round(4).sort_index()
+
+
+def test_stored_cuboids_are_much_smaller_than_the_fact_table(built_cube):
+    visits = engine.get_star_schema().n_visits
+    assert all(len(cuboid["cells"]) < visits / 2 for cuboid in built_cube["cuboids"].values())
+    assert all(len(dims) <= cube.CUBE_DEPTH for dims in built_cube["cuboids"])
+
+
+def test_roll_ups_match_the_engine(built_cube):
+    hospitals = cube.query_cube(["hospital"])
+    expected = engine.get_hospital_revenue()
+    assert _by(hospitals, "hospital", "revenue").to_dict() == _by(expected, "hospital_name", "revenue").to_dict()
+
+    trend = cube.query_cube(["month"])
+    expected = engine.get_hospital_visits_trend()
+    assert _by(trend, "month", "visits").to_dict() == _by(expected, "month", "total_visits").to_dict()
+
+
+def test_slices_and_drill_downs_add_up(built_cube):
+    female = cube.query_cube(["hospital"], {"gender": "Female"})
+    drilled = cube.query_cube(["hospital", "gender"])
+    expected = drilled[drilled["gender"] == "Female"]
+    assert _by(female, "hospital", "revenue").to_dict() == _by(expected, "hospital", "revenue").to_dict()
+
+    # Three dimensions are beyond the stored lattice and built on demand
+    deep = cube.query_cube(["hospital", "gender", "month"])
+    rolled = deep.groupby(["hospital", "gender"], dropna=False, as_index=False)[["revenue", "visits"]].sum()
+    merged = drilled.merge(rolled, on=["hospital", "gender"], suffixes=("", "_deep"))
+    assert len(merged) == len(drilled)
+    assert np.allclose(merged["revenue"], merged["revenue_deep"])
+    assert (merged["visits"] == merged["visits_deep"]).all()
+
+
+def test_distinct_patients_are_estimated_from_sketches(built_cube):
+    schema = engine.get_star_schema()
+    codes, _ = schema.fact_codes["patient_id"]
+    exact = len(np.unique(codes[codes >= 0]))
+    estimate = int(cube.query_cube()["patients"][0])
+    assert abs(estimate - exact) <= 0.1 * exact
+
+    genders, labels = schema.attribute("patient_dim", "gender")
+    by_gender = cube.query_cube(["gender"]).set_index("gender")["patients"]
+    for code, gender in enumerate(labels):
+        exact = len(np.unique(codes[(genders == code) & (codes >= 0)]))
+        assert abs(by_gender[gender] - exact) <= 0.1 * exact
+
+
+def test_unknown_dimensions_are_rejected(built_cube):
+    with pytest.raises(ValueError):
+        cube.query_cube(["ward"])
+
+
+CUBE_KPIS = ["get_total_revenue", "get_total_visits", "get_avg_revenue_per_visit", "get_visits_by_gender",
+             "get_visits_by_age_group", "get_revenue_by_insurance_type", "get_hospital_visits_trend"]
+
+
+def _sorted(result):
+    if not isinstance(result, pd.DataFrame):
+        return None if result is None or pd.isna(result) else round(float(result), 4)
+    df = result.astype({col: float for col in result.columns[1:]}).round(4).astype(object)
+    return df.where(df.notna(), None).sort_values(list(df.columns[:1]), key=lambda s: s.astype(str),
+                                                  ignore_index=True).to_dict("records")
+
+
+@pytest.mark.parametrize("getter", CUBE_KPIS)
+def test_unfiltered_kpis_are_answered_from_the_cube(built_cube, getter, monkeypatch):
+    sql = getattr(kpi, getter).uncached()
+    calls = []
+    query_cube = cube.query_cube
+    monkeypatch.setattr(cube, "query_cube", lambda *args: calls.append(args) or query_cube(*args))
+    monkeypatch.setattr(kpi, "KPI_SOURCE", "cube")
+
+    assert _sorted(getattr(kpi, getter).uncached()) == _sorted(sql)
+    assert calls
+
+
+@pytest.mark.parametrize("first_run", ["full", "incremental"])
+def test_a_cube_rebuilt_after_an_incremental_run_has_the_new_visits(tmp_path, first_run):
+    source = tmp_path / "source.csv"
+    generate_source(2_000, source)
+    visits = pd.read_csv(source)
+    history = tmp_path / "history.csv"
+    visits[visits["visit_date"] < "2024-01-01"].to_csv(history, index=False)
+
+    run_clean(history, tmp_path, incremental=first_run == "incremental", workers=1)
+    merge_delta(tmp_path)  # No-op after a full run: its clean wrote no delta
+    advance_watermark(tmp_path)
+    run_clean(source, tmp_path, incremental=True, workers=1)
+    merge_delta(tmp_path)
+
+    total = cube.build_cube(engine.load_star_schema(tmp_path))["cuboids"][()]
+    assert total["visits"].sum() == len(visits)
+    assert total["revenue"].sum() == pytest.approx(visits["total_bill_x"].sum())
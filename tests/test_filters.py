@@ -0,0 +1,156 @@
+import dataclasses
+import datetime
+
+import pandas as pd
+import pytest
+
+from etl import aggregation, datamarts, engine, kpi
+from etl.datamarts import MART_AGGREGATES, MATERIALIZED_MARTS
+from etl.filters import QueryFilters, compile_filters
+
+# Every getter that takes `filters`, with its SQL module
+GETTERS = {
+    **{name: kpi for name in [
+        "get_total_revenue", "get_revenue_by_disease", "get_revenue_by_doctor", "get_revenue_by_hospital",
+        "get_total_visits", "get_avg_revenue_per_visit", "get_revenue_per_patient", "get_visits_by_gender",
+        "get_visits_by_age_group", "get_claim_status_breakdown", "get_revenue_by_insurance_type",
+        "get_hospital_visits_trend", "get_kpi_snapshot",
+    ]},
+    **{name: aggregation for name in [
+        "get_patient_statistics", "get_financial_metrics", "get_hospital_revenue", "get_patients_per_doctor",
+        "get_disease_category_counts",
+    ]},
+    **{name: datamarts for name in [
+        "get_patient_data_mart", "get_financial_data_mart", "get_doctor_data_mart", "get_disease_data_mart",
+    ]},
+}
+
+# Mart table -> engine getter of the same mart
+MART_GETTERS = {
+    "patient_data_mart": engine.get_patient_data_mart,
+    "financial_data_mart": engine.get_financial_data_mart,
+    "doctor_performance_data_mart": engine.get_doctor_data_mart,
+    "disease_analytics_data_mart": engine.get_disease_data_mart,
+}
+
+
+def _members(dim, column, step=2):
+    return tuple(sorted(engine.get_star_schema().dims[dim][column].dropna().unique())[::step])
+
+
+def _slices():
+    return {
+        "dates": QueryFilters(datetime.date(2021, 1, 1), datetime.date(2021, 12, 31)),
+        "open_start": QueryFilters(end_date=datetime.date(2022, 3, 15)),
+        "hospitals": QueryFilters(hospital_ids=_members("hospital_dim", "hospital_id", step=3)),
+        "categories": QueryFilters(disease_categories=("Chronic", "Infectious")),
+        "insurance": QueryFilters(insurance_types=("Medicare",)),
+        # Every filter at once: the bound parameters must follow the placeholders
+        "merged": QueryFilters(
+            datetime.date(2020, 6, 1), datetime.date(2023, 6, 30),
+            hospital_ids=_members("hospital_dim", "hospital_id"),
+            doctor_ids=_members("doctor_dim", "doctor_id"),
+            disease_categories=("Chronic", "Infectious"),
+            insurance_types=("Medicare", "Private"),
+        ),
+    }
+
+
+SLICES = list(_slices())
+
+
+def _comparable(result):
+    """A getter's result with row order, numeric types and NULL/NaN made comparable."""
+    if dataclasses.is_dataclass(result):
+        return {field: _comparable(value) for field, value in dataclasses.asdict(result).items()}
+    if not isinstance(result, pd.DataFrame):
+        return None if result is None or pd.isna(result) else round(float(result), 4)
+    df = result.copy()
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            values = pd.to_numeric(df[col]).astype(float).round(4)
+            df[col] = values.astype(object).where(values.notna(), None)
+        else:
+            df[col] = df[col].astype(object).where(df[col].notna(), None).astype(str)
+    return df.sort_values(list(df.columns), ignore_index=True).to_dict("records")
+
+
+def _engine_mart(name, filters):
+    key_columns = MATERIALIZED_MARTS[name]["primary_key"]
+    return MART_GETTERS[name](filters=filters).sort_values(key_columns, ignore_index=True)
+
+
+@pytest.mark.parametrize("slice_name", SLICES)
+def test_slices_select_some_but_not_all_visits(slice_name):
+    schema = engine.get_star_schema()
+    assert 0 < schema.select(_slices()[slice_name]).n_visits < schema.n_visits
+
+
+@pytest.mark.parametrize("slice_name", SLICES)
+@pytest.mark.parametrize("getter", list(GETTERS))
+def test_sql_and_engine_agree_on_a_slice(getter, slice_name):
+    filters = _slices()[slice_name]
+    sql = getattr(GETTERS[getter], getter)(filters=filters)
+    in_memory = getattr(engine, getter)(filters=filters)
+    assert _comparable(sql) == _comparable(in_memory)
+
+
+def test_merged_filters_bind_parameters_in_placeholder_order():
+    filters = _slices()["merged"]
+    where, params = compile_filters(filters, alias="hvf")
+
+    assert where.count("%s") == len(params)
+    assert params == [
+        202006, filters.start_date, 202306, filters.end_date,
+        *filters.hospital_ids, *filters.doctor_ids, *filters.disease_categories, *filters.insurance_types,
+    ]
+
+
+@pytest.mark.parametrize("slice_name", SLICES)
+@pytest.mark.parametrize("mart", list(MATERIALIZED_MARTS))
+def test_mart_row_count_of_a_slice(mart, slice_name):
+    filters = _slices()[slice_name]
+    assert datamarts.get_mart_row_count(mart, filters=filters) == len(_engine_mart(mart, filters))
+    assert engine.get_mart_row_count(mart, filters=filters) == len(_engine_mart(mart, filters))
+
+
+@pytest.mark.parametrize("slice_name", SLICES)
+@pytest.mark.parametrize("aggregate", list(MART_AGGREGATES))
+def test_mart_aggregate_of_a_slice(aggregate, slice_name):
+    filters = _slices()[slice_name]
+    sql = datamarts.get_mart_aggregate(aggregate, filters=filters)
+    assert _comparable(sql) == _comparable(engine.get_mart_aggregate(aggregate, filters=filters))
+
+
+def _pages(get_mart_page, mart, limit, filters):
+    pages, after = [], None
+    while True:
+        rows, after = get_mart_page(mart, after=after, limit=limit, filters=filters)
+        pages.append(rows)
+        if after is None:
+            return pages
+
+
+@pytest.mark.parametrize("slice_name", ["hospitals", "merged"])
+@pytest.mark.parametrize("mart", list(MATERIALIZED_MARTS))
+def test_mart_pages_of_a_slice(mart, slice_name):
+    # Keyset parameters follow the slice's parameters in the paged query
+    filters = _slices()[slice_name]
+    key_columns = MATERIALIZED_MARTS[mart]["primary_key"]
+    expected = _engine_mart(mart, filters)[key_columns]
+    limit = max(len(expected) // 4, 1)
+
+    for get_mart_page in (datamarts.get_mart_page, engine.get_mart_page):
+        pages = _pages(get_mart_page, mart, limit, filters)
+        assert len(pages) > 2
+        keys = pd.concat(pages)[key_columns]
+        assert keys.astype(str).values.tolist() == expected.astype(str).values.tolist()
+
+
+def test_total_revenue_of_visits_without_bills_is_null(monkeypatch):
+    schema = engine.get_star_schema()
+    unbilled = schema._subset(~schema.bill_present)
+    monkeypatch.setattr(engine, "_schema", lambda filters=None: unbilled)
+
+    assert unbilled.n_visits > 0
+    assert engine.get_total_revenue() is None
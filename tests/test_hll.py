@@ -0,0 +1,43 @@
+import pandas as pd
+
+from etl import hll
+
+PATIENTS = pd.DataFrame({"patient_id": [1, 2, 3, 4], "gender": ["Female", "Male", "Female", None],
+                         "age": [12, 40, 70, None]})
+
+
+def _visits():
+    return pd.DataFrame({
+        "visit_id": ["v1", "v2", "v3", "v4"], "patient_id": [1, 1, 2, 9],
+        "doctor_id": [7, 7, 8, 8], "visit_date": ["2021-01-05", "2021-02-01", "2021-02-03", "2021-02-04"],
+    })
+
+
+def _registers(builder):
+    return {name: {group: sketch.registers.tobytes() for group, sketch in groups.items()}
+            for name, groups in builder.sketches.items()}
+
+
+def test_only_the_chunks_patients_are_looked_up(monkeypatch):
+    requested = []
+
+    def run_query(query, params=None, name=None, backend=None):
+        requested.extend(params)
+        return PATIENTS[PATIENTS["patient_id"].isin(params)]
+
+    monkeypatch.setattr(hll, "run_query", run_query)
+    builder = hll.DistinctSketchBuilder(precision=6)
+    builder.add(_visits())
+
+    assert sorted(requested) == [1, 2, 9]
+
+    # Same sketches as from visits with the labels joined in SQL (rebuild_distinct_sketches)
+    joined = _visits().merge(PATIENTS, on="patient_id", how="left")
+    joined["has_patient"] = joined["patient_id"].isin(PATIENTS["patient_id"])
+    expected = hll.DistinctSketchBuilder(precision=6)
+    expected.add(joined)
+    assert _registers(builder) == _registers(expected)
+    # Patient 9 has no patient_dim row: dropped from the patient groupings, as by the inner join
+    assert set(builder.sketches["visits_by_age_group"]) == {"0-18", "36-60"}
+    assert set(builder.sketches["visits_by_gender"]) == {"Female", "Male"}
+    assert builder.sketches["total_visits"]["all"].count() == 4
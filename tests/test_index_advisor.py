@@ -0,0 +1,24 @@
+import pandas as pd
+
+from etl import index_advisor
+
+
+def test_the_before_and_after_report_is_written(monkeypatch, tmp_path):
+    latencies = iter([{"q1": 40.0, "q2": 10.0}, {"q1": 8.0, "q2": 10.0}])
+
+    def profile_queries(queries):
+        latency = next(latencies)
+        return pd.DataFrame({"query": list(latency), "full_scans": "", "latency_ms": list(latency.values())}
+                            ).set_index("query")
+
+    monkeypatch.setattr(index_advisor, "registered_queries", lambda: {"q1": "SELECT 1", "q2": "SELECT 2"})
+    monkeypatch.setattr(index_advisor, "profile_queries", profile_queries)
+    monkeypatch.setattr(index_advisor, "create_recommended_indexes", lambda: ["ix_fact_doctor_bill"])
+    path = tmp_path / "report.csv"
+
+    index_advisor.optimize_schema(path)
+
+    saved = pd.read_csv(path, index_col="query")
+    assert saved.loc["q1", "speedup"] == 5.0
+    assert saved.loc["q2", "latency_ms_after"] == 10.0
+    assert (saved["indexes_created"] == "ix_fact_doctor_bill").all()
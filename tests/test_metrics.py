@@ -0,0 +1,37 @@
+import pandas as pd
+import pytest
+
+from etl import create_fact, metrics
+
+
+@pytest.fixture(autouse=True)
+def clean_metrics():
+    metrics.reset_metrics()
+    yield
+    metrics.reset_metrics()
+
+
+def test_reset_query_stats_keeps_the_etl_series():
+    metrics.record_query("kpi", "SELECT 1", None, "duckdb", 0.01, pd.DataFrame({"x": [1]}))
+    metrics.increment("etl_rows_loaded_total", 10, table="hospital_visits_fact")
+    metrics.record_error("load", ValueError("boom"))
+
+    metrics.reset_query_stats()
+
+    assert metrics.get_query_stats().empty
+    rendered = metrics.render_metrics()
+    assert 'etl_rows_loaded_total{table="hospital_visits_fact"} 10' in rendered
+    assert "etl_errors_total" in rendered
+
+
+def test_a_failed_fact_load_is_recorded_once(monkeypatch):
+    def unreachable():
+        raise ConnectionError("MySQL is down")
+
+    monkeypatch.setattr(create_fact, "load_key_indexes", unreachable)
+    with pytest.raises(ConnectionError):
+        with metrics.timed_stage("fact"):
+            create_fact.push_to_mysql(iter([]), "hospital_visits_fact")
+
+    errors = [line for line in metrics.render_metrics().splitlines() if line.startswith("etl_errors_total")]
+    assert errors == ['etl_errors_total{component="fact",error="ConnectionError"} 1']
@@ -0,0 +1,19 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl.staging import StagingWriter, read_staging
+
+pytest.importorskip("pyarrow")
+
+
+def test_parquet_accepts_a_column_that_turns_fractional_or_missing(tmp_path):
+    writer = StagingWriter("patient_dim", "parquet", tmp_path)
+    writer.write(pd.DataFrame({"patient_id": [1, 2], "age": [30, 41], "gender": ["Female", "Male"]}))
+    writer.write(pd.DataFrame({"patient_id": [3, 4], "age": [np.nan, 52.5], "gender": ["Male", None]}))
+    writer.close()
+
+    staged = read_staging("patient_dim", fmt="parquet", data_dir=tmp_path)
+    assert staged["patient_id"].dtype == np.int64  # Surrogate keys stay integers
+    assert staged["age"].tolist()[:2] == [30.0, 41.0]
+    assert np.isnan(staged["age"][2]) and staged["age"][3] == 52.5
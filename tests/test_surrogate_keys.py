@@ -0,0 +1,21 @@
+import pandas as pd
+
+from etl.surrogate_keys import UNKNOWN_KEY, KeyMap, legacy_keymap_path
+
+
+def test_saved_keys_survive_a_reload(tmp_path):
+    keymap = KeyMap("patient_dim", tmp_path)
+    assert keymap.encode(["a", None, "b", "a"]).tolist() == [1, UNKNOWN_KEY, 2, 1]
+    keymap.save()
+
+    reloaded = KeyMap("patient_dim", tmp_path)
+    assert reloaded.encode(["c", "b"]).tolist() == [3, 2]
+    assert reloaded.encode(["d"], assign_new=False).tolist() == [UNKNOWN_KEY]
+
+
+def test_a_legacy_csv_mapping_is_imported(tmp_path):
+    pd.DataFrame({"uuid": ["x", "y"], "key": [7, 3]}).to_csv(legacy_keymap_path("doctor_dim", tmp_path), index=False)
+
+    keymap = KeyMap("doctor_dim", tmp_path)
+
+    assert keymap.encode(["y", "z", "x"]).tolist() == [3, 8, 7]
@@ -0,0 +1,73 @@
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from etl import engine, kpi
+from etl.filters import QueryFilters
+
+
+def _ranking(df, metric):
+    """Key, label and ranked value per row, with NULL/NaN and numeric types made comparable."""
+    values = pd.to_numeric(df[metric]).astype(float).round(4)
+    values = values.astype(object).where(values.notna(), None)
+    labels = df.iloc[:, 1].astype(object).where(df.iloc[:, 1].notna(), None)
+    return list(zip(df.iloc[:, 0].tolist(), labels.tolist(), values.tolist()))
+
+
+@pytest.mark.parametrize("k", [1, 7, 15, 100_000])
+@pytest.mark.parametrize("descending", [True, False])
+@pytest.mark.parametrize("metric", list(kpi.TOP_K_METRICS))
+@pytest.mark.parametrize("dimension", list(kpi.TOP_K_DIMENSIONS))
+def test_sql_and_engine_rank_the_same_members(dimension, metric, descending, k):
+    sql = kpi.get_top_k(dimension, metric, k, descending)
+    in_memory = engine.get_top_k(dimension, metric, k, descending)
+    assert _ranking(sql, metric) == _ranking(in_memory, metric)
+
+
+@pytest.mark.parametrize("dimension", list(kpi.TOP_K_DIMENSIONS))
+def test_sql_and_engine_rank_the_same_members_of_a_slice(dimension):
+    filters = QueryFilters(datetime.date(2021, 1, 1), datetime.date(2022, 6, 30))
+    sql = kpi.get_top_k(dimension, "revenue", 10, filters=filters)
+    in_memory = engine.get_top_k(dimension, "revenue", 10, filters=filters)
+    assert _ranking(sql, "revenue") == _ranking(in_memory, "revenue")
+
+
+@pytest.mark.parametrize("dimension", list(kpi.TOP_K_DIMENSIONS))
+def test_ranks_only_members_of_the_dimension(dimension):
+    key, table, label = kpi.TOP_K_DIMENSIONS[dimension]
+    top = kpi.get_top_k(dimension, "revenue", 100_000)
+    members = set(engine.get_star_schema().dims[table][key])
+    assert set(top[key]) <= members
+    assert top[label].notna().all()
+
+
+def test_members_without_a_billed_visit_rank_last_both_ways():
+    for descending in (True, False):
+        top = kpi.get_top_k("patient", "revenue", 100_000, descending)
+        unbilled = top["revenue"].isna().to_numpy()
+        assert unbilled.any()
+        assert not np.any(unbilled[:-1] & ~unbilled[1:])  # no billed member after an unbilled one
+
+
+def test_ties_are_broken_by_key():
+    top = kpi.get_top_k("patient", "revenue", 100_000)
+    tied = top[top["revenue"] == 54321.0]
+    assert len(tied) == 2
+    assert tied["patient_id"].tolist() == sorted(tied["patient_id"])
+
+
+def test_revenue_per_patient_keeps_namesakes_apart():
+    df = kpi.get_revenue_per_patient()
+    assert len(df) == kpi.TOP_K
+    assert df["name"].notna().all()
+    assert df["patient_id"].is_unique
+    assert df["revenue_per_patient"].is_monotonic_decreasing
+
+
+def test_unknown_dimension_or_metric_is_rejected():
+    with pytest.raises(ValueError):
+        kpi.get_top_k("nurse")
+    with pytest.raises(ValueError):
+        kpi.get_top_k("doctor", "median_bill")
@@ -0,0 +1,57 @@
+import pandas as pd
+
+from etl.surrogate_keys import DIM_KEYS, UNKNOWN_KEY, encode_fact, load_keymaps
+from etl.validate import UNRESOLVED_KEY_COLUMNS, KeyIndex, validate_fact_chunks
+
+
+def _keymaps(tmp_path):
+    """Key maps knowing one member of every dimension, "<dim>-1" -> 1."""
+    keymaps = load_keymaps(tmp_path)
+    for dim, keymap in keymaps.items():
+        keymap.encode([f"{dim}-1"])
+    return keymaps
+
+
+def _fact(*patients):
+    df = pd.DataFrame({"visit_id": [f"v{i}" for i in range(len(patients))], "patient_id": list(patients)})
+    for dim, key in DIM_KEYS.items():
+        if key != "patient_id":
+            df[key] = f"{dim}-1"
+    return df
+
+
+def _indexes():
+    return {key: KeyIndex([1]) for key in DIM_KEYS.values()}
+
+
+def test_unknown_fact_keys_are_not_assigned_surrogates(tmp_path):
+    keymaps = _keymaps(tmp_path)
+    encoded = encode_fact(_fact("patient_dim-1", "stranger"), keymaps)
+
+    assert encoded["patient_id"].tolist() == [1, UNKNOWN_KEY]
+    assert encoded["patient_uuid"].tolist() == [None, "stranger"]
+    assert keymaps["patient_dim"].encode(["stranger"], assign_new=False).tolist() == [UNKNOWN_KEY]
+
+
+def test_quarantined_rows_keep_their_natural_key(tmp_path):
+    chunk = encode_fact(_fact("patient_dim-1", "stranger"), _keymaps(tmp_path))
+    quarantine_path = tmp_path / "quarantine.csv"
+
+    valid = list(validate_fact_chunks([chunk], _indexes(), quarantine_path))
+
+    assert valid[0]["visit_id"].tolist() == ["v0"]
+    assert not set(UNRESOLVED_KEY_COLUMNS) & set(valid[0].columns)
+    quarantine = pd.read_csv(quarantine_path)
+    assert quarantine[["visit_id", "patient_uuid", "rejection_reason"]].values.tolist() == [
+        ["v1", "stranger", "unknown patient_id"]
+    ]
+
+
+def test_a_clean_run_clears_the_previous_quarantine(tmp_path):
+    quarantine_path = tmp_path / "quarantine.csv"
+    quarantine_path.write_text("visit_id,rejection_reason\nold,unknown patient_id\n")
+    chunk = encode_fact(_fact("patient_dim-1"), _keymaps(tmp_path))
+
+    list(validate_fact_chunks([chunk], _indexes(), quarantine_path))
+
+    assert not quarantine_path.exists()